@@ -0,0 +1,259 @@
+"""
+Queued appends for streams with many concurrent writers.
+
+A regular append is a transaction that rewrites the stream document, and a
+single Firestore document sustains only about one write per second, so
+concurrent appenders to a hot stream keep aborting each other. Queued
+appends instead write the drops and one entry per drop to the stream's
+`append_queue` subcollection; no shared document is touched.
+
+A sequencer then links the queued drops into the chain, APPEND_BATCH_SIZE
+at a time, with one transaction (and one stream document write) per batch.
+There is at most one sequencer per stream across all workers and instances:
+it holds a lease in the `append_leases` collection, renewed with every
+batch. The worker that enqueues starts a sequencer if none holds the lease;
+a sweeper thread picks up entries whose sequencer died.
+"""
+import datetime
+import os
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from os import environ
+from typing import Callable, List, Optional
+
+from firebase_admin import firestore
+
+from app.db import db, streams_collection
+from app.logger import app_logger
+
+APPEND_BATCH_SIZE = int(environ.get("APPEND_BATCH_SIZE", "100"))
+LEASE_SECONDS = float(environ.get("APPEND_LEASE_SECONDS", "30"))
+SWEEP_INTERVAL_SECONDS = float(environ.get("APPEND_SWEEP_SECONDS", "15"))
+SEQUENCER_THREADS = int(environ.get("APPEND_SEQUENCER_THREADS", "4"))
+
+QUEUE_COLLECTION = "append_queue"
+leases_collection = db.collection("append_leases")
+
+# Window for the throughput figure in the metrics.
+_RATE_WINDOW_SECONDS = 60
+
+
+def queue_collection(stream_id: str):
+    return streams_collection.document(stream_id).collection(QUEUE_COLLECTION)
+
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def entry_id() -> str:
+    """Queue entry IDs sort in enqueue order (ties broken at random)."""
+    return f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}"
+
+
+class AppendSequencer:
+    """
+    Drains append queues. `link_batch(stream_id, entry_refs)` must link the
+    queued entries into the stream in one transaction, delete them, and
+    return the number of drops linked.
+    """
+
+    def __init__(self):
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.link_batch: Optional[Callable[[str, list], int]] = None
+        self._executor = ThreadPoolExecutor(
+            max_workers=SEQUENCER_THREADS, thread_name_prefix="append-sequencer"
+        )
+        self._draining = set()
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._queue_depths = {}
+        self._linked_at = deque()
+        self._lag_seconds = deque(maxlen=1000)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # --- Writers ---
+
+    def enqueue(self, batch, stream_id: str, drops: List[dict]) -> None:
+        """Adds queue entries for `drops` (Drop dicts) to a write batch."""
+        queue = queue_collection(stream_id)
+        now = _now()
+        for drop in drops:
+            batch.set(queue.document(entry_id()), {
+                "stream_id": stream_id,
+                "drop": drop,
+                "enqueued_at": now,
+            })
+        self._count("enqueued", len(drops))
+
+    def notify(self, stream_id: str) -> None:
+        """Makes sure a sequencer is draining the stream's queue."""
+        with self._lock:
+            if stream_id in self._draining:
+                return
+            self._draining.add(stream_id)
+        self._executor.submit(self._drain, stream_id)
+
+    # --- Lease ---
+
+    def _try_lease(self, stream_id: str) -> bool:
+        """Takes or renews the stream's lease unless another owner holds it."""
+        ref = leases_collection.document(stream_id)
+
+        @firestore.transactional
+        def take(transaction):
+            doc = ref.get(transaction=transaction)
+            lease = doc.to_dict() if doc.exists else None
+            now = _now()
+            if lease and lease["owner"] != self.owner and (
+                lease["expires_at"] > now
+            ):
+                return False
+            transaction.set(ref, {
+                "owner": self.owner,
+                "expires_at": now + datetime.timedelta(seconds=LEASE_SECONDS),
+            })
+            return True
+
+        return take(db.transaction())
+
+    def _release(self, stream_id: str) -> None:
+        ref = leases_collection.document(stream_id)
+
+        @firestore.transactional
+        def release(transaction):
+            doc = ref.get(transaction=transaction)
+            if doc.exists and doc.to_dict()["owner"] == self.owner:
+                transaction.delete(ref)
+
+        release(db.transaction())
+
+    # --- Sequencer ---
+
+    def _drain(self, stream_id: str) -> None:
+        queue = queue_collection(stream_id)
+        try:
+            # A cheap plain read first, so writers to a stream that already
+            # has a sequencer don't contend on the lease document.
+            lease = leases_collection.document(stream_id).get()
+            if lease.exists and lease.to_dict()["owner"] != self.owner and (
+                lease.to_dict()["expires_at"] > _now()
+            ):
+                return
+            while self._try_lease(stream_id):
+                entries = list(
+                    queue.order_by("__name__")
+                    .limit(APPEND_BATCH_SIZE)
+                    .stream()
+                )
+                if not entries:
+                    self._release(stream_id)
+                    # Writers that enqueued after the read saw this stream
+                    # as draining and didn't start a sequencer; check again.
+                    if not list(queue.limit(1).stream()):
+                        return
+                    continue
+                depth = queue.count().get()[0][0].value
+                with self._lock:
+                    self._queue_depths[stream_id] = depth
+                linked = self.link_batch(
+                    stream_id, [doc.reference for doc in entries]
+                )
+                self._record_batch(entries, linked)
+        except Exception as e:
+            self._count("errors")
+            app_logger.error(
+                "Append sequencer for stream %s failed: %s",
+                stream_id,
+                e,
+                exc_info=True,
+            )
+        finally:
+            with self._lock:
+                self._draining.discard(stream_id)
+                self._queue_depths.pop(stream_id, None)
+
+    def _record_batch(self, entries, linked: int) -> None:
+        now = _now()
+        with self._lock:
+            self._counts["batches"] += 1
+            self._counts["linked"] += linked
+            for doc in entries:
+                self._lag_seconds.append(
+                    (now - doc.to_dict()["enqueued_at"]).total_seconds()
+                )
+            self._linked_at.append((time.monotonic(), linked))
+
+    def sweep(self) -> int:
+        """
+        Starts sequencers for queues with entries older than a lease, i.e.
+        whose sequencer died or whose writer's notify was lost.
+        """
+        cutoff = _now() - datetime.timedelta(seconds=LEASE_SECONDS)
+        stale = (
+            db.collection_group(QUEUE_COLLECTION)
+            .where("enqueued_at", "<", cutoff)
+            .limit(APPEND_BATCH_SIZE)
+            .stream()
+        )
+        stream_ids = {doc.to_dict()["stream_id"] for doc in stale}
+        for stream_id in stream_ids:
+            self.notify(stream_id)
+        return len(stream_ids)
+
+    def _run(self) -> None:
+        while not self._stop.wait(SWEEP_INTERVAL_SECONDS):
+            try:
+                self.sweep()
+            except Exception as e:
+                app_logger.error(f"Append queue sweep failed: {e}")
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="append-sweeper", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    # --- Metrics ---
+
+    def _count(self, outcome: str, amount: int = 1) -> None:
+        with self._lock:
+            self._counts[outcome] += amount
+
+    def stats(self) -> dict:
+        with self._lock:
+            cutoff = time.monotonic() - _RATE_WINDOW_SECONDS
+            while self._linked_at and self._linked_at[0][0] < cutoff:
+                self._linked_at.popleft()
+            linked_recently = sum(n for _, n in self._linked_at)
+            lags = sorted(self._lag_seconds)
+            counts = dict(self._counts)
+            depths = dict(self._queue_depths)
+        return {
+            **counts,
+            "linked_per_second": round(
+                linked_recently / _RATE_WINDOW_SECONDS, 2
+            ),
+            "avg_batch_size": round(
+                counts.get("linked", 0) / counts["batches"], 1
+            ) if counts.get("batches") else None,
+            "lag_p50_seconds": lags[len(lags) // 2] if lags else None,
+            "lag_max_seconds": lags[-1] if lags else None,
+            "queue_depths": depths,
+        }
+
+
+sequencer = AppendSequencer()
@@ -1,8 +1,12 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from cachetools import TLRUCache
 from clerk import Clerk
 from os import environ
+from typing import Optional
 import logging
+import threading
+import time
 
 # In a real app, use a more secure way to manage secrets.
 clerk_secret_key = environ.get("CLERK_SECRET_KEY")
@@ -19,8 +23,49 @@ else:
     except Exception as e:
         logging.error(f"Failed to initialize Clerk: {e}")
 
+# Users allowed to use the /debug endpoints and request profiling.
+DEBUG_USER_IDS = frozenset(
+    user_id.strip()
+    for user_id in environ.get("DEBUG_USER_IDS", "").split(",")
+    if user_id.strip()
+)
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
 
+# Verified tokens are remembered briefly so that several dependencies in the
+# same request (auth, rate limiting) don't verify the same token repeatedly.
+# An entry expires after VERIFIED_TOKEN_SECONDS or at the token's `exp`,
+# whichever comes first, so caching never extends a token's life.
+VERIFIED_TOKEN_SECONDS = float(environ.get("AUTH_TOKEN_CACHE_SECONDS", "60"))
+
+
+def _token_expiry(token, entry, now):
+    _, exp = entry
+    return min(now + VERIFIED_TOKEN_SECONDS, exp)
+
+
+# token -> (user ID, exp); expiry is measured in Unix time like `exp`.
+_verified_tokens = TLRUCache(
+    maxsize=10000, ttu=_token_expiry, timer=time.time
+)
+_verified_tokens_lock = threading.Lock()
+
+
+def _verify_token(token: str) -> str:
+    """Returns the user ID of a valid token; raises if it is invalid."""
+    with _verified_tokens_lock:
+        entry = _verified_tokens.get(token)
+    if entry is not None:
+        return entry[0]
+    decoded_token = clerk.verify_token(token)
+    user_id = decoded_token["sub"]
+    exp = decoded_token.get("exp")
+    # Tokens without an expiry are verified every time.
+    if exp is not None:
+        with _verified_tokens_lock:
+            _verified_tokens[token] = (user_id, float(exp))
+    return user_id
+
 
 async def get_current_user_id(token: str = Depends(oauth2_scheme)) -> str:
     # For local testing without authentication, return a test user ID
@@ -36,9 +81,7 @@ async def get_current_user_id(token: str = Depends(oauth2_scheme)) -> str:
         )
     
     try:
-        decoded_token = clerk.verify_token(token)
-        user_id = decoded_token["sub"]
-        return user_id
+        return _verify_token(token)
     except Exception as e:
         logging.error(f"Token verification failed: {e}")
         raise HTTPException(
@@ -46,3 +89,39 @@ async def get_current_user_id(token: str = Depends(oauth2_scheme)) -> str:
             detail="Invalid authentication credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
+
+
+async def get_optional_user_id(
+    token: str = Depends(oauth2_scheme),
+) -> Optional[str]:
+    """Like get_current_user_id, but returns None instead of raising."""
+    if not clerk or not token:
+        return None
+    try:
+        return _verify_token(token)
+    except Exception:
+        return None
+
+
+async def require_debug_user(
+    user_id: str = Depends(get_current_user_id),
+) -> str:
+    """Only lets users listed in DEBUG_USER_IDS through."""
+    if user_id not in DEBUG_USER_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Debug access not allowed",
+        )
+    return user_id
+
+
+def is_debug_token(token: Optional[str]) -> bool:
+    """Whether a bearer token belongs to a debug user."""
+    if not clerk:
+        return "test_user_123" in DEBUG_USER_IDS
+    if not token:
+        return False
+    try:
+        return _verify_token(token) in DEBUG_USER_IDS
+    except Exception:
+        return False
@@ -0,0 +1,108 @@
+import threading
+from os import environ
+from typing import Dict, Iterable, Optional
+
+from cachetools import TTLCache
+
+from app.db import db, drops_collection
+from app.deadlines import hedged
+from app.invalidation import bus
+
+
+class LocalCache:
+    """Thread-safe TTL cache with hit/miss counters."""
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.name = name
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    def get(self, key, is_current=None) -> Optional[dict]:
+        """
+        Returns the cached value, or None on a miss. With `is_current`,
+        values it rejects are evicted and count as stale misses.
+        """
+        with self._lock:
+            value = self._cache.get(key)
+            if value is not None and is_current and not is_current(value):
+                del self._cache[key]
+                self.stale += 1
+                value = None
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def set(self, key, value) -> None:
+        with self._lock:
+            self._cache[key] = value
+
+    def invalidate(self, key, keep=None) -> None:
+        """Drops the value unless `keep(value)` says it is still current."""
+        with self._lock:
+            value = self._cache.get(key)
+            if value is not None and not (keep and keep(value)):
+                del self._cache[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._cache),
+                "maxsize": self._cache.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+            }
+
+
+# Drops are immutable once written, so they can be cached aggressively and
+# shared by every stream that places them. Deleted drops are evicted over the
+# invalidation bus.
+drop_cache = LocalCache(
+    "drops",
+    maxsize=int(environ.get("DROP_CACHE_SIZE", "10000")),
+    ttl=float(environ.get("DROP_CACHE_TTL_SECONDS", "3600")),
+)
+
+bus.subscribe("drop", drop_cache.invalidate)
+
+
+def invalidate_drop(drop_id: str) -> None:
+    bus.publish("drop", drop_id)
+
+
+def get_drops(drop_ids: Iterable[str], keep: bool = True) -> Dict[str, dict]:
+    """
+    Returns drop documents keyed by drop_id. Cache misses are fetched with a
+    single batched get_all; IDs that don't exist are absent from the result.
+    With `keep=False` fetched drops aren't cached, so bulk reads don't evict
+    the hot ones.
+    """
+    found = {}
+    missing = []
+    for drop_id in dict.fromkeys(drop_ids):
+        cached = drop_cache.get(drop_id)
+        if cached is not None:
+            found[drop_id] = cached
+        else:
+            missing.append(drop_id)
+
+    if missing:
+        refs = [drops_collection.document(drop_id) for drop_id in missing]
+        docs = hedged("drops_batch", lambda: list(db.get_all(refs)))
+        for doc in docs:
+            if doc.exists:
+                drop_data = doc.to_dict()
+                if keep:
+                    drop_cache.set(doc.id, drop_data)
+                found[doc.id] = drop_data
+
+    return found
@@ -0,0 +1,156 @@
+"""
+Read-after-write consistency for cached reads.
+
+Every pool and stream has a version that only grows. A stream's version is a
+counter that each write to the stream increments in its transaction. A
+pool's version is the commit time of the last stream created in it, in
+microseconds; using a timestamp means stream creations don't all write to
+the pool document. A pool read from Firestore is at least as new as its
+`read_time`.
+
+Responses to writes carry the new versions in an `X-Consistency-Token`
+header ("id:version" pairs separated by commas). Clients send the last token
+they received with later requests. Cached entries remember the versions
+they were built from, and `satisfies()` tells a cache whether an entry is
+new enough for the request's token. The same versions travel with
+invalidation events (`event_key`), so caches can drop exactly the entries
+that are older than a change.
+"""
+import contextvars
+import datetime
+from os import environ
+from typing import Dict, Optional, Tuple
+
+HEADER = b"x-consistency-token"
+
+# A token keeps the most recently written IDs.
+MAX_TOKEN_ENTRIES = int(environ.get("CONSISTENCY_TOKEN_ENTRIES", "16"))
+
+_required: contextvars.ContextVar[Dict[str, int]] = contextvars.ContextVar(
+    "consistency_required", default={}
+)
+_written: contextvars.ContextVar[Optional[Dict[str, int]]] = (
+    contextvars.ContextVar("consistency_written", default=None)
+)
+
+
+def parse_token(token: Optional[str]) -> Dict[str, int]:
+    """Reads "id:version,..."; malformed pairs are ignored."""
+    versions = {}
+    for pair in (token or "").split(","):
+        doc_id, _, version = pair.strip().rpartition(":")
+        if doc_id and version.isdigit():
+            versions[doc_id] = int(version)
+    return versions
+
+
+def format_token(versions: Dict[str, int]) -> str:
+    entries = list(versions.items())[-MAX_TOKEN_ENTRIES:]
+    return ",".join(f"{doc_id}:{version}" for doc_id, version in entries)
+
+
+def next_version(data: dict) -> int:
+    """The version a write to a stream document gives it."""
+    return (data.get("version") or 0) + 1
+
+
+def timestamp_version(timestamp: datetime.datetime) -> int:
+    """A Firestore commit or read time as a pool version."""
+    return round(timestamp.timestamp() * 1_000_000)
+
+
+def record_write(doc_id: str, version: int) -> None:
+    """
+    Adds a version to the response's token. May run inside a transaction:
+    a retry records again, replacing the version of the failed attempt.
+    Does nothing outside a request.
+    """
+    written = _written.get()
+    if written is not None:
+        written.pop(doc_id, None)
+        written[doc_id] = version
+
+
+def written_version(doc_id: str) -> Optional[int]:
+    """The version this request wrote to `doc_id`, if any."""
+    written = _written.get()
+    return written.get(doc_id) if written is not None else None
+
+
+def required_version(doc_id: str) -> Optional[int]:
+    """The version of `doc_id` the request's token asks for, if any."""
+    return _required.get().get(doc_id)
+
+
+def satisfies(versions: Dict[str, int], latest: Dict[str, int] = None) -> bool:
+    """
+    Whether an entry built from `versions` is new enough for the request's
+    token and for the `latest` versions a cache has heard of. IDs the entry
+    doesn't cover don't matter.
+    """
+    for required in (_required.get(), latest or {}):
+        for doc_id, version in required.items():
+            if doc_id in versions and versions[doc_id] < version:
+                return False
+    return True
+
+
+def event_key(doc_id: str, version: Optional[int] = None) -> str:
+    return f"{doc_id}:{version}" if version is not None else doc_id
+
+
+def parse_event_key(key: str) -> Tuple[str, Optional[int]]:
+    """Splits an event key; events without a version evict unconditionally."""
+    doc_id, _, version = key.rpartition(":")
+    if doc_id and version.isdigit():
+        return doc_id, int(version)
+    return key, None
+
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope.get("headers", []):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+class ConsistencyMiddleware:
+    """
+    Pure ASGI middleware that reads the request's `X-Consistency-Token` and,
+    after a successful write, returns the token updated with the versions
+    the request wrote.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        required = parse_token(_header(scope, HEADER))
+        written: Dict[str, int] = {}
+        required_token = _required.set(required)
+        written_token = _written.set(written)
+
+        async def send_with_token(message):
+            if (
+                message["type"] == "http.response.start"
+                and written
+                and message["status"] < 400
+            ):
+                versions = dict(required)
+                for doc_id, version in written.items():
+                    versions.pop(doc_id, None)
+                    versions[doc_id] = version
+                headers = list(message.get("headers", [])) + [
+                    (HEADER, format_token(versions).encode("latin-1"))
+                ]
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_token)
+        finally:
+            _required.reset(required_token)
+            _written.reset(written_token)
@@ -0,0 +1,203 @@
+"""
+Precomputed counts for the pool and stream listings.
+
+Creates and deletions adjust every counter they contribute to in the same
+batch or transaction as the write. Counters can't be trusted for data that
+predates them, so `scripts/backfill_counters.py` sets each one with
+`initialize()` and, once all are set, writes the `backfill` marker. Until
+then, reads of counters that aren't initialized fall back to a server-side
+aggregation; afterwards every counter, including ones first written since,
+is read as is.
+
+The global `pools` and `streams` counters change with every create, more
+often than one document sustains, so they are split into COUNTER_SHARDS
+documents (`pools:shard:<n>`); increments go to a random shard and reads
+sum them.
+"""
+import random
+from os import environ
+from typing import Dict, List
+from urllib.parse import quote
+
+from firebase_admin import firestore
+
+from app.db import (
+    counters_collection, db, pools_collection, streams_collection
+)
+from app.logger import app_logger
+
+# Only ever raise this: counts in shards beyond it would no longer be read.
+SHARDS = int(environ.get("COUNTER_SHARDS", "10"))
+
+_backfill_ref = counters_collection.document("backfill")
+# Set once the marker has been seen; it is never removed.
+_backfilled = False
+
+
+def _part(value: str) -> str:
+    # Counter keys are document IDs, which can't contain '/'.
+    return quote(value, safe="")
+
+
+def pools_key(creator_id: str = None) -> str:
+    if creator_id:
+        return f"pools:creator:{_part(creator_id)}"
+    return "pools"
+
+
+def pool_streams_key(pool_id: str, creator_id: str = None) -> str:
+    key = f"pool:{_part(pool_id)}:streams"
+    if creator_id:
+        key += f":creator:{_part(creator_id)}"
+    return key
+
+
+def streams_key(category: str = None, creator_id: str = None) -> str:
+    key = "streams"
+    if category:
+        key += f":category:{_part(category)}"
+    if creator_id:
+        key += f":creator:{_part(creator_id)}"
+    return key
+
+
+SHARDED_KEYS = (pools_key(), streams_key())
+
+
+def _documents(key: str) -> list:
+    """The documents holding a counter: its shards, or just itself."""
+    if key in SHARDED_KEYS:
+        return [
+            counters_collection.document(f"{key}:shard:{shard}")
+            for shard in range(SHARDS)
+        ]
+    return [counters_collection.document(key)]
+
+
+def pool_counter_keys(pool: dict) -> List[str]:
+    """Every counter a new pool contributes to."""
+    return [pools_key(), pools_key(pool["creator_id"])]
+
+
+def stream_counter_keys(stream: dict) -> List[str]:
+    """Every counter a new stream contributes to."""
+    pool_id = stream["pool_id"]
+    creator_id = stream["creator_id"]
+    category = (stream.get("content") or {}).get("category")
+    keys = [
+        pool_streams_key(pool_id),
+        pool_streams_key(pool_id, creator_id),
+        streams_key(),
+        streams_key(creator_id=creator_id),
+    ]
+    if category:
+        keys.append(streams_key(category=category))
+        keys.append(streams_key(category=category, creator_id=creator_id))
+    return keys
+
+
+def pool_counter_queries(pool: dict) -> Dict[str, object]:
+    """The counters of `pool_counter_keys`, each with the query it counts."""
+    creator_id = pool["creator_id"]
+    return {
+        pools_key(): pools_collection,
+        pools_key(creator_id): pools_collection.where(
+            "creator_id", "==", creator_id
+        ),
+    }
+
+
+def stream_counter_queries(stream: dict) -> Dict[str, object]:
+    """The counters of `stream_counter_keys`, each with the query it counts."""
+    pool_id = stream["pool_id"]
+    creator_id = stream["creator_id"]
+    category = (stream.get("content") or {}).get("category")
+    in_pool = streams_collection.where("pool_id", "==", pool_id)
+    queries = {
+        pool_streams_key(pool_id): in_pool,
+        pool_streams_key(pool_id, creator_id): in_pool.where(
+            "creator_id", "==", creator_id
+        ),
+        streams_key(): streams_collection,
+        streams_key(creator_id=creator_id): streams_collection.where(
+            "creator_id", "==", creator_id
+        ),
+    }
+    if category:
+        in_category = streams_collection.where(
+            "content.category", "==", category
+        )
+        queries[streams_key(category=category)] = in_category
+        queries[streams_key(category=category, creator_id=creator_id)] = (
+            in_category.where("creator_id", "==", creator_id)
+        )
+    return queries
+
+
+def increment(batch, keys: List[str], delta: int = 1) -> None:
+    """Adds counter increments to a write batch or transaction."""
+    for key in keys:
+        batch.set(
+            random.choice(_documents(key)),
+            {"count": firestore.Increment(delta)},
+            merge=True,
+        )
+
+
+def get_count(key: str, fallback_query) -> int:
+    """
+    Reads a precomputed count. Counters that aren't initialized yet fall back
+    to a server-side aggregation over the query.
+    """
+    global _backfilled
+    refs = _documents(key)
+    docs = {
+        doc.reference.path: doc
+        for doc in db.get_all(
+            refs if _backfilled else refs + [_backfill_ref]
+        )
+    }
+    if not _backfilled and docs[_backfill_ref.path].exists:
+        _backfilled = True
+    counters = [docs[ref.path] for ref in refs]
+    if _backfilled or all(
+        doc.exists and doc.to_dict().get("initialized") for doc in counters
+    ):
+        return sum(
+            doc.to_dict().get("count", 0) for doc in counters if doc.exists
+        )
+
+    app_logger.warning(
+        f"Counter {key} not initialized; falling back to an aggregation count"
+    )
+    result = fallback_query.count().get()
+    return int(result[0][0].value)
+
+
+def initialize(key: str, query) -> int:
+    """
+    Sets a counter to the aggregation count of `query` and marks it
+    initialized; returns the count. Safe to repeat at any time: the counter
+    documents are read in the transaction before the count, so a create that
+    commits meanwhile either is part of the count or increments the counter
+    after it is set.
+    """
+    refs = _documents(key)
+
+    @firestore.transactional
+    def transactional_initialize(transaction):
+        list(db.get_all(refs, transaction=transaction))
+        result = query.count().get(transaction=transaction)
+        count = int(result[0][0].value)
+        for shard, ref in enumerate(refs):
+            transaction.set(
+                ref, {"count": count if shard == 0 else 0, "initialized": True}
+            )
+        return count
+
+    return transactional_initialize(db.transaction())
+
+
+def mark_backfilled() -> None:
+    """Records that every counter has been initialized."""
+    _backfill_ref.set({"completed_at": firestore.SERVER_TIMESTAMP})
@@ -1,5 +1,6 @@
 import firebase_admin
-from firebase_admin import firestore
+
+from app.firestore_client import create_client
 
 # Check if the app is already initialized to prevent errors during --reload
 if not firebase_admin._apps:
@@ -7,8 +8,9 @@ if not firebase_admin._apps:
     # For local development, it relies on the GOOGLE_APPLICATION_CREDENTIALS env var.
     firebase_admin.initialize_app()
 
-# Get a client to the Firestore service
-db = firestore.client()
+# Get a client to the Firestore service, on a pooled and tuned gRPC
+# transport (see app/firestore_client.py)
+db = create_client()
 
 # Reference to the 'pools' collection
 pools_collection = db.collection('pools')
@@ -24,3 +26,28 @@ stream_drops_collection = db.collection('stream_drops')
 
 # Reference to the 'users' collection
 users_collection = db.collection('users')
+
+# Reference to the 'counters' collection (precomputed listing counts)
+counters_collection = db.collection('counters')
+
+# Reference to the 'stream_pages' collection (head/tail page snapshots)
+stream_pages_collection = db.collection('stream_pages')
+
+# Reference to the 'deletions' collection (tombstones of deleted pools and
+# streams, see app/deletions.py)
+deletions_collection = db.collection('deletions')
+
+# Reference to the 'changes' collection (cache invalidations relayed between
+# instances, see app/invalidation.py)
+changes_collection = db.collection('changes')
+
+
+def get_many(collection, ids):
+    """
+    Fetches documents of `collection` by ID with a single batched get_all.
+    Returns a dict keyed by document ID; missing documents are left out.
+    """
+    refs = [collection.document(doc_id) for doc_id in dict.fromkeys(ids)]
+    if not refs:
+        return {}
+    return {doc.id: doc.to_dict() for doc in db.get_all(refs) if doc.exists}
@@ -0,0 +1,237 @@
+"""
+Per-request deadlines and hedged reads.
+
+`DeadlineMiddleware` gives every HTTP request a deadline: the
+`X-Request-Timeout` header (seconds) if the client sends one, else
+REQUEST_DEADLINE_SECONDS, never more than MAX_REQUEST_DEADLINE_SECONDS. The
+deadline lives in a context variable, so it follows the request into the
+threadpool that runs sync handlers. The Firestore transport
+(app/firestore_client.py) clamps every RPC's timeout to what is left and
+fails fast with `RequestDeadlineExceeded` (a 504) once it has passed.
+
+`hedged()` runs an idempotent read and, if it hasn't returned after the
+read's recent p95 latency, starts an identical second read and returns
+whichever finishes first. Enabled with HEDGED_READS=true.
+
+`concurrently()` runs independent reads of one request in parallel, each
+under the request's deadline. `with_deadline()` gives one step of a long
+streamed response a deadline of its own.
+"""
+import contextvars
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from os import environ
+from typing import Any, Callable, Deque, Dict, List, Optional, TypeVar
+
+from fastapi import HTTPException, status
+
+REQUEST_DEADLINE_SECONDS = float(environ.get("REQUEST_DEADLINE_SECONDS", "15"))
+MAX_REQUEST_DEADLINE_SECONDS = float(
+    environ.get("MAX_REQUEST_DEADLINE_SECONDS", "60")
+)
+
+HEDGED_READS = environ.get("HEDGED_READS", "false") == "true"
+# Never hedge before this delay, and only once enough latencies are known.
+HEDGE_MIN_DELAY_SECONDS = float(environ.get("HEDGE_MIN_DELAY_MS", "20")) / 1000
+HEDGE_MIN_SAMPLES = 50
+HEDGE_WINDOW = 500
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar(
+    "request_deadline", default=None
+)
+
+T = TypeVar("T")
+
+
+class RequestDeadlineExceeded(HTTPException):
+    """Raised when a request runs out of time; handlers re-raise it as-is."""
+
+    def __init__(self):
+        super().__init__(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail="Request deadline exceeded",
+        )
+
+
+def remaining() -> Optional[float]:
+    """Seconds left for the current request, or None outside a request."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def running_out(reserve: float) -> bool:
+    """True when less than `reserve` seconds of the deadline are left."""
+    left = remaining()
+    return left is not None and left < reserve
+
+
+def clamp_timeout(timeout: Optional[float]) -> Optional[float]:
+    """Limits an RPC timeout to the time the request has left."""
+    left = remaining()
+    if left is None:
+        return timeout
+    if left <= 0:
+        raise RequestDeadlineExceeded()
+    return left if timeout is None else min(timeout, left)
+
+
+def _requested_timeout(scope) -> float:
+    for name, value in scope.get("headers", []):
+        if name == b"x-request-timeout":
+            try:
+                timeout = float(value)
+            except ValueError:
+                break
+            if timeout > 0:
+                return min(timeout, MAX_REQUEST_DEADLINE_SECONDS)
+            break
+    return REQUEST_DEADLINE_SECONDS
+
+
+class DeadlineMiddleware:
+    """Pure ASGI middleware that sets the deadline of each HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = _deadline.set(time.monotonic() + _requested_timeout(scope))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _deadline.reset(token)
+
+
+class LatencyTracker:
+    """Sliding windows of recent latencies, one per read kind."""
+
+    def __init__(self, window: int = HEDGE_WINDOW):
+        self._window = window
+        self._samples: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, key: str, seconds: float) -> None:
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self._window)
+            samples.append(seconds)
+
+    def p95(self, key: str) -> Optional[float]:
+        with self._lock:
+            samples = list(self._samples.get(key, ()))
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        samples.sort()
+        return samples[int(len(samples) * 0.95) - 1]
+
+
+latencies = LatencyTracker()
+hedge_counts = Counter()
+_hedge_lock = threading.Lock()
+_executor = ThreadPoolExecutor(
+    max_workers=int(environ.get("HEDGE_WORKERS", "32")),
+    thread_name_prefix="hedged-read",
+)
+
+
+def _count(outcome: str) -> None:
+    with _hedge_lock:
+        hedge_counts[outcome] += 1
+
+
+def _timed(key: str, read: Callable[[], T]) -> T:
+    started = time.monotonic()
+    result = read()
+    latencies.record(key, time.monotonic() - started)
+    return result
+
+
+def hedged(key: str, read: Callable[[], T]) -> T:
+    """
+    Runs the idempotent `read`, hedging it with a second attempt once it
+    takes longer than the p95 latency of reads of the same `key`.
+    """
+    delay = latencies.p95(key) if HEDGED_READS else None
+    if delay is None:
+        return _timed(key, read)
+
+    delay = max(delay, HEDGE_MIN_DELAY_SECONDS)
+    left = remaining()
+    if left is not None and left <= delay:
+        return _timed(key, read)
+
+    # Each attempt runs in its own copy of the request context so that the
+    # deadline still applies inside the worker threads.
+    first = _executor.submit(contextvars.copy_context().run, _timed, key, read)
+    done, _ = wait([first], timeout=delay)
+    if done:
+        return first.result()
+
+    _count("hedged")
+    second = _executor.submit(
+        contextvars.copy_context().run, _timed, key, read
+    )
+    pending = {first, second}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for attempt in done:
+            if attempt.exception() is None:
+                if attempt is second:
+                    _count("hedge_won")
+                return attempt.result()
+            error = attempt.exception()
+    raise error
+
+
+# Separate from the hedging pool: reads run here may hedge themselves.
+_concurrent_executor = ThreadPoolExecutor(
+    max_workers=int(environ.get("CONCURRENT_READ_WORKERS", "32")),
+    thread_name_prefix="concurrent-read",
+)
+
+
+def concurrently(*reads: Callable[[], Any]) -> List[Any]:
+    """
+    Runs `reads` in parallel and returns their results in order. The first
+    read runs in the calling thread; an error in any read is raised once
+    all of them have finished.
+    """
+    futures = [
+        _concurrent_executor.submit(contextvars.copy_context().run, read)
+        for read in reads[1:]
+    ]
+    results, error = [], None
+    try:
+        results.append(reads[0]())
+    except Exception as e:
+        error = e
+    for future in futures:
+        try:
+            results.append(future.result())
+        except Exception as e:
+            error = error or e
+    if error is not None:
+        raise error
+    return results
+
+
+def with_deadline(seconds: float, read: Callable[[], T]) -> T:
+    """Runs `read` with a deadline of `seconds` instead of the request's."""
+    context = contextvars.copy_context()
+    context.run(_deadline.set, time.monotonic() + seconds)
+    return context.run(read)
+
+
+def hedge_stats() -> dict:
+    with _hedge_lock:
+        counts = dict(hedge_counts)
+    return {"enabled": HEDGED_READS, **counts}
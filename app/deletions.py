@@ -0,0 +1,459 @@
+"""
+Deletion of pools and streams.
+
+Deleting a pool or stream removes its document and writes a tombstone to the
+`deletions` collection in the same transaction, so the item is gone from
+every read straight away. The tombstone doubles as the cleanup job: a
+cleaner thread in each worker removes the item's dependents page by page
+and records its progress (phase and cursor) on the tombstone in the same
+transaction as each page of deletes, so cleanup resumes where it stopped
+after a restart. Jobs are leased, so a job is worked on by one worker at a
+time, and the cleaner is paced to CLEANUP_BATCHES_PER_SECOND transactions
+per worker to leave Firestore capacity to live traffic.
+
+Cleaning up a pool tombstones each of its streams, which then get jobs of
+their own. Cleaning up a stream deletes its placements, the drops that are
+not placed in any other stream, drops still waiting in its append queue and
+the stream's entry in every user's `stream_history`.
+"""
+import datetime
+import os
+import threading
+import time
+import uuid
+from collections import Counter
+from os import environ
+from typing import List, Optional
+
+from firebase_admin import firestore
+from google.cloud.firestore_v1.field_path import FieldPath
+
+from app.append_queue import QUEUE_COLLECTION, leases_collection
+from app.cache import invalidate_drop
+from app.counters import increment, pool_counter_keys, stream_counter_keys
+from app.db import (
+    db, deletions_collection, drops_collection, pools_collection,
+    stream_drops_collection, stream_pages_collection, streams_collection
+)
+from app.logger import app_logger
+from app import overview, search, trending
+
+# Dependents per transaction; a transaction takes at most 500 writes.
+BATCH_SIZE = min(int(environ.get("CLEANUP_BATCH_SIZE", "200")), 240)
+BATCHES_PER_SECOND = float(environ.get("CLEANUP_BATCHES_PER_SECOND", "2"))
+POLL_SECONDS = float(environ.get("CLEANUP_POLL_SECONDS", "30"))
+LEASE_SECONDS = float(environ.get("CLEANUP_LEASE_SECONDS", "60"))
+
+# Cleanup phases, in order. Each phase pages through one kind of dependent.
+PHASES = {
+    "pool": ("streams", "finish"),
+    "stream": ("placements", "queue", "progress", "finish"),
+}
+
+# Firestore `in` filters take at most 30 values.
+_IN_LIMIT = 30
+
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def job_id(kind: str, doc_id: str) -> str:
+    return f"{kind}:{doc_id}"
+
+
+class NotCreator(Exception):
+    """Raised when someone other than its creator deletes a pool or stream."""
+
+
+def _tombstone(transaction, kind: str, doc_id: str, data: dict) -> dict:
+    """Replaces a pool or stream document with its tombstone."""
+    if kind == "pool":
+        transaction.delete(pools_collection.document(doc_id))
+        increment(transaction, pool_counter_keys(data), -1)
+    else:
+        transaction.delete(streams_collection.document(doc_id))
+        # Head and tail pages are served from the snapshot without reading
+        # the stream document.
+        transaction.delete(stream_pages_collection.document(doc_id))
+        increment(transaction, stream_counter_keys(data), -1)
+    job = {
+        "kind": kind,
+        "id": doc_id,
+        "data": data,
+        "deleted_at": _now(),
+        "phase": PHASES[kind][0],
+        "cursor": None,
+        "deleted_docs": 0,
+        "owner": None,
+        "lease_expires_at": None,
+    }
+    transaction.set(deletions_collection.document(job_id(kind, doc_id)), job)
+    return job
+
+
+def _after_tombstone(kind: str, doc_id: str, data: dict) -> None:
+    search.unindex(kind, doc_id)
+    if kind == "pool":
+        overview.invalidate_pool(doc_id)
+    else:
+        overview.invalidate_pool(data["pool_id"])
+        overview.invalidate_stream(doc_id)
+        trending.unpin(doc_id)
+
+
+def delete(kind: str, doc_id: str, user_id: str) -> Optional[dict]:
+    """
+    Tombstones a pool or stream created by `user_id` and wakes the cleaner.
+    Returns the tombstone, also for an item whose cleanup is still running,
+    or None if there is no such item. Raises NotCreator for items created by
+    someone else.
+    """
+    collection = pools_collection if kind == "pool" else streams_collection
+    doc_ref = collection.document(doc_id)
+    job_ref = deletions_collection.document(job_id(kind, doc_id))
+
+    @firestore.transactional
+    def transactional_delete(transaction):
+        docs = {
+            doc.reference.path: doc
+            for doc in db.get_all([doc_ref, job_ref], transaction=transaction)
+        }
+        doc = docs[doc_ref.path]
+        job = docs[job_ref.path]
+        data = (
+            doc.to_dict() if doc.exists
+            else job.to_dict()["data"] if job.exists
+            else None
+        )
+        if data is None:
+            return None, False
+        if data.get("creator_id") != user_id:
+            raise NotCreator()
+        if doc.exists:
+            return _tombstone(transaction, kind, doc_id, data), True
+        return job.to_dict(), False
+
+    job, created = transactional_delete(db.transaction())
+    if created:
+        _after_tombstone(kind, doc_id, job["data"])
+        cleaner.wake()
+    return job
+
+
+class _Page:
+    """What one cleanup transaction did."""
+
+    def __init__(self, cursor=None, deleted: int = 0):
+        self.cursor = cursor
+        self.deleted = deleted
+        self.drop_ids: List[str] = []
+        self.streams: List[dict] = []
+
+
+def _after_cursor(query, cursor, size: int = BATCH_SIZE):
+    """The next page of a query in document ID order."""
+    query = query.order_by("__name__")
+    if cursor:
+        query = query.start_after({"__name__": cursor})
+    return query.limit(size)
+
+
+def _clean_pool_streams(transaction, job) -> Optional[_Page]:
+    # Up to eight writes per stream: the stream, its tombstone and counters.
+    docs = list(
+        _after_cursor(
+            streams_collection.where("pool_id", "==", job["id"]),
+            job["cursor"],
+            BATCH_SIZE // 4,
+        ).stream(transaction=transaction)
+    )
+    if not docs:
+        return None
+    page = _Page(cursor=docs[-1].id, deleted=len(docs))
+    for doc in docs:
+        stream_data = doc.to_dict()
+        _tombstone(transaction, "stream", doc.id, stream_data)
+        page.streams.append(stream_data)
+    return page
+
+
+def _shared_drop_ids(transaction, stream_id: str, drop_ids) -> set:
+    """Drops among `drop_ids` that are also placed in another stream."""
+    drop_ids = list(dict.fromkeys(drop_ids))
+    shared = set()
+    for i in range(0, len(drop_ids), _IN_LIMIT):
+        query = stream_drops_collection.where(
+            "drop_id", "in", drop_ids[i:i + _IN_LIMIT]
+        )
+        for doc in query.stream(transaction=transaction):
+            placement = doc.to_dict()
+            if placement["stream_id"] != stream_id:
+                shared.add(placement["drop_id"])
+    return shared
+
+
+def _clean_stream_placements(transaction, job) -> Optional[_Page]:
+    # Two writes per placement (placement and drop) plus the job update.
+    docs = list(
+        _after_cursor(
+            stream_drops_collection.where("stream_id", "==", job["id"]),
+            job["cursor"],
+            BATCH_SIZE // 2,
+        ).stream(transaction=transaction)
+    )
+    if not docs:
+        return None
+    drop_ids = [doc.to_dict()["drop_id"] for doc in docs]
+    shared = _shared_drop_ids(transaction, job["id"], drop_ids)
+    page = _Page(cursor=docs[-1].id)
+    for doc in docs:
+        transaction.delete(doc.reference)
+        page.deleted += 1
+    for drop_id in dict.fromkeys(drop_ids):
+        if drop_id not in shared:
+            transaction.delete(drops_collection.document(drop_id))
+            page.drop_ids.append(drop_id)
+            page.deleted += 1
+    return page
+
+
+def _clean_stream_queue(transaction, job) -> Optional[_Page]:
+    queue = streams_collection.document(job["id"]).collection(
+        QUEUE_COLLECTION
+    )
+    docs = list(
+        _after_cursor(queue, job["cursor"], BATCH_SIZE // 2).stream(
+            transaction=transaction
+        )
+    )
+    if not docs:
+        return None
+    page = _Page(cursor=docs[-1].id)
+    for doc in docs:
+        drop_id = doc.to_dict()["drop"]["drop_id"]
+        transaction.delete(doc.reference)
+        transaction.delete(drops_collection.document(drop_id))
+        page.drop_ids.append(drop_id)
+        page.deleted += 2
+    return page
+
+
+def _clean_stream_progress(transaction, job) -> Optional[_Page]:
+    history = FieldPath("stream_history", job["id"])
+    updated_at = FieldPath(
+        "stream_history", job["id"], "updated_at"
+    ).to_api_repr()
+    query = (
+        db.collection_group("progress")
+        .where(updated_at, ">", _EPOCH)
+        .order_by(updated_at)
+        .order_by("__name__")
+    )
+    if job["cursor"]:
+        last_updated_at, path = job["cursor"]
+        query = query.start_after(
+            {updated_at: last_updated_at, "__name__": db.document(path)}
+        )
+    docs = list(query.limit(BATCH_SIZE).stream(transaction=transaction))
+    if not docs:
+        return None
+    last = docs[-1]
+    page = _Page(cursor=[last.get(updated_at), last.reference.path])
+    for doc in docs:
+        update = {history.to_api_repr(): firestore.DELETE_FIELD}
+        context = doc.to_dict().get("last_active_context") or {}
+        if context.get("stream_id") == job["id"]:
+            update["last_active_context"] = firestore.DELETE_FIELD
+        transaction.update(doc.reference, update)
+        page.deleted += 1
+    return page
+
+
+def _finish(transaction, job) -> None:
+    if job["kind"] == "stream":
+        transaction.delete(stream_pages_collection.document(job["id"]))
+        transaction.delete(leases_collection.document(job["id"]))
+    transaction.delete(
+        deletions_collection.document(job_id(job["kind"], job["id"]))
+    )
+
+
+_CLEANERS = {
+    ("pool", "streams"): _clean_pool_streams,
+    ("stream", "placements"): _clean_stream_placements,
+    ("stream", "queue"): _clean_stream_queue,
+    ("stream", "progress"): _clean_stream_progress,
+}
+
+
+class Cleaner:
+    """Works through the tombstones in the `deletions` collection."""
+
+    def __init__(self):
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._counts = Counter()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._next_batch_at = 0.0
+        self._active: Optional[str] = None
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    def _try_lease(self, job_ref) -> bool:
+        @firestore.transactional
+        def take(transaction):
+            doc = job_ref.get(transaction=transaction)
+            if not doc.exists:
+                return False
+            job = doc.to_dict()
+            now = _now()
+            if job.get("owner") not in (None, self.owner) and (
+                job["lease_expires_at"] > now
+            ):
+                return False
+            transaction.update(job_ref, {
+                "owner": self.owner,
+                "lease_expires_at": now + datetime.timedelta(
+                    seconds=LEASE_SECONDS
+                ),
+            })
+            return True
+
+        return take(db.transaction())
+
+    def _pace(self) -> bool:
+        """Waits for the next batch slot; False when the cleaner stops."""
+        delay = self._next_batch_at - time.monotonic()
+        if delay > 0 and self._stop.wait(delay):
+            return False
+        self._next_batch_at = time.monotonic() + 1 / BATCHES_PER_SECOND
+        return not self._stop.is_set()
+
+    def step(self, job_ref) -> bool:
+        """
+        Cleans up one page of a leased job's dependents. Returns False once
+        the job is finished or no longer leased by this worker.
+        """
+        @firestore.transactional
+        def transactional_step(transaction):
+            doc = job_ref.get(transaction=transaction)
+            if not doc.exists:
+                return None, None
+            job = doc.to_dict()
+            if job.get("owner") != self.owner:
+                return None, None
+            if job["phase"] == "finish":
+                _finish(transaction, job)
+                return job, None
+            page = _CLEANERS[(job["kind"], job["phase"])](transaction, job)
+            update = {
+                "lease_expires_at": _now() + datetime.timedelta(
+                    seconds=LEASE_SECONDS
+                ),
+            }
+            if page is not None:
+                update["cursor"] = page.cursor
+                update["deleted_docs"] = firestore.Increment(page.deleted)
+            elif job["cursor"] is not None:
+                # Look once more from the start for dependents created
+                # behind the cursor while the phase ran.
+                update["cursor"] = None
+            else:
+                phases = PHASES[job["kind"]]
+                update["phase"] = phases[phases.index(job["phase"]) + 1]
+            transaction.update(job_ref, update)
+            return job, page
+
+        job, page = transactional_step(db.transaction())
+        if job is None:
+            return False
+        if page is not None:
+            for drop_id in page.drop_ids:
+                invalidate_drop(drop_id)
+                search.unindex("drop", drop_id)
+            for stream_data in page.streams:
+                _after_tombstone(
+                    "stream", stream_data["stream_id"], stream_data
+                )
+            if page.streams:
+                # Pick up the new stream jobs on the next pass.
+                self.wake()
+            self._count("deleted_docs", page.deleted)
+            self._count("tombstoned_streams", len(page.streams))
+        if job["phase"] == "finish":
+            self._count("jobs_completed")
+            app_logger.info(
+                "Finished cleaning up deleted %s %s", job["kind"], job["id"]
+            )
+            return False
+        return True
+
+    def run_once(self) -> int:
+        """Works through every job that isn't leased by another worker."""
+        worked = 0
+        for doc in deletions_collection.order_by("deleted_at").stream():
+            if self._stop.is_set():
+                break
+            if not self._try_lease(doc.reference):
+                continue
+            with self._lock:
+                self._active = doc.id
+            try:
+                while self._pace() and self.step(doc.reference):
+                    pass
+                worked += 1
+            except Exception as e:
+                self._count("errors")
+                app_logger.error(
+                    "Cleanup of %s failed: %s", doc.id, e, exc_info=True
+                )
+            finally:
+                with self._lock:
+                    self._active = None
+        return worked
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.clear()
+            try:
+                self.run_once()
+            except Exception as e:
+                app_logger.error(f"Deletion cleanup failed: {e}")
+            self._wake.wait(POLL_SECONDS)
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="deletion-cleaner", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _count(self, outcome: str, amount: int = 1) -> None:
+        with self._lock:
+            self._counts[outcome] += amount
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._counts,
+                "active": self._active,
+                "batches_per_second": BATCHES_PER_SECOND,
+            }
+
+
+cleaner = Cleaner()
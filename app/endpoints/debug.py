@@ -0,0 +1,77 @@
+import asyncio
+import os
+from os import environ
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import JSONResponse, PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+
+from app import profiler
+from app.auth import require_debug_user
+from app.logger import app_logger
+
+router = APIRouter(
+    prefix="/debug", dependencies=[Depends(require_debug_user)]
+)
+
+MAX_PROFILE_SECONDS = float(environ.get("PROFILE_MAX_SECONDS", "60"))
+
+FORMATS = ("speedscope", "collapsed")
+
+
+def _check_format(format: str) -> None:
+    if format not in FORMATS:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Unknown format {format!r}; use {' or '.join(FORMATS)}",
+        )
+
+
+def _render(sampler: profiler.SamplingProfiler, name: str, format: str):
+    if format == "collapsed":
+        return PlainTextResponse(sampler.to_collapsed())
+    return JSONResponse(
+        sampler.to_speedscope(),
+        headers={
+            "Content-Disposition": (
+                f'attachment; filename="{name}.speedscope.json"'
+            ),
+        },
+    )
+
+
+@router.get("/profile")
+async def profile_instance(
+    seconds: float = Query(10, gt=0, le=MAX_PROFILE_SECONDS),
+    format: str = Query("speedscope"),
+):
+    """
+    Samples every thread of this worker for `seconds` and returns the
+    profile as a speedscope file or as collapsed stacks for flamegraph.pl.
+    """
+    _check_format(format)
+    if not profiler.slots.acquire(blocking=False):
+        profiler.count("instance_busy")
+        raise HTTPException(
+            status_code=429, detail="Too many profiles running"
+        )
+    app_logger.info(f"Profiling worker {os.getpid()} for {seconds}s")
+    sampler = profiler.SamplingProfiler(f"worker {os.getpid()}, {seconds}s")
+    sampler.start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        await run_in_threadpool(sampler.stop)
+        profiler.slots.release()
+    profiler.count("instance_profiled")
+    return _render(sampler, f"profile-{os.getpid()}", format)
+
+
+@router.get("/profiles/{profile_id}")
+def get_request_profile(profile_id: str, format: str = Query("speedscope")):
+    """Returns the profile of a request sent with `X-Profile: 1`."""
+    _check_format(format)
+    sampler = profiler.get_profile(profile_id)
+    if sampler is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return _render(sampler, f"request-{profile_id}", format)
@@ -1,26 +1,154 @@
-from fastapi import APIRouter, HTTPException
-from app.models import Drop
-from app.db import drops_collection
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from app.models import (
+    BatchGetRequest,
+    Drop,
+    DropBatchResponse,
+    DropPlacementsResponse,
+    PlacementBatchResponse,
+    StreamDropPlacement,
+)
+from app.db import get_many, stream_drops_collection, streams_collection
+from app import fields
+from app.cache import get_drops
 from app.logger import app_logger
 
 router = APIRouter()
 
+
+def _in_live_streams(placements):
+    """
+    Leaves out placements of deleted streams, which remain until the
+    stream's cleanup reaches them.
+    """
+    live = get_many(
+        streams_collection,
+        (placement["stream_id"] for placement in placements),
+    )
+    return [
+        placement for placement in placements
+        if placement["stream_id"] in live
+    ]
+
+
+@router.post("/drops:batchGet", response_model=DropBatchResponse)
+def batch_get_drops(
+    request: BatchGetRequest,
+    drop_fields: Optional[fields.Fieldset] = Depends(fields.fieldset(Drop)),
+):
+    """
+    Retrieves up to 300 drops by ID. Cached drops are served from memory and
+    the rest are fetched with a single batched read. Drops are returned in
+    request order; unknown IDs are listed in `missing`. `fields` or
+    `view=preview` limit the fields of the returned drops.
+    """
+    app_logger.info(f"Batch retrieving {len(request.ids)} drops")
+    try:
+        found = get_drops(request.ids)
+        ids = list(dict.fromkeys(request.ids))
+        return fields.select(DropBatchResponse(
+            drops=[found[drop_id] for drop_id in ids if drop_id in found],
+            missing=[drop_id for drop_id in ids if drop_id not in found],
+        ), drop_fields, "drops")
+    except Exception as e:
+        app_logger.error(f"Failed to batch retrieve drops: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Failed to retrieve drops.")
+
+
+@router.post("/placements:batchGet", response_model=PlacementBatchResponse)
+def batch_get_placements(request: BatchGetRequest):
+    """
+    Retrieves up to 300 stream placements by ID with a single batched read,
+    e.g. to resolve the `last_read_placement_id`s of a user's river.
+    """
+    app_logger.info(f"Batch retrieving {len(request.ids)} placements")
+    try:
+        found = {
+            placement["placement_id"]: placement
+            for placement in _in_live_streams(
+                get_many(stream_drops_collection, request.ids).values()
+            )
+        }
+        ids = list(dict.fromkeys(request.ids))
+        return PlacementBatchResponse(
+            placements=[
+                found[placement_id] for placement_id in ids
+                if placement_id in found
+            ],
+            missing=[
+                placement_id for placement_id in ids
+                if placement_id not in found
+            ],
+        )
+    except Exception as e:
+        app_logger.error(
+            f"Failed to batch retrieve placements: {e}", exc_info=True
+        )
+        raise HTTPException(
+            status_code=500, detail="Failed to retrieve placements."
+        )
+
+
 @router.get("/drops/{drop_id}", response_model=Drop)
-def get_drop(drop_id: str):
+def get_drop(
+    drop_id: str,
+    drop_fields: Optional[fields.Fieldset] = Depends(fields.fieldset(Drop)),
+):
     """
-    Retrieves a single drop by its ID from Firestore.
+    Retrieves a single drop by its ID from Firestore. `fields` or
+    `view=preview` limit the returned fields.
     """
     app_logger.info(f"Attempting to retrieve drop with ID: {drop_id}")
     try:
-        doc = drops_collection.document(drop_id).get()
-        if not doc.exists:
+        drop_data = get_drops([drop_id]).get(drop_id)
+        if drop_data is None:
             app_logger.warning(f"Drop with ID {drop_id} not found.")
             raise HTTPException(status_code=404, detail="Drop not found")
         
         app_logger.info(f"Successfully retrieved drop with ID: {drop_id}")
-        return doc.to_dict()
+        return fields.select(Drop(**drop_data), drop_fields)
     except Exception as e:
         app_logger.error(f"Failed to retrieve drop {drop_id}: {e}", exc_info=True)
         if isinstance(e, HTTPException):
             raise
         raise HTTPException(status_code=500, detail="Failed to retrieve drop.")
+
+
+@router.get(
+    "/drops/{drop_id}/placements", response_model=DropPlacementsResponse
+)
+def get_drop_placements(drop_id: str):
+    """
+    Lists every stream placement of a drop (the drop -> placements index).
+    """
+    app_logger.info(f"Attempting to list placements for drop {drop_id}")
+    try:
+        if drop_id not in get_drops([drop_id]):
+            raise HTTPException(status_code=404, detail="Drop not found")
+
+        placement_docs = stream_drops_collection.where(
+            "drop_id", "==", drop_id
+        ).stream()
+        placements = [
+            StreamDropPlacement(**placement)
+            for placement in _in_live_streams(
+                [doc.to_dict() for doc in placement_docs]
+            )
+        ]
+        placements.sort(key=lambda placement: placement.added_at)
+
+        app_logger.info(
+            "Found %s placements for drop %s", len(placements), drop_id
+        )
+        return DropPlacementsResponse(drop_id=drop_id, placements=placements)
+    except Exception as e:
+        app_logger.error(
+            f"Failed to list placements for drop {drop_id}: {e}",
+            exc_info=True,
+        )
+        if isinstance(e, HTTPException):
+            raise
+        raise HTTPException(
+            status_code=500, detail="Failed to list drop placements."
+        )
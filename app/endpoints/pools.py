@@ -1,16 +1,27 @@
 from typing import Optional
 
-from fastapi import APIRouter, HTTPException, status, Body, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Body, Query
 
 from app.models import (
+    BatchGetRequest,
+    DeletionResponse,
     Pool,
+    PoolBatchResponse,
     PoolContent,
     PoolListResponse,
+    PoolOverviewResponse,
 )
-from app.db import pools_collection
+from app.db import db, get_many, pools_collection
+from app.counters import get_count, increment, pool_counter_keys, pools_key
+from app.pagination import apply_cursor, encode_cursor
 import datetime
 import uuid
 from app.logger import app_logger
+from app.search import search_index
+from app import deletions, overview
+from app.auth import get_current_user_id
+from app.idempotency import IdempotentRequest, idempotency
+from app.responses import json_response
 
 
 router = APIRouter()
@@ -22,13 +33,18 @@ router = APIRouter()
 def create_pool(
     pool_content: PoolContent,
     creator_id: str = Body(..., example="user_xyz"),
+    idempotent_request: IdempotentRequest = Depends(idempotency),
 ):
     """
-    Creates a new pool in Firestore.
+    Creates a new pool in Firestore. Retries carrying the same
+    Idempotency-Key header return the original response.
     """
     app_logger.info(
         f"Attempting to create a new pool with title: '{pool_content.title}'"
     )
+    replayed = idempotent_request.replay()
+    if replayed is not None:
+        return replayed
     try:
         # Generate a unique ID for the new pool
         pool_id = str(uuid.uuid4())
@@ -40,12 +56,18 @@ def create_pool(
             content=pool_content
         )
         
-        # Save the new pool to Firestore
-        pools_collection.document(pool_id).set(new_pool.dict())
+        # Save the new pool to Firestore along with its listing counters
+        batch = db.batch()
+        batch.set(pools_collection.document(pool_id), new_pool.dict())
+        increment(batch, pool_counter_keys(new_pool.dict()))
+        batch.commit()
+        search_index.add_pool(new_pool.dict())
         
         app_logger.info(f"Successfully created pool with ID: {pool_id}")
+        idempotent_request.save(new_pool)
         return new_pool
     except Exception as e:
+        idempotent_request.release()
         app_logger.error(f"Failed to create pool: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to create pool.")
 
@@ -55,13 +77,18 @@ def list_pools(
     limit: int = Query(20, ge=1, le=100),
     offset: int = Query(0, ge=0),
     creator_id: Optional[str] = Query(None),
+    cursor: Optional[str] = Query(None),
 ):
-    """Returns pools with optional creator filtering and pagination."""
+    """
+    Returns pools with optional creator filtering and pagination.
+    Pass `next_cursor` back as `cursor` to page without offset scans.
+    """
 
     app_logger.info(
-        "Listing pools with limit=%s offset=%s creator_id=%s",
+        "Listing pools with limit=%s offset=%s cursor=%s creator_id=%s",
         limit,
         offset,
+        cursor,
         creator_id,
     )
 
@@ -70,24 +97,32 @@ def list_pools(
         if creator_id:
             query = query.where("creator_id", "==", creator_id)
 
-        total_count = len(list(query.stream()))
+        total_count = get_count(pools_key(creator_id), query)
 
-        ordered_query = query.order_by("created_at")
-        if offset:
+        ordered_query = apply_cursor(query, cursor)
+        if offset and not cursor:
             ordered_query = ordered_query.offset(offset)
 
-        pool_docs = ordered_query.limit(limit).stream()
-        pools = [Pool(**doc.to_dict()) for doc in pool_docs]
+        pool_docs = list(ordered_query.limit(limit + 1).stream())
+        has_more = len(pool_docs) > limit
+        pools = [Pool(**doc.to_dict()) for doc in pool_docs[:limit]]
 
-        next_offset = offset + len(pools)
-        has_more = next_offset < total_count
+        next_offset = offset + len(pools) if has_more and not cursor else None
+        next_cursor = (
+            encode_cursor(pools[-1].created_at, pools[-1].pool_id)
+            if has_more
+            else None
+        )
 
         return PoolListResponse(
             pools=pools,
             total_count=total_count,
             has_more=has_more,
-            next_offset=next_offset if has_more else None,
+            next_offset=next_offset,
+            next_cursor=next_cursor,
         )
+    except HTTPException:
+        raise
     except Exception as e:
         app_logger.error("Failed listing pools: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to list pools.")
@@ -115,3 +150,101 @@ def get_pool(pool_id: str):
         if isinstance(e, HTTPException):
             raise
         raise HTTPException(status_code=500, detail="Failed to retrieve pool.")
+
+
+@router.delete(
+    "/pools/{pool_id}",
+    status_code=status.HTTP_202_ACCEPTED,
+    response_model=DeletionResponse
+)
+def delete_pool(pool_id: str, user_id: str = Depends(get_current_user_id)):
+    """
+    Deletes a pool and, in the background, its streams with their drops,
+    placements and reading history. The pool is gone immediately. Only the
+    pool's creator may delete it.
+    """
+    app_logger.info(f"User {user_id} attempting to delete pool {pool_id}")
+    try:
+        tombstone = deletions.delete("pool", pool_id, user_id)
+        if tombstone is None:
+            raise HTTPException(status_code=404, detail="Pool not found")
+        app_logger.info(f"Deleted pool {pool_id}; cleanup scheduled")
+        return tombstone
+    except deletions.NotCreator:
+        app_logger.warning(
+            f"User {user_id} may not delete pool {pool_id}: not its creator"
+        )
+        raise HTTPException(
+            status_code=403, detail="Only the pool's creator can delete it"
+        )
+    except Exception as e:
+        app_logger.error(
+            f"Failed to delete pool {pool_id}: {e}", exc_info=True
+        )
+        if isinstance(e, HTTPException):
+            raise
+        raise HTTPException(status_code=500, detail="Failed to delete pool.")
+
+
+@router.get("/pools/{pool_id}/overview", response_model=PoolOverviewResponse)
+def get_pool_overview(
+    pool_id: str,
+    limit: int = Query(
+        min(10, overview.OVERVIEW_STREAMS),
+        ge=1,
+        le=overview.OVERVIEW_STREAMS,
+    ),
+):
+    """
+    Returns a pool with its first streams, each with its drop count and
+    first drop, in one request. Served from a short-lived cache; use
+    `next_cursor` with `/pools/{pool_id}/streams` for further pages.
+    """
+    app_logger.info(f"Retrieving overview of pool {pool_id} (limit={limit})")
+    try:
+        pool_overview = overview.get_overview(pool_id)
+        if pool_overview is None:
+            raise HTTPException(status_code=404, detail="Pool not found")
+
+        streams = pool_overview["streams"][:limit]
+        has_more = len(pool_overview["streams"]) > limit
+        next_cursor = (
+            encode_cursor(streams[-1]["created_at"], streams[-1]["stream_id"])
+            if has_more
+            else None
+        )
+        return json_response(PoolOverviewResponse(
+            pool=pool_overview["pool"],
+            streams=streams,
+            total_count=pool_overview["total_count"],
+            has_more=has_more,
+            next_cursor=next_cursor,
+        ))
+    except HTTPException:
+        raise
+    except Exception as e:
+        app_logger.error(
+            "Failed to build overview of pool %s: %s", pool_id, e, exc_info=True
+        )
+        raise HTTPException(
+            status_code=500, detail="Failed to retrieve pool overview."
+        )
+
+
+@router.post("/pools:batchGet", response_model=PoolBatchResponse)
+def batch_get_pools(request: BatchGetRequest):
+    """
+    Retrieves up to 300 pools by ID with a single batched read. Pools are
+    returned in request order; unknown IDs are listed in `missing`.
+    """
+    app_logger.info(f"Batch retrieving {len(request.ids)} pools")
+    try:
+        found = get_many(pools_collection, request.ids)
+        ids = list(dict.fromkeys(request.ids))
+        return PoolBatchResponse(
+            pools=[found[pool_id] for pool_id in ids if pool_id in found],
+            missing=[pool_id for pool_id in ids if pool_id not in found],
+        )
+    except Exception as e:
+        app_logger.error(f"Failed to batch retrieve pools: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Failed to retrieve pools.")
@@ -0,0 +1,45 @@
+from typing import List, Optional
+
+from fastapi import APIRouter, HTTPException, Query
+
+from app.models import SearchHit, SearchResponse
+from app.search import search_index, KINDS
+from app.logger import app_logger
+
+router = APIRouter()
+
+
+@router.get("/search", response_model=SearchResponse)
+def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    kind: Optional[List[str]] = Query(None),
+    limit: int = Query(20, ge=1, le=100),
+):
+    """Full-text search over pools, streams and drops, ranked by BM25."""
+    app_logger.info(
+        "Searching for %r with kind=%s limit=%s", q, kind, limit
+    )
+    if kind:
+        unknown = set(kind) - set(KINDS)
+        if unknown:
+            raise HTTPException(
+                status_code=422,
+                detail=f"Unknown kind(s): {', '.join(sorted(unknown))}",
+            )
+    try:
+        results = search_index.search(q, kinds=kind, limit=limit)
+        hits = [
+            SearchHit(
+                kind=doc["kind"],
+                id=doc["id"],
+                title=doc.get("title"),
+                parent_id=doc.get("parent_id"),
+                score=round(score, 4),
+            )
+            for doc, score in results
+        ]
+        app_logger.info("Search for %r returned %s hits", q, len(hits))
+        return SearchResponse(hits=hits)
+    except Exception as e:
+        app_logger.error(f"Search for {q!r} failed: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Search failed.")
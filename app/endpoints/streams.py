@@ -1,6 +1,10 @@
-from fastapi import APIRouter, HTTPException, status, Body, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Body, Query
+from fastapi.responses import StreamingResponse
 from app.models import (
+    BatchGetRequest,
+    DeletionResponse,
     Stream,
+    StreamBatchResponse,
     StreamContent,
     Drop,
     DropContent,
@@ -9,21 +13,69 @@ from app.models import (
     GetDropsResponse,
     DropInStream,
     AddDropsResponse,
+    QueuedDropsResponse,
     StreamListResponse,
+    TrendingStream,
+    TrendingStreamsResponse,
+    drop_snippet,
 )
 from app.db import (
-    db, streams_collection, drops_collection,
-    stream_drops_collection, pools_collection
+    db, get_many, streams_collection, drops_collection,
+    stream_drops_collection, pools_collection, stream_pages_collection
 )
 from firebase_admin import firestore
 import datetime
+import time
 import uuid
-from typing import List, Optional, Union
+from typing import Dict, List, Optional, Union
 from app.logger import app_logger
+from app.cache import get_drops
+from app.search import search_index
+from app.counters import (
+    get_count, increment, pool_streams_key, stream_counter_keys, streams_key
+)
+from app.pagination import apply_cursor, encode_cursor
+from app.idempotency import IdempotentRequest, idempotency
+from app import (
+    consistency, deadlines, deletions, fields, ordering, overview,
+    stream_export, stream_pages, trending
+)
+from app.deadlines import RequestDeadlineExceeded, hedged
+from app.append_queue import sequencer
+from app.renumbering import renumberer
+from app.auth import get_current_user_id
+from app.responses import json_response
 
 
 router = APIRouter()
 
+MAX_BATCH_SIZE = 500
+
+# Each queued drop costs two writes (drop and queue entry) in one batch.
+MAX_ENQUEUED_DROPS = MAX_BATCH_SIZE // 2
+
+# Time kept in hand for building the response when a traversal is cut short.
+PARTIAL_PAGE_RESERVE = 0.5
+
+
+def _page_streams(query, limit, offset, cursor):
+    """Fetches one page of an ordered stream query (offset or cursor based)."""
+    ordered_query = apply_cursor(query, cursor)
+    if offset and not cursor:
+        ordered_query = ordered_query.offset(offset)
+
+    stream_docs = list(ordered_query.limit(limit + 1).stream())
+    has_more = len(stream_docs) > limit
+    streams = [Stream(**doc.to_dict()) for doc in stream_docs[:limit]]
+
+    next_offset = offset + len(streams) if has_more and not cursor else None
+    next_cursor = (
+        encode_cursor(streams[-1].created_at, streams[-1].stream_id)
+        if has_more
+        else None
+    )
+    return streams, has_more, next_offset, next_cursor
+
 
 @router.get(
     "/pools/{pool_id}/streams",
@@ -34,14 +86,20 @@ def list_streams_in_pool(
     limit: int = Query(20, ge=1, le=100),
     offset: int = Query(0, ge=0),
     creator_id: Optional[str] = Query(None),
+    cursor: Optional[str] = Query(None),
 ):
-    """Returns paginated streams inside a pool."""
+    """
+    Returns paginated streams inside a pool.
+    Pass `next_cursor` back as `cursor` to page without offset scans.
+    """
 
     app_logger.info(
-        "Listing streams for pool %s with limit=%s offset=%s creator_id=%s",
+        "Listing streams for pool %s with limit=%s offset=%s cursor=%s "
+        "creator_id=%s",
         pool_id,
         limit,
         offset,
+        cursor,
         creator_id,
     )
 
@@ -54,23 +112,17 @@ def list_streams_in_pool(
         if creator_id:
             query = query.where("creator_id", "==", creator_id)
 
-        total_count = len(list(query.stream()))
-
-        ordered_query = query.order_by("created_at")
-        if offset:
-            ordered_query = ordered_query.offset(offset)
-
-        stream_docs = ordered_query.limit(limit).stream()
-        streams = [Stream(**doc.to_dict()) for doc in stream_docs]
-
-        next_offset = offset + len(streams)
-        has_more = next_offset < total_count
+        total_count = get_count(pool_streams_key(pool_id, creator_id), query)
+        streams, has_more, next_offset, next_cursor = _page_streams(
+            query, limit, offset, cursor
+        )
 
         return StreamListResponse(
             streams=streams,
             total_count=total_count,
             has_more=has_more,
-            next_offset=next_offset if has_more else None,
+            next_offset=next_offset,
+            next_cursor=next_cursor,
         )
     except HTTPException:
         raise
@@ -81,6 +133,50 @@ def list_streams_in_pool(
         raise HTTPException(status_code=500, detail="Failed to list streams.")
 
 
+@router.get("/streams", response_model=StreamListResponse)
+def discover_streams(
+    category: Optional[str] = Query(None),
+    creator_id: Optional[str] = Query(None),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None),
+):
+    """
+    Returns streams across all pools by category and/or creator, oldest
+    first, using cursor pagination and precomputed counts.
+    """
+    app_logger.info(
+        "Discovering streams with category=%s creator_id=%s limit=%s "
+        "cursor=%s",
+        category,
+        creator_id,
+        limit,
+        cursor,
+    )
+    try:
+        query = streams_collection
+        if category:
+            query = query.where("content.category", "==", category)
+        if creator_id:
+            query = query.where("creator_id", "==", creator_id)
+
+        total_count = get_count(streams_key(category, creator_id), query)
+        streams, has_more, _, next_cursor = _page_streams(
+            query, limit, 0, cursor
+        )
+
+        return StreamListResponse(
+            streams=streams,
+            total_count=total_count,
+            has_more=has_more,
+            next_cursor=next_cursor,
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        app_logger.error("Failed discovering streams: %s", e, exc_info=True)
+        raise HTTPException(status_code=500, detail="Failed to list streams.")
+
+
 @router.post(
     "/streams",
     status_code=status.HTTP_201_CREATED,
@@ -89,12 +185,17 @@ def list_streams_in_pool(
 def create_stream(
     stream_content: StreamContent,
     pool_id: str = Body(..., example="pool_123"),
-    creator_id: str = Body(..., example="user_xyz")
+    creator_id: str = Body(..., example="user_xyz"),
+    idempotent_request: IdempotentRequest = Depends(idempotency),
 ):
     """
-    Creates a new stream in Firestore.
+    Creates a new stream in Firestore. Retries carrying the same
+    Idempotency-Key header return the original response.
     """
     app_logger.info(f"Attempting to create stream in pool {pool_id}")
+    replayed = idempotent_request.replay()
+    if replayed is not None:
+        return replayed
     try:
         # Check if the pool exists
         pool_doc = pools_collection.document(pool_id).get()
@@ -112,17 +213,36 @@ def create_stream(
             created_at=datetime.datetime.utcnow(),
             content=stream_content,
             first_drop_placement_id=None,
-            last_drop_placement_id=None
+            last_drop_placement_id=None,
+            drop_count=0,
+            version=1
         )
         
-        streams_collection.document(stream_id).set(new_stream.dict())
+        batch = db.batch()
+        batch.set(streams_collection.document(stream_id), new_stream.dict())
+        batch.set(
+            stream_pages_collection.document(stream_id),
+            stream_pages.empty_page(stream_id)
+        )
+        increment(batch, stream_counter_keys(new_stream.dict()))
+        write_results = batch.commit()
+        # The pool's version is the commit time (see app/consistency.py).
+        consistency.record_write(
+            pool_id,
+            consistency.timestamp_version(write_results[0].update_time),
+        )
+        consistency.record_write(stream_id, new_stream.version)
+        search_index.add_stream(new_stream.dict())
+        overview.invalidate_pool(pool_id)
         app_logger.info(
             "Successfully created stream %s in pool %s",
             stream_id,
             pool_id,
         )
+        idempotent_request.save(new_stream)
         return new_stream
     except Exception as e:
+        idempotent_request.release()
         app_logger.error(
             "Failed to create stream in pool %s: %s",
             pool_id,
@@ -134,6 +254,56 @@ def create_stream(
         raise HTTPException(status_code=500, detail="Failed to create stream.")
 
 
+@router.post("/streams:batchGet", response_model=StreamBatchResponse)
+def batch_get_streams(request: BatchGetRequest):
+    """
+    Retrieves up to 300 streams by ID with a single batched read. Streams
+    are returned in request order; unknown IDs are listed in `missing`.
+    """
+    app_logger.info(f"Batch retrieving {len(request.ids)} streams")
+    try:
+        found = get_many(streams_collection, request.ids)
+        ids = list(dict.fromkeys(request.ids))
+        return json_response(StreamBatchResponse(
+            streams=[
+                found[stream_id] for stream_id in ids if stream_id in found
+            ],
+            missing=[
+                stream_id for stream_id in ids if stream_id not in found
+            ],
+        ))
+    except Exception as e:
+        app_logger.error(
+            f"Failed to batch retrieve streams: {e}", exc_info=True
+        )
+        raise HTTPException(
+            status_code=500, detail="Failed to retrieve streams."
+        )
+
+
+@router.get("/streams/trending", response_model=TrendingStreamsResponse)
+def get_trending_streams(
+    limit: int = Query(10, ge=1, le=trending.CANDIDATES),
+):
+    """
+    Returns the most read streams of the last day or so, most trending
+    first. Refreshed every TRENDING_FLUSH_SECONDS.
+    """
+    app_logger.info(f"Retrieving {limit} trending streams")
+    try:
+        return TrendingStreamsResponse(streams=[
+            TrendingStream(**stream, score=round(score, 3))
+            for stream, score in trending.read_tracker.trending(limit)
+        ])
+    except Exception as e:
+        app_logger.error(
+            f"Failed to retrieve trending streams: {e}", exc_info=True
+        )
+        raise HTTPException(
+            status_code=500, detail="Failed to retrieve trending streams."
+        )
+
+
 @router.get("/streams/{stream_id}", response_model=Stream)
 def get_stream(stream_id: str):
     """
@@ -144,8 +314,9 @@ def get_stream(stream_id: str):
         doc = streams_collection.document(stream_id).get()
         if not doc.exists:
             raise HTTPException(status_code=404, detail="Stream not found")
+        trending.read_tracker.record("streams", stream_id)
         app_logger.info(f"Successfully retrieved stream {stream_id}")
-        return doc.to_dict()
+        return json_response(Stream(**doc.to_dict()))
     except Exception as e:
         app_logger.error(
             "Failed to retrieve stream %s: %s",
@@ -161,56 +332,98 @@ def get_stream(stream_id: str):
         )
 
 
-def _add_drops_transactional(transaction, stream_id, drops, creator_id):
+@router.delete(
+    "/streams/{stream_id}",
+    status_code=status.HTTP_202_ACCEPTED,
+    response_model=DeletionResponse
+)
+def delete_stream(
+    stream_id: str, user_id: str = Depends(get_current_user_id)
+):
     """
-    This function runs within a Firestore transaction to add drops to a stream.
+    Deletes a stream and, in the background, its placements, the drops not
+    placed in other streams and its reading history. The stream is gone
+    immediately. Only the stream's creator may delete it.
     """
-    stream_ref = streams_collection.document(stream_id)
-    stream_doc = stream_ref.get(transaction=transaction)
+    app_logger.info(f"User {user_id} attempting to delete stream {stream_id}")
+    try:
+        tombstone = deletions.delete("stream", stream_id, user_id)
+        if tombstone is None:
+            raise HTTPException(status_code=404, detail="Stream not found")
+        app_logger.info(f"Deleted stream {stream_id}; cleanup scheduled")
+        return tombstone
+    except deletions.NotCreator:
+        app_logger.warning(
+            f"User {user_id} may not delete stream {stream_id}: "
+            "not its creator"
+        )
+        raise HTTPException(
+            status_code=403, detail="Only the stream's creator can delete it"
+        )
+    except Exception as e:
+        app_logger.error(
+            "Failed to delete stream %s: %s",
+            stream_id,
+            e,
+            exc_info=True,
+        )
+        if isinstance(e, HTTPException):
+            raise
+        raise HTTPException(status_code=500, detail="Failed to delete stream.")
 
-    if not stream_doc.exists:
-        # This will cause the transaction to fail and roll back.
-        raise HTTPException(status_code=404, detail="Stream not found")
 
-    stream_data = stream_doc.to_dict()
+def _has_order_keys(stream_data: dict) -> bool:
+    """Whether every placement of the stream carries an order key."""
+    return 'last_order_key' in stream_data
 
-    if not isinstance(drops, list):
-        drops = [drops]
 
+def _link_drops_transactional(
+    transaction, stream_ref, stream_data, page_data, drops
+):
+    """
+    Appends already-persisted drops to the tail of a stream's linked list
+    and refreshes the stream's page snapshot.
+    Must be called inside a transaction after all reads have been made.
+    """
+    stream_id = stream_ref.id
     added_drops = []
+    page_entries = []
     prev_placement_id = stream_data.get('last_drop_placement_id')
+    placement_ids = [str(uuid.uuid4()) for _ in drops]
+    # Ordinals are 1-based positions; streams without a drop count yet get
+    # them when the chain repair job backfills the count.
+    base_ordinal = stream_data.get('drop_count')
+    # Likewise for order keys: streams created before them get keys from
+    # the repair job and are read by walking the chain until then.
+    order_keys = (
+        ordering.keys_between(stream_data['last_order_key'], None, len(drops))
+        if _has_order_keys(stream_data)
+        else [None] * len(drops)
+    )
 
     first_pointer_set = bool(stream_data.get('first_drop_placement_id'))
 
-    for drop_content in drops:
-        # 1. Create the new drop
-        drop_id = str(uuid.uuid4())
-        new_drop = Drop(
-            drop_id=drop_id,
-            creator_id=creator_id,
-            created_at=datetime.datetime.utcnow(),
-            content=drop_content
-        )
-        drops_collection.document(drop_id).set(
-            new_drop.dict()
-        )
-
-        # 2. Create the stream-drop placement
-        placement_id = str(uuid.uuid4())
+    for i, drop in enumerate(drops):
+        # 1. Create the stream-drop placement
+        placement_id = placement_ids[i]
+        ordinal = base_ordinal + i + 1 if base_ordinal is not None else None
 
         new_placement = StreamDropPlacement(
             placement_id=placement_id,
             stream_id=stream_id,
-            drop_id=drop_id,
+            drop_id=drop.drop_id,
             next_placement_id=None,
             prev_placement_id=prev_placement_id,
+            ordinal=ordinal,
+            order_key=order_keys[i],
             added_at=datetime.datetime.utcnow()
         )
-        stream_drops_collection.document(placement_id).set(
+        transaction.set(
+            stream_drops_collection.document(placement_id),
             new_placement.dict()
         )
 
-        # 3. Update the previous placement's next_placement_id
+        # 2. Update the previous placement's next_placement_id
         if prev_placement_id:
             prev_placement_ref = stream_drops_collection.document(
                 prev_placement_id
@@ -219,7 +432,7 @@ def _add_drops_transactional(transaction, stream_id, drops, creator_id):
                 prev_placement_ref, {'next_placement_id': placement_id}
             )
 
-        # 4. Update the stream's head and tail pointers
+        # 3. Update the stream's head and tail pointers
         update_data = {'last_drop_placement_id': placement_id}
         if not first_pointer_set:
             update_data['first_drop_placement_id'] = placement_id
@@ -230,7 +443,7 @@ def _add_drops_transactional(transaction, stream_id, drops, creator_id):
 
         # This data is returned after the transaction commits.
         added_drops.append(AddDropResponse(
-            **new_drop.dict(),
+            **drop.dict(),
             placement_id=placement_id,
             stream_id=stream_id,
             position_info={
@@ -238,11 +451,376 @@ def _add_drops_transactional(transaction, stream_id, drops, creator_id):
                 "prev_placement_id": prev_placement_id
             }
         ))
+        page_entries.append(DropInStream(
+            **drop.dict(),
+            placement_id=placement_id,
+            next_placement_id=(
+                placement_ids[i + 1] if i + 1 < len(drops) else None
+            ),
+            prev_placement_id=prev_placement_id,
+            ordinal=ordinal
+        ).dict())
         prev_placement_id = placement_id
-    
+
+    stream_data['last_drop_placement_id'] = prev_placement_id
+    if order_keys[-1] is not None:
+        stream_data['last_order_key'] = order_keys[-1]
+        transaction.update(stream_ref, {'last_order_key': order_keys[-1]})
+
+    # 4. Maintain the drop count and the head/tail page snapshot. Streams
+    # that predate both are left for the chain repair job to backfill.
+    if stream_data.get('drop_count') is not None:
+        stream_data['drop_count'] += len(drops)
+        transaction.update(
+            stream_ref, {'drop_count': stream_data['drop_count']}
+        )
+    if page_data is not None:
+        transaction.set(
+            stream_pages_collection.document(stream_id),
+            stream_pages.append_entries(page_data, page_entries)
+        )
+
+    # 5. Bump the stream's version for caches and consistency tokens.
+    stream_data['version'] = consistency.next_version(stream_data)
+    transaction.update(stream_ref, {'version': stream_data['version']})
+    consistency.record_write(stream_id, stream_data['version'])
+
     return added_drops
 
 
+def _get_stream_for_update(transaction, stream_id):
+    """Reads a stream and its page snapshot inside a transaction."""
+    stream_ref = streams_collection.document(stream_id)
+    page_ref = stream_pages_collection.document(stream_id)
+    docs = {
+        doc.reference.path: doc
+        for doc in db.get_all([stream_ref, page_ref], transaction=transaction)
+    }
+    stream_doc = docs[stream_ref.path]
+
+    if not stream_doc.exists:
+        # This will cause the transaction to fail and roll back.
+        raise HTTPException(status_code=404, detail="Stream not found")
+
+    page_doc = docs[page_ref.path]
+    page_data = page_doc.to_dict() if page_doc.exists else None
+    return stream_ref, stream_doc.to_dict(), page_data
+
+
+def _with_snippet(drop_content: DropContent) -> DropContent:
+    """The content as stored: the snippet is computed, never taken as sent."""
+    return drop_content.model_copy(
+        update={"snippet": drop_snippet(drop_content.text)}
+    )
+
+
+def _add_drops_transactional(transaction, stream_id, drops, creator_id):
+    """
+    This function runs within a Firestore transaction to add drops to a stream.
+    """
+    stream_ref, stream_data, page_data = _get_stream_for_update(
+        transaction, stream_id
+    )
+
+    if not isinstance(drops, list):
+        drops = [drops]
+
+    new_drops = []
+    for drop_content in drops:
+        drop_id = str(uuid.uuid4())
+        new_drop = Drop(
+            drop_id=drop_id,
+            creator_id=creator_id,
+            created_at=datetime.datetime.utcnow(),
+            content=_with_snippet(drop_content)
+        )
+        transaction.set(
+            drops_collection.document(drop_id), new_drop.dict()
+        )
+        new_drops.append(new_drop)
+
+    return _link_drops_transactional(
+        transaction, stream_ref, stream_data, page_data, new_drops
+    )
+
+
+def _read_placements(transaction, stream_id, placement_ids):
+    """
+    Reads placements of a stream inside a transaction, keyed by ID. Raises
+    404 if one doesn't exist or belongs to another stream.
+    """
+    refs = [
+        stream_drops_collection.document(placement_id)
+        for placement_id in dict.fromkeys(placement_ids)
+        if placement_id
+    ]
+    placements = {}
+    for doc in db.get_all(refs, transaction=transaction):
+        placement = doc.to_dict() if doc.exists else None
+        if placement is None or placement.get('stream_id') != stream_id:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Placement {doc.id} not found in stream {stream_id}",
+            )
+        placements[doc.id] = placement
+    return placements
+
+
+def _resolve_gap(stream_data, placements, after_placement_id,
+                 before_placement_id):
+    """
+    Returns the (prev, next) placement IDs around the requested position:
+    after one placement, before another, or (neither) at the end.
+    """
+    if after_placement_id and before_placement_id:
+        raise HTTPException(
+            status_code=422,
+            detail="Give after_placement_id or before_placement_id, not both",
+        )
+    if after_placement_id:
+        anchor = placements[after_placement_id]
+        return after_placement_id, anchor.get('next_placement_id')
+    if before_placement_id:
+        anchor = placements[before_placement_id]
+        return anchor.get('prev_placement_id'), before_placement_id
+    return stream_data.get('last_drop_placement_id'), None
+
+
+def _require_order_keys(stream_data):
+    if not _has_order_keys(stream_data):
+        raise HTTPException(
+            status_code=409,
+            detail=(
+                "Stream has no order keys yet; run the chain repair job "
+                "before inserting, moving or removing drops"
+            ),
+        )
+
+
+class _ChainEdit:
+    """
+    Collects the pointer changes of an insert, move or removal so that each
+    document is written once, then applies them in the transaction.
+    """
+
+    def __init__(self):
+        self.stream_update = {}
+        self.placement_updates: Dict[str, dict] = {}
+
+    def update(self, placement_id, **fields):
+        self.placement_updates.setdefault(placement_id, {}).update(fields)
+
+    def link(self, prev_id, next_id):
+        """Makes `next_id` follow `prev_id` (None for the stream's ends)."""
+        if prev_id:
+            self.update(prev_id, next_placement_id=next_id)
+        else:
+            self.stream_update['first_drop_placement_id'] = next_id
+        if next_id:
+            self.update(next_id, prev_placement_id=prev_id)
+        else:
+            self.stream_update['last_drop_placement_id'] = prev_id
+
+    def apply(self, transaction, stream_ref, stream_data, skip=()):
+        for placement_id, update in self.placement_updates.items():
+            if placement_id not in skip:
+                transaction.update(
+                    stream_drops_collection.document(placement_id), update
+                )
+        self.stream_update['version'] = consistency.next_version(stream_data)
+        transaction.update(stream_ref, self.stream_update)
+        consistency.record_write(stream_ref.id, self.stream_update['version'])
+        # The snapshot is rebuilt from the order keys after the commit;
+        # until then pages are read with a range query.
+        transaction.delete(stream_pages_collection.document(stream_ref.id))
+
+
+def _place_drops_transactional(
+    transaction, stream_id, drops, after_placement_id=None,
+    before_placement_id=None
+):
+    """
+    Runs within a Firestore transaction to place existing drops in a stream,
+    at the end or next to an existing placement. The drop documents
+    themselves are never rewritten.
+    Returns the added drops and, for inserts before the end, the order key
+    after which the following placements must be renumbered.
+    """
+    stream_ref, stream_data, page_data = _get_stream_for_update(
+        transaction, stream_id
+    )
+    placements = _read_placements(
+        transaction, stream_id, [after_placement_id, before_placement_id]
+    )
+    prev_id, next_id = _resolve_gap(
+        stream_data, placements, after_placement_id, before_placement_id
+    )
+    if next_id is None:
+        added_drops = _link_drops_transactional(
+            transaction, stream_ref, stream_data, page_data, drops
+        )
+        return added_drops, None
+
+    _require_order_keys(stream_data)
+    placements.update(_read_placements(
+        transaction, stream_id,
+        [i for i in (prev_id, next_id) if i not in placements],
+    ))
+    prev = placements.get(prev_id, {})
+    order_keys = ordering.keys_between(
+        prev.get('order_key'), placements[next_id]['order_key'], len(drops)
+    )
+    first_ordinal = (prev.get('ordinal') or 0) + 1
+
+    edit = _ChainEdit()
+    placement_ids = [str(uuid.uuid4()) for _ in drops]
+    chain = [prev_id] + placement_ids + [next_id]
+    added_drops = []
+    for i, drop in enumerate(drops):
+        placement_id = placement_ids[i]
+        transaction.set(
+            stream_drops_collection.document(placement_id),
+            StreamDropPlacement(
+                placement_id=placement_id,
+                stream_id=stream_id,
+                drop_id=drop.drop_id,
+                next_placement_id=chain[i + 2],
+                prev_placement_id=chain[i],
+                ordinal=first_ordinal + i,
+                order_key=order_keys[i],
+                added_at=datetime.datetime.utcnow(),
+            ).dict()
+        )
+        added_drops.append(AddDropResponse(
+            **drop.dict(),
+            placement_id=placement_id,
+            stream_id=stream_id,
+            position_info={
+                "next_placement_id": chain[i + 2],
+                "prev_placement_id": chain[i],
+            }
+        ))
+    edit.link(prev_id, placement_ids[0])
+    edit.link(placement_ids[-1], next_id)
+    edit.stream_update['drop_count'] = (
+        stream_data.get('drop_count') or 0
+    ) + len(drops)
+    edit.apply(transaction, stream_ref, stream_data, skip=placement_ids)
+    return added_drops, order_keys[-1]
+
+
+def _move_placement_transactional(
+    transaction, stream_id, placement_id, after_placement_id,
+    before_placement_id
+):
+    """
+    Runs within a Firestore transaction to move a placement next to another
+    one (or to the end). Returns the moved placement and the range of order
+    keys to renumber, or None if it was already there.
+    """
+    if placement_id in (after_placement_id, before_placement_id):
+        raise HTTPException(
+            status_code=422,
+            detail="A placement can't be moved next to itself",
+        )
+    stream_ref, stream_data, _ = _get_stream_for_update(
+        transaction, stream_id
+    )
+    _require_order_keys(stream_data)
+    placements = _read_placements(
+        transaction, stream_id,
+        [placement_id, after_placement_id, before_placement_id],
+    )
+    moved = placements[placement_id]
+    prev_id, next_id = _resolve_gap(
+        stream_data, placements, after_placement_id, before_placement_id
+    )
+    old_prev_id = moved.get('prev_placement_id')
+    old_next_id = moved.get('next_placement_id')
+    if placement_id in (prev_id, next_id) or (
+        prev_id == old_prev_id and next_id == old_next_id
+    ):
+        return StreamDropPlacement(**moved), None
+
+    placements.update(_read_placements(
+        transaction, stream_id,
+        [
+            i for i in (prev_id, next_id, old_prev_id, old_next_id)
+            if i not in placements
+        ],
+    ))
+    # Bounds of the new gap once the placement has left its old one.
+    prev = placements.get(prev_id, {})
+    next_key = placements[next_id]['order_key'] if next_id else None
+    old_key = moved['order_key']
+    order_key = ordering.key_between(prev.get('order_key'), next_key)
+
+    prev_ordinal = prev.get('ordinal') or 0
+    if order_key > old_key:
+        # Moving towards the end: the placements in between move up one.
+        ordinal = prev_ordinal
+        renumber = (old_key, next_key)
+    else:
+        ordinal = prev_ordinal + 1
+        renumber = (prev.get('order_key'), old_key)
+
+    edit = _ChainEdit()
+    edit.link(old_prev_id, old_next_id)
+    edit.link(prev_id, placement_id)
+    edit.link(placement_id, next_id)
+    edit.update(placement_id, order_key=order_key, ordinal=ordinal)
+    if next_id is None:
+        edit.stream_update['last_order_key'] = order_key
+    elif old_next_id is None:
+        edit.stream_update['last_order_key'] = (
+            placements[old_prev_id]['order_key']
+        )
+    edit.apply(transaction, stream_ref, stream_data)
+
+    moved.update(edit.placement_updates[placement_id])
+    return StreamDropPlacement(**moved), renumber
+
+
+def _remove_placement_transactional(transaction, stream_id, placement_id):
+    """
+    Runs within a Firestore transaction to unlink and delete a placement.
+    The drop itself is kept. Returns the order key after which the
+    following placements must be renumbered.
+    """
+    stream_ref, stream_data, _ = _get_stream_for_update(
+        transaction, stream_id
+    )
+    _require_order_keys(stream_data)
+    placements = _read_placements(transaction, stream_id, [placement_id])
+    removed = placements[placement_id]
+    prev_id = removed.get('prev_placement_id')
+    next_id = removed.get('next_placement_id')
+    placements.update(_read_placements(transaction, stream_id, [prev_id]))
+
+    edit = _ChainEdit()
+    edit.link(prev_id, next_id)
+    edit.stream_update['drop_count'] = max(
+        0, (stream_data.get('drop_count') or 0) - 1
+    )
+    if next_id is None:
+        edit.stream_update['last_order_key'] = (
+            placements[prev_id]['order_key'] if prev_id else None
+        )
+    transaction.delete(stream_drops_collection.document(placement_id))
+    edit.apply(transaction, stream_ref, stream_data)
+    return removed['order_key']
+
+
+def _after_reorder(stream_id, after_key, before_key=None):
+    """
+    Brings the page snapshot and caches up to date and queues the
+    renumbering of the ordinals between the two order keys.
+    """
+    renumberer.enqueue(stream_id, after_key, before_key)
+    stream_pages.refresh_page(stream_id)
+    overview.invalidate_stream(stream_id)
+
+
 @router.post(
     "/streams/{stream_id}/drops",
     status_code=status.HTTP_201_CREATED,
@@ -251,15 +829,21 @@ def _add_drops_transactional(transaction, stream_id, drops, creator_id):
 def add_drop_to_stream(
     stream_id: str,
     drops: Union[DropContent, List[DropContent]],
-    creator_id: str = Body(..., example="user_xyz")
+    creator_id: str = Body(..., example="user_xyz"),
+    idempotent_request: IdempotentRequest = Depends(idempotency),
 ):
     """
     Adds one or more drops to a stream. This is a transactional operation.
+    Retries carrying the same Idempotency-Key header return the original
+    response instead of appending the drops again.
     """
     num_drops = len(drops) if isinstance(drops, list) else 1
     app_logger.info(
         f"Attempting to add {num_drops} drop(s) to stream {stream_id}"
     )
+    replayed = idempotent_request.replay()
+    if replayed is not None:
+        return replayed
     try:
         @firestore.transactional
         def transactional_add(transaction):
@@ -269,18 +853,24 @@ def add_drop_to_stream(
         
         transaction = db.transaction()
         added_drops = transactional_add(transaction)
+        overview.invalidate_stream(stream_id)
+        for added_drop in added_drops:
+            search_index.add_drop(added_drop.dict())
 
         if len(added_drops) == 1:
             app_logger.info(f"Successfully added 1 drop to stream {stream_id}")
-            return added_drops[0]
+            response = added_drops[0]
         else:
             app_logger.info(
                 "Successfully added %s drops to stream %s",
                 len(added_drops),
                 stream_id,
             )
-            return AddDropsResponse(drops=added_drops)
+            response = AddDropsResponse(drops=added_drops)
+        idempotent_request.save(response)
+        return response
     except Exception as e:
+        idempotent_request.release()
         # The transactional function raises an exception if the stream is not
         # found. We catch it and re-raise as a standard HTTPException.
         app_logger.error(
@@ -289,16 +879,389 @@ def add_drop_to_stream(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _link_queued_drops(stream_id, entry_refs):
+    """
+    Links a batch of queued drops (see app/append_queue.py) into the stream
+    in one transaction and deletes their queue entries.
+    """
+    @firestore.transactional
+    def transactional_link(transaction):
+        stream_ref, stream_data, page_data = _get_stream_for_update(
+            transaction, stream_id
+        )
+        entries = sorted(
+            (
+                doc
+                for doc in db.get_all(entry_refs, transaction=transaction)
+                if doc.exists
+            ),
+            key=lambda doc: doc.id,
+        )
+        drops = [Drop(**doc.to_dict()['drop']) for doc in entries]
+        added_drops = []
+        if drops:
+            added_drops = _link_drops_transactional(
+                transaction, stream_ref, stream_data, page_data, drops
+            )
+        for doc in entries:
+            transaction.delete(doc.reference)
+        return added_drops
+
+    try:
+        added_drops = transactional_link(db.transaction())
+    except HTTPException as e:
+        if e.status_code != 404:
+            raise
+        # The stream is gone; its queued drops have nowhere to go.
+        batch = db.batch()
+        for doc in db.get_all(entry_refs):
+            if doc.exists:
+                batch.delete(doc.reference)
+                batch.delete(
+                    drops_collection.document(doc.to_dict()['drop']['drop_id'])
+                )
+        batch.commit()
+        app_logger.warning(
+            "Discarded %s queued drops of missing stream %s",
+            len(entry_refs),
+            stream_id,
+        )
+        return 0
+
+    overview.invalidate_stream(stream_id)
+    for added_drop in added_drops:
+        search_index.add_drop(added_drop.dict())
+    app_logger.info(
+        "Linked %s queued drops into stream %s", len(added_drops), stream_id
+    )
+    return len(added_drops)
+
+
+sequencer.link_batch = _link_queued_drops
+
+
+@router.post(
+    "/streams/{stream_id}/drops:enqueue",
+    status_code=status.HTTP_202_ACCEPTED,
+    response_model=QueuedDropsResponse
+)
+def enqueue_drops(
+    stream_id: str,
+    drops: Union[DropContent, List[DropContent]],
+    creator_id: str = Body(..., example="user_xyz"),
+    idempotent_request: IdempotentRequest = Depends(idempotency),
+):
+    """
+    Saves drops and queues them for appending to a stream. For streams with
+    many concurrent writers: no transaction and no write to the stream
+    document; a per-stream sequencer links queued drops in batches.
+    """
+    if not isinstance(drops, list):
+        drops = [drops]
+    app_logger.info(
+        f"Attempting to queue {len(drops)} drop(s) for stream {stream_id}"
+    )
+    replayed = idempotent_request.replay()
+    if replayed is not None:
+        return replayed
+    try:
+        if len(drops) > MAX_ENQUEUED_DROPS:
+            raise HTTPException(
+                status_code=422,
+                detail=(
+                    f"At most {MAX_ENQUEUED_DROPS} drops can be queued at once"
+                ),
+            )
+        if not streams_collection.document(stream_id).get().exists:
+            raise HTTPException(status_code=404, detail="Stream not found")
+
+        new_drops = [
+            Drop(
+                drop_id=str(uuid.uuid4()),
+                creator_id=creator_id,
+                created_at=datetime.datetime.utcnow(),
+                content=_with_snippet(drop_content)
+            )
+            for drop_content in drops
+        ]
+        batch = db.batch()
+        for new_drop in new_drops:
+            batch.set(
+                drops_collection.document(new_drop.drop_id), new_drop.dict()
+            )
+        sequencer.enqueue(
+            batch, stream_id, [new_drop.dict() for new_drop in new_drops]
+        )
+        batch.commit()
+        sequencer.notify(stream_id)
+
+        app_logger.info(
+            "Queued %s drops for stream %s", len(new_drops), stream_id
+        )
+        response = QueuedDropsResponse(stream_id=stream_id, drops=new_drops)
+        idempotent_request.save(response, status_code=202)
+        return response
+    except Exception as e:
+        idempotent_request.release()
+        app_logger.error(
+            "Failed to queue drops for stream %s: %s",
+            stream_id,
+            e,
+            exc_info=True,
+        )
+        if isinstance(e, HTTPException):
+            raise
+        raise HTTPException(status_code=500, detail="Failed to queue drops.")
+
+
+@router.post(
+    "/streams/{stream_id}/placements",
+    status_code=status.HTTP_201_CREATED,
+    response_model=AddDropsResponse
+)
+def place_drops_in_stream(
+    stream_id: str,
+    drop_ids: List[str] = Body(
+        ..., embed=True, min_length=1, max_length=100,
+        example=["drop_abc", "drop_def"]
+    ),
+    after_placement_id: Optional[str] = Body(None, example="placement_789"),
+    before_placement_id: Optional[str] = Body(None, example=None),
+):
+    """
+    Places existing drops in a stream without duplicating their content:
+    at the end, or right after/before an existing placement.
+    All drop IDs are validated with a single batched read before linking.
+    """
+    app_logger.info(
+        "Attempting to place %s existing drop(s) in stream %s",
+        len(drop_ids),
+        stream_id,
+    )
+    try:
+        found = get_drops(drop_ids)
+        missing = [drop_id for drop_id in drop_ids if drop_id not in found]
+        if missing:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Drops not found: {', '.join(missing)}",
+            )
+
+        drops = [Drop(**found[drop_id]) for drop_id in drop_ids]
+
+        @firestore.transactional
+        def transactional_place(transaction):
+            return _place_drops_transactional(
+                transaction, stream_id, drops,
+                after_placement_id, before_placement_id,
+            )
+
+        placed_drops, renumber = transactional_place(db.transaction())
+        if renumber is not None:
+            _after_reorder(stream_id, renumber)
+        else:
+            overview.invalidate_stream(stream_id)
+        app_logger.info(
+            "Successfully placed %s drops in stream %s",
+            len(placed_drops),
+            stream_id,
+        )
+        return AddDropsResponse(drops=placed_drops)
+    except Exception as e:
+        app_logger.error(
+            "Failed to place drops in stream %s: %s",
+            stream_id,
+            e,
+            exc_info=True,
+        )
+        if isinstance(e, HTTPException):
+            raise
+        raise HTTPException(status_code=500, detail="Failed to place drops.")
+
+
+@router.post(
+    "/streams/{stream_id}/placements/{placement_id}:move",
+    response_model=StreamDropPlacement
+)
+def move_placement(
+    stream_id: str,
+    placement_id: str,
+    after_placement_id: Optional[str] = Body(
+        None, embed=True, example="placement_789"
+    ),
+    before_placement_id: Optional[str] = Body(None, embed=True, example=None),
+):
+    """
+    Moves a drop within a stream, right after or before another placement,
+    or to the end if neither is given. Only the placement and its old and
+    new neighbours are rewritten; it gets an order key between the new
+    neighbours' keys.
+    """
+    app_logger.info(
+        "Attempting to move placement %s in stream %s",
+        placement_id,
+        stream_id,
+    )
+    try:
+        @firestore.transactional
+        def transactional_move(transaction):
+            return _move_placement_transactional(
+                transaction, stream_id, placement_id,
+                after_placement_id, before_placement_id,
+            )
+
+        placement, renumber = transactional_move(db.transaction())
+        if renumber is not None:
+            _after_reorder(stream_id, *renumber)
+        app_logger.info(
+            "Successfully moved placement %s in stream %s",
+            placement_id,
+            stream_id,
+        )
+        return placement
+    except Exception as e:
+        app_logger.error(
+            "Failed to move placement %s in stream %s: %s",
+            placement_id,
+            stream_id,
+            e,
+            exc_info=True,
+        )
+        if isinstance(e, HTTPException):
+            raise
+        raise HTTPException(status_code=500, detail="Failed to move drop.")
+
+
+@router.delete(
+    "/streams/{stream_id}/placements/{placement_id}",
+    status_code=status.HTTP_204_NO_CONTENT
+)
+def remove_placement(stream_id: str, placement_id: str):
+    """
+    Removes a drop from a stream. The drop itself and its placements in
+    other streams are kept.
+    """
+    app_logger.info(
+        "Attempting to remove placement %s from stream %s",
+        placement_id,
+        stream_id,
+    )
+    try:
+        @firestore.transactional
+        def transactional_remove(transaction):
+            return _remove_placement_transactional(
+                transaction, stream_id, placement_id
+            )
+
+        order_key = transactional_remove(db.transaction())
+        _after_reorder(stream_id, order_key)
+        app_logger.info(
+            "Successfully removed placement %s from stream %s",
+            placement_id,
+            stream_id,
+        )
+    except Exception as e:
+        app_logger.error(
+            "Failed to remove placement %s from stream %s: %s",
+            placement_id,
+            stream_id,
+            e,
+            exc_info=True,
+        )
+        if isinstance(e, HTTPException):
+            raise
+        raise HTTPException(status_code=500, detail="Failed to remove drop.")
+
+
+def _get_drops_by_order_key(stream_id, stream_data, from_placement_id, limit):
+    """
+    Reads a page of a stream with order keys: one range query over its
+    placements ordered by order_key, plus one batched read of the drops.
+    """
+    query = stream_drops_collection.where('stream_id', '==', stream_id)
+    if from_placement_id:
+        start_doc = hedged(
+            "placement",
+            stream_drops_collection.document(from_placement_id).get,
+        )
+        start = start_doc.to_dict() if start_doc.exists else None
+        if start is None or start.get('stream_id') != stream_id:
+            app_logger.warning(
+                f"Placement {from_placement_id} not found in stream {stream_id}"
+            )
+            return GetDropsResponse(
+                drops=[], has_more=False, total_count=stream_data['drop_count']
+            )
+        query = query.where(
+            'order_key', '>=' if limit > 0 else '<=', start['order_key']
+        )
+    query = query.order_by(
+        'order_key',
+        direction=(
+            firestore.Query.ASCENDING if limit > 0
+            else firestore.Query.DESCENDING
+        ),
+    ).limit(abs(limit) + 1)
+
+    placements = [
+        doc.to_dict()
+        for doc in hedged("placement_range", lambda: list(query.stream()))
+    ]
+    has_more = len(placements) > abs(limit)
+    placements = placements[:abs(limit)]
+    drops = get_drops(placement['drop_id'] for placement in placements)
+    drops_list = [
+        DropInStream(
+            **drops[placement['drop_id']],
+            placement_id=placement['placement_id'],
+            next_placement_id=placement.get('next_placement_id'),
+            prev_placement_id=placement.get('prev_placement_id'),
+            ordinal=placement.get('ordinal')
+        )
+        for placement in placements
+        if placement['drop_id'] in drops
+    ]
+    app_logger.info(
+        "Successfully retrieved %s drops for stream %s by order key",
+        len(drops_list),
+        stream_id,
+    )
+    return GetDropsResponse(
+        drops=drops_list,
+        has_more=has_more,
+        total_count=stream_data['drop_count'],
+    )
+
+
+def _counted(stream_id, response, drop_fields=None):
+    """
+    Counts a served page as a read of the stream and of its drops, and
+    returns it with the selected drop fields.
+    """
+    trending.read_tracker.record("streams", stream_id)
+    for drop in response.drops:
+        trending.read_tracker.record("drops", drop.drop_id)
+    return fields.select(response, drop_fields, "drops")
+
+
 @router.get("/streams/{stream_id}/drops", response_model=GetDropsResponse)
 def get_drops_in_stream(
     stream_id: str,
     from_placement_id: Optional[str] = Query(None),
-    limit: int = Query(10, ge=-50, le=50)
+    limit: int = Query(10, ge=-50, le=50),
+    drop_fields: Optional[fields.Fieldset] = Depends(
+        fields.fieldset(DropInStream)
+    ),
 ):
     """
     Get drops in a stream using linked list traversal.
     Positive limit: forward traversal (using next_placement_id).
     Negative limit: backward traversal (using prev_placement_id).
+    Head and tail pages are served from the stream's page snapshot, other
+    pages of streams with order keys by a range query.
+    If the request deadline runs out mid-traversal, the drops read so far
+    are returned with has_more set and a continuation_token to resume from.
+    `fields` or `view=preview` limit the fields of the returned drops.
     """
     if limit == 0:
         raise HTTPException(
@@ -313,11 +1276,49 @@ def get_drops_in_stream(
     actual_limit = abs(limit)
     
     try:
-        stream_doc = streams_collection.document(stream_id).get()
+        if not from_placement_id:
+            # Trending streams have their snapshot pinned in memory.
+            page_data = trending.read_tracker.pinned_page(stream_id)
+            if page_data is None:
+                read_at = time.monotonic()
+                page_doc = hedged(
+                    "stream_page",
+                    stream_pages_collection.document(stream_id).get,
+                )
+                page_data = page_doc.to_dict() if page_doc.exists else None
+                if page_data is not None:
+                    trending.read_tracker.offer_page(
+                        stream_id, page_data, read_at
+                    )
+            page_entries = (
+                stream_pages.read_page(page_data, limit)
+                if page_data is not None
+                else None
+            )
+            if page_entries is not None:
+                total_count = page_data["drop_count"]
+                app_logger.info(
+                    "Served %s drops for stream %s from page snapshot",
+                    len(page_entries),
+                    stream_id,
+                )
+                return _counted(stream_id, GetDropsResponse(
+                    drops=page_entries,
+                    has_more=total_count > len(page_entries),
+                    total_count=total_count,
+                ), drop_fields)
+
+        stream_doc = hedged(
+            "stream", streams_collection.document(stream_id).get
+        )
         if not stream_doc.exists:
             raise HTTPException(status_code=404, detail="Stream not found")
 
         stream_data = stream_doc.to_dict()
+        if _has_order_keys(stream_data):
+            return _counted(stream_id, _get_drops_by_order_key(
+                stream_id, stream_data, from_placement_id, limit
+            ), drop_fields)
         
         # Determine starting placement
         if from_placement_id:
@@ -331,42 +1332,53 @@ def get_drops_in_stream(
         
         if not current_placement_id:
             # No drops in stream
-            return GetDropsResponse(
+            return _counted(stream_id, GetDropsResponse(
                 drops=[],
                 has_more=False,
                 total_count=0,
-            )
+            ), drop_fields)
         
         # Traverse the linked list
         drops_list = []
         visited_count = 0
+        continuation_token = None
         
         while current_placement_id and visited_count < actual_limit:
-            # Get the placement
-            placement_doc = stream_drops_collection.document(
-                current_placement_id
-            ).get()
-            
-            if not placement_doc.exists:
-                app_logger.warning(
-                    f"Placement {current_placement_id} not found in stream {stream_id}"
-                )
+            # Out of time: hand back what we have rather than fail the page.
+            if drops_list and deadlines.running_out(PARTIAL_PAGE_RESERVE):
+                continuation_token = current_placement_id
                 break
-            
-            placement_data = placement_doc.to_dict()
-            
-            # Verify this placement belongs to the stream
-            if placement_data.get('stream_id') != stream_id:
-                app_logger.error(
-                    f"Placement {current_placement_id} does not belong to stream {stream_id}"
+
+            try:
+                placement_doc = hedged(
+                    "placement",
+                    stream_drops_collection.document(current_placement_id).get,
+                )
+                if not placement_doc.exists:
+                    app_logger.warning(
+                        f"Placement {current_placement_id} not found in stream {stream_id}"
+                    )
+                    break
+
+                placement_data = placement_doc.to_dict()
+
+                # Verify this placement belongs to the stream
+                if placement_data.get('stream_id') != stream_id:
+                    app_logger.error(
+                        f"Placement {current_placement_id} does not belong to stream {stream_id}"
+                    )
+                    break
+
+                drop_doc = hedged(
+                    "drop",
+                    drops_collection.document(placement_data['drop_id']).get,
                 )
+            except RequestDeadlineExceeded:
+                if not drops_list:
+                    raise
+                continuation_token = current_placement_id
                 break
             
-            # Get the drop
-            drop_doc = drops_collection.document(
-                placement_data['drop_id']
-            ).get()
-            
             if drop_doc.exists:
                 drop_data = drop_doc.to_dict()
                 
@@ -374,7 +1386,8 @@ def get_drops_in_stream(
                     **drop_data,
                     placement_id=placement_data['placement_id'],
                     next_placement_id=placement_data.get('next_placement_id'),
-                    prev_placement_id=placement_data.get('prev_placement_id')
+                    prev_placement_id=placement_data.get('prev_placement_id'),
+                    ordinal=placement_data.get('ordinal')
                 )
                 drops_list.append(drop_in_stream)
                 visited_count += 1
@@ -387,22 +1400,34 @@ def get_drops_in_stream(
         
         # Check if there are more drops
         has_more = current_placement_id is not None
+        if continuation_token:
+            app_logger.warning(
+                "Returning partial page of %s drops for stream %s: "
+                "request deadline nearly exceeded",
+                len(drops_list),
+                stream_id,
+            )
         
-        # For total_count, we would ideally maintain a counter on the stream
-        # document. For now, we'll do a full count, but this is not scalable.
-        total_count_query = stream_drops_collection.where(
-            'stream_id', '==', stream_id
-        )
-        total_count = len(list(total_count_query.stream()))
+        # Streams maintain a drop counter; only streams that predate it
+        # (and haven't been backfilled by the repair job) need a full count.
+        total_count = stream_data.get('drop_count')
+        if total_count is None:
+            total_count_query = stream_drops_collection.where(
+                'stream_id', '==', stream_id
+            )
+            total_count = len(list(total_count_query.stream()))
         
         app_logger.info(
             "Successfully retrieved %s drops for stream %s using linked list",
             len(drops_list),
             stream_id,
         )
-        return GetDropsResponse(
-            drops=drops_list, has_more=has_more, total_count=total_count
-        )
+        return _counted(stream_id, GetDropsResponse(
+            drops=drops_list,
+            has_more=has_more,
+            total_count=total_count,
+            continuation_token=continuation_token,
+        ), drop_fields)
     except Exception as e:
         app_logger.error(
             f"Failed to get drops for stream {stream_id}: {e}", exc_info=True
@@ -410,3 +1435,68 @@ def get_drops_in_stream(
         if isinstance(e, HTTPException):
             raise
         raise HTTPException(status_code=500, detail="Failed to get drops.")
+
+
+@router.get(
+    "/streams/{stream_id}/drops:export",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"application/x-ndjson": {}}}},
+)
+def export_drops_in_stream(
+    stream_id: str,
+    after_placement_id: Optional[str] = Query(None),
+):
+    """
+    Export all drops of a stream, in order, as newline-delimited JSON (one
+    DropInStream per line). Pass the last exported placement as
+    after_placement_id to resume an interrupted export.
+    """
+    app_logger.info(
+        f"Attempting to export drops of stream {stream_id} "
+        f"after {after_placement_id}"
+    )
+    try:
+        stream_doc = hedged(
+            "stream", streams_collection.document(stream_id).get
+        )
+        if not stream_doc.exists:
+            raise HTTPException(status_code=404, detail="Stream not found")
+        stream_data = stream_doc.to_dict()
+
+        after = None
+        if after_placement_id:
+            after_doc = stream_drops_collection.document(
+                after_placement_id
+            ).get()
+            after = after_doc.to_dict() if after_doc.exists else None
+            if after is None or after.get('stream_id') != stream_id:
+                raise HTTPException(
+                    status_code=404, detail="Placement not found in stream"
+                )
+
+        if _has_order_keys(stream_data):
+            read = stream_export.order_key_reader(stream_id)
+            start = after['order_key'] if after else None
+            first = stream_export.read_window(read, start)
+        else:
+            read = stream_export.chain_reader(stream_id)
+            start = (
+                after.get('next_placement_id') if after
+                else stream_data.get('first_drop_placement_id')
+            )
+            first = (
+                stream_export.read_window(read, start) if start else ([], None)
+            )
+    except Exception as e:
+        app_logger.error(
+            f"Failed to export drops of stream {stream_id}: {e}",
+            exc_info=True,
+        )
+        if isinstance(e, HTTPException):
+            raise
+        raise HTTPException(status_code=500, detail="Failed to export drops.")
+
+    return StreamingResponse(
+        stream_export.export_lines(stream_id, read, first),
+        media_type="application/x-ndjson",
+    )
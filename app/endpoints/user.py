@@ -1,10 +1,18 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
-from app.db import users_collection
+from app.db import (
+    db, users_collection, streams_collection, stream_drops_collection,
+    stream_pages_collection
+)
 from app.auth import get_current_user_id
-from app.models import UserProgress, RiverResponse, RiverRecord
+from app.models import (
+    DropInStream, UserProgress, ResumeResponse, RiverResponse, RiverRecord
+)
 from datetime import datetime, timezone
+from app import fields, stream_pages
+from app.deadlines import concurrently, hedged
 from app.logger import app_logger
-from typing import Any, Optional
+from app.trending import read_tracker
+from typing import Any, List, Optional
 
 router = APIRouter(prefix="/user")
 
@@ -39,6 +47,90 @@ def _parse_timestamp(timestamp: Optional[Any]) -> Optional[datetime]:
     return None
 
 
+def _completion(position: Optional[int], drop_count: Optional[int]) -> dict:
+    """Completion fields for the drop at ordinal `position` of a stream."""
+    if position is None or not drop_count:
+        return {}
+    return {
+        "position": position,
+        "completion": round(min(100.0, 100 * position / drop_count), 1),
+        "is_completed": position >= drop_count,
+    }
+
+
+def _hydrate_river(records: List[RiverRecord]) -> None:
+    """
+    Fills in stream metadata and unread counts for river records. Streams
+    and last-read placements are fetched together with one batched get;
+    drops remaining is the stream's drop count minus the placement ordinal.
+    The ordinal is read again rather than taken from the progress update,
+    because inserting, moving or removing drops renumbers placements.
+    """
+    stream_refs = [
+        streams_collection.document(record.stream_id) for record in records
+    ]
+    placement_refs = [
+        stream_drops_collection.document(record.last_read_placement_id)
+        for record in records
+        if record.last_read_placement_id
+    ]
+    streams = {}
+    placements = {}
+    for doc in db.get_all(stream_refs + placement_refs):
+        if not doc.exists:
+            continue
+        if doc.reference.parent.id == streams_collection.id:
+            streams[doc.id] = doc.to_dict()
+        else:
+            placements[doc.id] = doc.to_dict()
+
+    for record in records:
+        stream = streams.get(record.stream_id)
+        if stream is None:
+            continue
+        content = stream.get("content") or {}
+        record.title = content.get("title")
+        record.image = content.get("image")
+        record.drop_count = stream.get("drop_count")
+
+        placement = placements.get(record.last_read_placement_id)
+        if record.drop_count is None:
+            continue
+        position = placement.get("ordinal") if placement else None
+        if position is None:
+            if record.last_read_placement_id is None:
+                record.drops_remaining = record.drop_count
+            continue
+        record.drops_remaining = max(0, record.drop_count - position)
+        # Drops added since the progress update make it less complete.
+        for field, value in _completion(position, record.drop_count).items():
+            setattr(record, field, value)
+
+
+def _progress_ref(user_id: str):
+    return (
+        users_collection.document(user_id)
+        .collection("progress")
+        .document("main")
+    )
+
+
+def _stream_history(payload: dict) -> dict:
+    """The stream_history map of a progress document."""
+    stream_history = payload.get("stream_history") or {}
+
+    # Firestore may materialize dotted field names (stream_history.<id>)
+    # when the document was created via a merged set. Fold those back into
+    # the stream_history map so older records remain visible.
+    for key, value in payload.items():
+        if not key.startswith("stream_history."):
+            continue
+        stream_id = key.split("stream_history.", 1)[1]
+        if stream_id and stream_id not in stream_history:
+            stream_history[stream_id] = value
+    return stream_history
+
+
 @router.post("/progress", status_code=204)
 def update_user_progress(
     progress: UserProgress, user_id: str = Depends(get_current_user_id)
@@ -50,11 +142,7 @@ def update_user_progress(
     app_logger.info(f"Updating progress for user {user_id}: {progress}")
     try:
         now = datetime.now(timezone.utc)
-        user_state_ref = (
-            users_collection.document(user_id)
-            .collection("progress")
-            .document("main")
-        )
+        user_state_ref = _progress_ref(user_id)
 
         update_data = {
             "last_active_context": {
@@ -69,12 +157,32 @@ def update_user_progress(
             },
         }
 
-        # ToDo: Check if the stream is completed and set is_completed flag
+        # The placement's ordinal and the stream's drop count tell how far
+        # into the stream the user is, without walking the chain.
+        state_doc, placement_doc, stream_doc = concurrently(
+            user_state_ref.get,
+            stream_drops_collection.document(progress.placement_id).get,
+            streams_collection.document(progress.stream_id).get,
+        )
+        placement = placement_doc.to_dict() if placement_doc.exists else None
+        if (
+            placement is not None
+            and placement.get("stream_id") == progress.stream_id
+            and stream_doc.exists
+        ):
+            drop_count = stream_doc.to_dict().get("drop_count")
+            completion = _completion(placement.get("ordinal"), drop_count)
+            if completion:
+                completion["drop_count"] = drop_count
+            update_data[f"stream_history.{progress.stream_id}"].update(
+                completion
+            )
 
         # Create document if it doesn't exist, then update
-        if not user_state_ref.get().exists:
+        if not state_doc.exists:
             user_state_ref.set({})
         user_state_ref.update(update_data)
+        read_tracker.record("streams", progress.stream_id)
         app_logger.info(f"Successfully updated progress for user {user_id}")
 
     except Exception as e:
@@ -91,19 +199,22 @@ def update_user_progress(
 @router.get("/river", response_model=RiverResponse)
 def get_user_river(
     limit: int = Query(30, ge=1, le=30),
+    hydrate: bool = Query(False),
+    completed: Optional[bool] = Query(None),
     user_id: str = Depends(get_current_user_id),
 ):
-    """Return the user's recent stream history ordered by last activity."""
+    """
+    Return the user's recent stream history ordered by last activity.
+    With `hydrate=true` each record also carries the stream's title, image,
+    drop count and the number of drops after the last-read one.
+    `completed` keeps only streams read to the end (true) or not (false),
+    as of each stream's last progress update.
+    """
     app_logger.info(
         f"Fetching river for user {user_id} with limit {limit}"
     )
     try:
-        progress_doc = (
-            users_collection.document(user_id)
-            .collection("progress")
-            .document("main")
-            .get()
-        )
+        progress_doc = _progress_ref(user_id).get()
 
         if not progress_doc.exists:
             app_logger.info(
@@ -112,18 +223,7 @@ def get_user_river(
             )
             return RiverResponse(records=[])
 
-        payload = progress_doc.to_dict() or {}
-        stream_history = payload.get("stream_history") or {}
-
-        # Firestore may materialize dotted field names (stream_history.<id>)
-        # when the document was created via a merged set. Fold those back into
-        # the stream_history map so older records remain visible.
-        for key, value in payload.items():
-            if not key.startswith("stream_history."):
-                continue
-            stream_id = key.split("stream_history.", 1)[1]
-            if stream_id and stream_id not in stream_history:
-                stream_history[stream_id] = value
+        stream_history = _stream_history(progress_doc.to_dict() or {})
 
         river_records = []
         fallback_timestamp = datetime.min.replace(tzinfo=timezone.utc)
@@ -143,11 +243,22 @@ def get_user_river(
                         "last_read_placement_id"
                     ),
                     updated_at=parsed_timestamp,
+                    **_completion(
+                        history.get("position"), history.get("drop_count")
+                    ),
                 )
             )
 
+        if completed is not None:
+            river_records = [
+                record
+                for record in river_records
+                if bool(record.is_completed) == completed
+            ]
         river_records.sort(key=lambda record: record.updated_at, reverse=True)
         trimmed_records = river_records[:limit]
+        if hydrate and trimmed_records:
+            _hydrate_river(trimmed_records)
 
         app_logger.info(
             f"Returning {len(trimmed_records)} river records for user "
@@ -168,3 +279,174 @@ def get_user_river(
         )
 
 
+def _read_stream(stream_id: str):
+    return hedged("stream", streams_collection.document(stream_id).get)
+
+
+def _read_page(stream_id: str):
+    """The stream's page snapshot, pinned in memory for trending streams."""
+    page = read_tracker.pinned_page(stream_id)
+    if page is None:
+        page_doc = hedged(
+            "stream_page", stream_pages_collection.document(stream_id).get
+        )
+        page = page_doc.to_dict() if page_doc.exists else None
+    return page
+
+
+def _resume(stream_doc, page, history, before, after) -> ResumeResponse:
+    """Builds the window around the last-read drop of a stream."""
+    if not stream_doc.exists:
+        raise HTTPException(status_code=404, detail="Stream not found")
+    stream_id = stream_doc.id
+    stream_data = stream_doc.to_dict()
+    placement_id = (history or {}).get("last_read_placement_id")
+
+    window = None
+    if placement_id and page is not None:
+        window = stream_pages.window_from_page(
+            page, placement_id, before, after
+        )
+    if window is None and placement_id:
+        placement_doc = hedged(
+            "placement", stream_drops_collection.document(placement_id).get
+        )
+        placement = placement_doc.to_dict() if placement_doc.exists else None
+        if placement is not None and placement.get("stream_id") == stream_id:
+            window = stream_pages.read_window(
+                stream_id, placement, before, after
+            )
+        else:
+            app_logger.warning(
+                f"Last-read placement {placement_id} not found in stream "
+                f"{stream_id}; resuming from the start"
+            )
+    if window is None:
+        # Nothing read yet: start at the beginning of the stream.
+        size = before + after + 1
+        entries = (
+            stream_pages.read_page(page, size) if page is not None else None
+        )
+        if entries is not None:
+            window = entries, False, page.get("drop_count", 0) > len(entries)
+        elif stream_data.get("first_drop_placement_id"):
+            first_doc = stream_drops_collection.document(
+                stream_data["first_drop_placement_id"]
+            ).get()
+            window = (
+                stream_pages.read_window(
+                    stream_id, first_doc.to_dict(), 0, size - 1
+                )
+                if first_doc.exists
+                else ([], False, False)
+            )
+        else:
+            window = [], False, False
+
+    entries, has_more_before, has_more_after = window
+    total_count = stream_data.get("drop_count")
+    if total_count is None:
+        total_count = (page or {}).get("drop_count", len(entries))
+    drops_remaining = None
+    for entry in entries:
+        if entry["placement_id"] == placement_id and entry.get("ordinal"):
+            drops_remaining = max(0, total_count - entry["ordinal"])
+
+    read_tracker.record("streams", stream_id)
+    for entry in entries:
+        read_tracker.record("drops", entry["drop_id"])
+    return ResumeResponse(
+        stream=stream_data,
+        last_read_placement_id=placement_id,
+        updated_at=_parse_timestamp((history or {}).get("updated_at")),
+        drops=entries,
+        has_more_before=has_more_before,
+        has_more_after=has_more_after,
+        total_count=total_count,
+        drops_remaining=drops_remaining,
+    )
+
+
+@router.get("/resume", response_model=ResumeResponse)
+def resume_reading(
+    before: int = Query(5, ge=0, le=50),
+    after: int = Query(10, ge=0, le=50),
+    drop_fields: Optional[fields.Fieldset] = Depends(
+        fields.fieldset(DropInStream)
+    ),
+    user_id: str = Depends(get_current_user_id),
+):
+    """
+    Reopens the stream the user read last: the stream with the drops around
+    the last-read one, in one response.
+    """
+    app_logger.info(f"Resuming reading for user {user_id}")
+    try:
+        progress_doc = _progress_ref(user_id).get()
+        payload = (progress_doc.to_dict() or {}) if progress_doc.exists else {}
+        stream_history = _stream_history(payload)
+        stream_id = (payload.get("last_active_context") or {}).get(
+            "stream_id"
+        )
+        if not stream_id and stream_history:
+            stream_id = max(
+                stream_history,
+                key=lambda i: _parse_timestamp(
+                    stream_history[i].get("updated_at")
+                ) or datetime.min.replace(tzinfo=timezone.utc),
+            )
+        if not stream_id:
+            raise HTTPException(status_code=404, detail="Nothing to resume")
+
+        stream_doc, page = concurrently(
+            lambda: _read_stream(stream_id), lambda: _read_page(stream_id)
+        )
+        return fields.select(_resume(
+            stream_doc, page, stream_history.get(stream_id), before, after
+        ), drop_fields, "drops")
+    except HTTPException:
+        raise
+    except Exception as e:
+        app_logger.error(
+            f"Error resuming reading for user {user_id}: {e}", exc_info=True
+        )
+        raise HTTPException(status_code=500, detail="Failed to resume reading.")
+
+
+@router.get("/resume/{stream_id}", response_model=ResumeResponse)
+def resume_stream(
+    stream_id: str,
+    before: int = Query(5, ge=0, le=50),
+    after: int = Query(10, ge=0, le=50),
+    drop_fields: Optional[fields.Fieldset] = Depends(
+        fields.fieldset(DropInStream)
+    ),
+    user_id: str = Depends(get_current_user_id),
+):
+    """
+    Reopens a stream where the user left it, or at its start if they never
+    read it. The progress document, the stream and its page snapshot are
+    read concurrently.
+    """
+    app_logger.info(f"Resuming stream {stream_id} for user {user_id}")
+    try:
+        progress_doc, stream_doc, page = concurrently(
+            _progress_ref(user_id).get,
+            lambda: _read_stream(stream_id),
+            lambda: _read_page(stream_id),
+        )
+        payload = (progress_doc.to_dict() or {}) if progress_doc.exists else {}
+        history = _stream_history(payload).get(stream_id)
+        return fields.select(
+            _resume(stream_doc, page, history, before, after),
+            drop_fields,
+            "drops",
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        app_logger.error(
+            f"Error resuming stream {stream_id} for user {user_id}: {e}",
+            exc_info=True,
+        )
+        raise HTTPException(status_code=500, detail="Failed to resume reading.")
@@ -0,0 +1,118 @@
+"""
+Sparse fieldsets for drop responses.
+
+Endpoints returning drops accept `fields=` (comma-separated field names;
+`content.title` picks one field of the content) or `view=preview`, the
+fields a feed shows: IDs, placement links, title and the snippet stored
+with the drop instead of its full text and images. Selected responses are
+serialized with only those fields, so previews ship a fraction of the bytes
+of full drops.
+"""
+from typing import Callable, Dict, Optional, Type, Union
+
+from fastapi import HTTPException, Query
+from pydantic import BaseModel
+
+from app.models import DropContent
+from app.responses import json_response
+
+# A pydantic `include` for one drop.
+Fieldset = Dict[str, Union[bool, Dict[str, bool]]]
+
+PREVIEW_FIELDS = (
+    "drop_id",
+    "creator_id",
+    "created_at",
+    "placement_id",
+    "next_placement_id",
+    "prev_placement_id",
+    "ordinal",
+    "content.title",
+    "content.snippet",
+    "content.type",
+)
+
+VIEWS = {"full": None, "preview": PREVIEW_FIELDS}
+
+
+def parse_fields(names, model: Type[BaseModel]) -> Fieldset:
+    """Turns field names into a fieldset of `model`; 422 on unknown names."""
+    fieldset: Fieldset = {}
+    for name in names:
+        name = name.strip()
+        if not name:
+            continue
+        field, _, subfield = name.partition(".")
+        content_fields = DropContent.model_fields
+        if field not in model.model_fields or (
+            subfield
+            and (field != "content" or subfield not in content_fields)
+        ):
+            raise HTTPException(
+                status_code=422, detail=f"Unknown field {name!r}"
+            )
+        if not subfield:
+            fieldset[field] = True
+        elif fieldset.get(field) is not True:
+            fieldset.setdefault(field, {})[subfield] = True
+    if not fieldset:
+        raise HTTPException(status_code=422, detail="No fields selected")
+    return fieldset
+
+
+def fieldset(model: Type[BaseModel]) -> Callable[..., Optional[Fieldset]]:
+    """
+    A dependency reading `fields` and `view` for drops of type `model`.
+    Returns None for full drops. Preview fields the model doesn't have are
+    left out.
+    """
+
+    def dependency(
+        fields: Optional[str] = Query(None),
+        view: Optional[str] = Query(None),
+    ) -> Optional[Fieldset]:
+        if fields is not None and view is not None:
+            raise HTTPException(
+                status_code=422, detail="Use either fields or view"
+            )
+        if fields is not None:
+            return parse_fields(fields.split(","), model)
+        if view is None:
+            return None
+        if view not in VIEWS:
+            raise HTTPException(
+                status_code=422,
+                detail=f"Unknown view {view!r}; use {' or '.join(VIEWS)}",
+            )
+        if VIEWS[view] is None:
+            return None
+        return parse_fields(
+            (
+                name for name in VIEWS[view]
+                if name.partition(".")[0] in model.model_fields
+            ),
+            model,
+        )
+
+    return dependency
+
+
+def select(
+    response: BaseModel,
+    drops: Optional[Fieldset],
+    key: Optional[str] = None,
+):
+    """
+    Returns `response` as JSON, holding only the selected fields of its
+    drops: the response itself is a drop when `key` is None, otherwise
+    `response.<key>` is a drop or a list of drops.
+    """
+    if drops is None:
+        return json_response(response)
+    if key is None:
+        include = drops
+    else:
+        include = {name: True for name in type(response).model_fields}
+        value = getattr(response, key)
+        include[key] = {"__all__": drops} if isinstance(value, list) else drops
+    return json_response(response, include)
@@ -0,0 +1,447 @@
+"""
+Firestore client factory with a tunable gRPC transport.
+
+`firestore.client()` sends every RPC over a single gRPC channel, i.e. one
+HTTP/2 connection with a server-side cap on concurrent streams, so bursts
+queue behind each other. `create_client()` keeps firebase_admin's project
+and credential handling but installs a transport that:
+
+- spreads calls over a pool of FIRESTORE_CHANNELS channels (own connection
+  each), picking the channel with the fewest calls in flight;
+- sends HTTP/2 keepalive pings so idle connections aren't silently dropped;
+- applies per-call deadlines and retry policies by operation type: reads
+  retry on transient errors, writes only on errors where the write is known
+  not to have been applied. Aborted transactions are still retried by
+  `firestore.transactional`.
+- caps every call at the time left before the HTTP request's deadline
+  (see app/deadlines.py).
+
+Per-method call counts, status codes and latency, and per-channel load are
+exposed through `channel_metrics` (see /metrics).
+"""
+import itertools
+import threading
+import time
+from collections import Counter
+from os import environ
+from typing import Callable, Dict, List, Optional
+
+import grpc
+from firebase_admin import firestore
+from google.api_core import exceptions, gapic_v1
+from google.api_core import retry as retries
+from google.cloud.firestore_v1.services.firestore import FirestoreClient
+from google.cloud.firestore_v1.services.firestore.transports.grpc import (
+    FirestoreGrpcTransport,
+)
+
+from app import deadlines
+
+CHANNELS = int(environ.get("FIRESTORE_CHANNELS", "4"))
+KEEPALIVE_MS = int(environ.get("FIRESTORE_KEEPALIVE_MS", "30000"))
+KEEPALIVE_TIMEOUT_MS = int(
+    environ.get("FIRESTORE_KEEPALIVE_TIMEOUT_MS", "10000")
+)
+
+# Deadline of a single attempt and total time spent retrying, in seconds.
+READ_TIMEOUT = float(environ.get("FIRESTORE_READ_TIMEOUT", "10"))
+READ_RETRY_DEADLINE = float(environ.get("FIRESTORE_READ_RETRY_DEADLINE", "20"))
+# A streamed read's timeout covers the whole stream, so full collection
+# scans keep the library's default of 300s.
+STREAM_READ_TIMEOUT = float(
+    environ.get("FIRESTORE_STREAM_READ_TIMEOUT", "300")
+)
+WRITE_TIMEOUT = float(environ.get("FIRESTORE_WRITE_TIMEOUT", "20"))
+WRITE_RETRY_DEADLINE = float(
+    environ.get("FIRESTORE_WRITE_RETRY_DEADLINE", "30")
+)
+
+READ_METHODS = (
+    "get_document",
+    "list_documents",
+    "list_collection_ids",
+)
+STREAM_READ_METHODS = (
+    "batch_get_documents",
+    "run_query",
+    "run_aggregation_query",
+    "partition_query",
+)
+WRITE_METHODS = (
+    "commit",
+    "batch_write",
+    "begin_transaction",
+    "rollback",
+    "create_document",
+    "update_document",
+    "delete_document",
+)
+
+READ_RETRY = retries.Retry(
+    initial=0.1,
+    maximum=2.0,
+    multiplier=2.0,
+    timeout=READ_RETRY_DEADLINE,
+    predicate=retries.if_exception_type(
+        exceptions.DeadlineExceeded,
+        exceptions.InternalServerError,
+        exceptions.ResourceExhausted,
+        exceptions.ServiceUnavailable,
+    ),
+)
+STREAM_READ_RETRY = READ_RETRY.with_timeout(STREAM_READ_TIMEOUT)
+# A write that timed out may still have been applied (counters use
+# increments), so only errors raised before the write was accepted retry.
+WRITE_RETRY = retries.Retry(
+    initial=0.2,
+    maximum=4.0,
+    multiplier=2.0,
+    timeout=WRITE_RETRY_DEADLINE,
+    predicate=retries.if_exception_type(
+        exceptions.ResourceExhausted,
+        exceptions.ServiceUnavailable,
+    ),
+)
+
+
+def channel_options() -> list:
+    return [
+        ("grpc.max_send_message_length", -1),
+        ("grpc.max_receive_message_length", -1),
+        ("grpc.keepalive_time_ms", KEEPALIVE_MS),
+        ("grpc.keepalive_timeout_ms", KEEPALIVE_TIMEOUT_MS),
+        # Without this, channels with identical arguments share one
+        # connection and the pool gains nothing.
+        ("grpc.use_local_subchannel_pool", 1),
+    ]
+
+
+class ChannelMetrics:
+    """Call counts, status codes and latency per RPC, load per channel."""
+
+    def __init__(self, size: int):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, dict] = {}
+        self.in_flight: List[int] = [0] * size
+        self.peak_in_flight: List[int] = [0] * size
+        self.channel_calls: List[int] = [0] * size
+
+    def start_call(self, rotation: int) -> int:
+        """
+        Picks the channel with the fewest calls in flight, starting the
+        search at `rotation` so ties are spread round-robin.
+        """
+        with self._lock:
+            size = len(self.in_flight)
+            start = rotation % size
+            index = min(
+                range(size),
+                key=lambda i: (self.in_flight[i], (i - start) % size),
+            )
+            self.in_flight[index] += 1
+            self.channel_calls[index] += 1
+            self.peak_in_flight[index] = max(
+                self.peak_in_flight[index], self.in_flight[index]
+            )
+        return index
+
+    def finished(self, index: int, method: str, seconds: float, code: str):
+        method = method.rsplit("/", 1)[-1]
+        with self._lock:
+            self.in_flight[index] -= 1
+            stats = self._calls.setdefault(method, {
+                "calls": 0,
+                "total_seconds": 0.0,
+                "max_seconds": 0.0,
+                "codes": Counter(),
+            })
+            stats["calls"] += 1
+            stats["total_seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
+            stats["codes"][code] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            methods = {
+                method: {
+                    "calls": stats["calls"],
+                    "avg_ms": round(
+                        1000 * stats["total_seconds"] / stats["calls"], 2
+                    ),
+                    "max_ms": round(1000 * stats["max_seconds"], 2),
+                    "codes": dict(stats["codes"]),
+                }
+                for method, stats in self._calls.items()
+            }
+            channels = [
+                {"in_flight": in_flight, "peak_in_flight": peak, "calls": calls}
+                for in_flight, peak, calls in zip(
+                    self.in_flight, self.peak_in_flight, self.channel_calls
+                )
+            ]
+        return {
+            "channels": channels,
+            "methods": methods,
+            "config": {
+                "channels": len(channels),
+                "keepalive_ms": KEEPALIVE_MS,
+                "read_timeout": READ_TIMEOUT,
+                "write_timeout": WRITE_TIMEOUT,
+            },
+        }
+
+
+def _status(error: Optional[BaseException]) -> str:
+    if error is None:
+        return "OK"
+    code = getattr(error, "code", None)
+    if callable(code):
+        try:
+            return code().name
+        except Exception:
+            pass
+    return type(error).__name__
+
+
+class _TrackedStream:
+    """Response iterator of a streaming call that reports when it ends."""
+
+    def __init__(self, call, on_done: Callable[[str], None]):
+        self._call = call
+        self._on_done = on_done
+        self._done = False
+        self._lock = threading.Lock()
+        add_callback = getattr(call, "add_callback", None)
+        if add_callback is not None:
+            # Also fires when the caller abandons the stream early.
+            add_callback(lambda: self._finish(_status(call)))
+
+    def _finish(self, code: str) -> None:
+        with self._lock:
+            if self._done:
+                return
+            self._done = True
+        self._on_done(code)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._call)
+        except StopIteration:
+            self._finish("OK")
+            raise
+        except Exception as e:
+            self._finish(_status(e))
+            raise
+
+    def __getattr__(self, name):
+        return getattr(self._call, name)
+
+
+class _PooledCall:
+    """Dispatches each invocation of one RPC to a channel of the pool."""
+
+    def __init__(self, pool, kind: str, method: str, args: tuple):
+        self._pool = pool
+        self._kind = kind
+        self._method = method
+        self._args = args
+
+    def _invoke(self, attribute: Optional[str], request, args, kwargs):
+        if not self._method.endswith("/Rollback"):
+            # Never wait on Firestore past the deadline of the HTTP request;
+            # rollbacks still run so failed transactions release their locks.
+            kwargs["timeout"] = deadlines.clamp_timeout(kwargs.get("timeout"))
+        index = self._pool._acquire()
+        started = time.perf_counter()
+
+        def done(code: str) -> None:
+            self._pool.metrics.finished(
+                index, self._method, time.perf_counter() - started, code
+            )
+
+        target = self._pool._target(index, self._kind, self._method, self._args)
+        if attribute:
+            target = getattr(target, attribute)
+        try:
+            result = target(request, *args, **kwargs)
+        except Exception as e:
+            done(_status(e))
+            if _status(e) == "DEADLINE_EXCEEDED" and deadlines.running_out(0):
+                raise deadlines.RequestDeadlineExceeded() from e
+            raise
+        if self._kind.endswith("_stream"):
+            return _TrackedStream(result, done)
+        if attribute == "future":
+            result.add_done_callback(lambda f: done(_status(f.exception())))
+        else:
+            done("OK")
+        return result
+
+
+class _PooledUnaryUnary(_PooledCall, grpc.UnaryUnaryMultiCallable):
+    def __call__(self, request, *args, **kwargs):
+        return self._invoke(None, request, args, kwargs)
+
+    def with_call(self, request, *args, **kwargs):
+        return self._invoke("with_call", request, args, kwargs)
+
+    def future(self, request, *args, **kwargs):
+        return self._invoke("future", request, args, kwargs)
+
+
+class _PooledUnaryStream(_PooledCall, grpc.UnaryStreamMultiCallable):
+    def __call__(self, request, *args, **kwargs):
+        return self._invoke(None, request, args, kwargs)
+
+
+class _PooledStreamUnary(_PooledCall, grpc.StreamUnaryMultiCallable):
+    def __call__(self, request_iterator, *args, **kwargs):
+        return self._invoke(None, request_iterator, args, kwargs)
+
+    def with_call(self, request_iterator, *args, **kwargs):
+        return self._invoke("with_call", request_iterator, args, kwargs)
+
+    def future(self, request_iterator, *args, **kwargs):
+        return self._invoke("future", request_iterator, args, kwargs)
+
+
+class _PooledStreamStream(_PooledCall, grpc.StreamStreamMultiCallable):
+    def __call__(self, request_iterator, *args, **kwargs):
+        return self._invoke(None, request_iterator, args, kwargs)
+
+
+class PooledChannel(grpc.Channel):
+    """
+    A grpc.Channel that spreads calls over `size` underlying channels,
+    choosing the one with the fewest calls in flight (round-robin on ties).
+    Channels are opened on first use.
+    """
+
+    def __init__(self, size: int, create_channel: Callable[[], grpc.Channel]):
+        self.size = max(1, size)
+        self.metrics = ChannelMetrics(self.size)
+        self._create_channel = create_channel
+        self._channels: List[Optional[grpc.Channel]] = [None] * self.size
+        self._targets: Dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        self._rotation = itertools.count()
+
+    def _channel(self, index: int) -> grpc.Channel:
+        channel = self._channels[index]
+        if channel is None:
+            with self._lock:
+                channel = self._channels[index]
+                if channel is None:
+                    channel = self._channels[index] = self._create_channel()
+        return channel
+
+    def _acquire(self) -> int:
+        return self.metrics.start_call(next(self._rotation))
+
+    def _target(self, index: int, kind: str, method: str, args: tuple):
+        key = (index, kind, method, args)
+        target = self._targets.get(key)
+        if target is None:
+            target = getattr(self._channel(index), kind)(method, *args)
+            self._targets[key] = target
+        return target
+
+    def unary_unary(self, method, *args, **kwargs):
+        return _PooledUnaryUnary(self, "unary_unary", method, args)
+
+    def unary_stream(self, method, *args, **kwargs):
+        return _PooledUnaryStream(self, "unary_stream", method, args)
+
+    def stream_unary(self, method, *args, **kwargs):
+        return _PooledStreamUnary(self, "stream_unary", method, args)
+
+    def stream_stream(self, method, *args, **kwargs):
+        return _PooledStreamStream(self, "stream_stream", method, args)
+
+    def subscribe(self, callback, try_to_connect=False):
+        self._channel(0).subscribe(callback, try_to_connect=try_to_connect)
+
+    def unsubscribe(self, callback):
+        self._channel(0).unsubscribe(callback)
+
+    def close(self):
+        with self._lock:
+            for channel in self._channels:
+                if channel is not None:
+                    channel.close()
+            self._channels = [None] * self.size
+            self._targets.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+
+def _apply_policies(transport, client_info) -> None:
+    """Replaces the generated per-method defaults with our policies."""
+    policies = [
+        (READ_METHODS, READ_RETRY, READ_TIMEOUT),
+        (STREAM_READ_METHODS, STREAM_READ_RETRY, STREAM_READ_TIMEOUT),
+        (WRITE_METHODS, WRITE_RETRY, WRITE_TIMEOUT),
+    ]
+    for names, retry, timeout in policies:
+        for name in names:
+            method = getattr(transport, name, None)
+            if method is None:
+                continue
+            transport._wrapped_methods[method] = gapic_v1.method.wrap_method(
+                method,
+                default_retry=retry,
+                default_timeout=timeout,
+                client_info=client_info,
+            )
+
+
+channel_pool: Optional[PooledChannel] = None
+
+
+def install_transport(client, channels: int = CHANNELS) -> PooledChannel:
+    """
+    Installs a pooled transport with our call policies on a Firestore
+    client. Must run before the client makes its first call.
+    """
+
+    def create_channel() -> grpc.Channel:
+        if client._emulator_host is not None:
+            # The emulator channel is insecure and shares one connection;
+            # fine for local development.
+            return client._emulator_channel(FirestoreGrpcTransport)
+        return FirestoreGrpcTransport.create_channel(
+            client._target,
+            credentials=client._credentials,
+            options=channel_options(),
+        )
+
+    pool = PooledChannel(channels, create_channel)
+    transport = FirestoreGrpcTransport(host=client._target, channel=pool)
+    _apply_policies(transport, client._client_info)
+    client._transport = transport
+    client._firestore_api_internal = FirestoreClient(
+        transport=transport, client_options=client._client_options
+    )
+    return pool
+
+
+def create_client():
+    """Returns firebase_admin's Firestore client on the pooled transport."""
+    global channel_pool
+    client = firestore.client()
+    channel_pool = install_transport(client)
+    return client
+
+
+def channel_metrics() -> dict:
+    if channel_pool is None:
+        return {}
+    return channel_pool.metrics.snapshot()
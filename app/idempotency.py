@@ -0,0 +1,194 @@
+import datetime
+import hashlib
+import threading
+from os import environ
+from typing import Optional
+
+from cachetools import TTLCache
+from fastapi import Depends, Header, HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from google.api_core.exceptions import AlreadyExists
+
+from app.auth import get_optional_user_id
+from app.db import db
+from app.logger import app_logger
+
+TTL_SECONDS = int(environ.get("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+
+# Reservations older than this are assumed to belong to a crashed request.
+IN_FLIGHT_TIMEOUT_SECONDS = 60
+
+
+class LocalStore:
+    """Idempotency records kept in this instance's memory."""
+
+    def __init__(self, maxsize: int = 100_000, ttl: int = TTL_SECONDS):
+        self._records = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            record = self._records.get(key)
+            return dict(record) if record else None
+
+    def reserve(self, key: str, record: dict) -> bool:
+        with self._lock:
+            existing = self._records.get(key)
+            if existing and not _is_stale(existing):
+                return False
+            self._records[key] = record
+            return True
+
+    def complete(self, key: str, record: dict) -> None:
+        with self._lock:
+            self._records[key] = record
+
+    def release(self, key: str) -> None:
+        with self._lock:
+            self._records.pop(key, None)
+
+
+class FirestoreStore:
+    """
+    Idempotency records shared by every instance, kept in the
+    'idempotency_keys' collection. Configure a Firestore TTL policy on
+    `expires_at` to have expired records removed automatically.
+    """
+
+    def __init__(self):
+        self._collection = db.collection("idempotency_keys")
+
+    def get(self, key: str) -> Optional[dict]:
+        doc = self._collection.document(key).get()
+        if not doc.exists:
+            return None
+        record = doc.to_dict()
+        if record["expires_at"] < _now():
+            return None
+        return record
+
+    def reserve(self, key: str, record: dict) -> bool:
+        try:
+            self._collection.document(key).create(record)
+            return True
+        except AlreadyExists:
+            existing = self.get(key)
+            if existing is None or _is_stale(existing):
+                self._collection.document(key).set(record)
+                return True
+            return False
+
+    def complete(self, key: str, record: dict) -> None:
+        self._collection.document(key).set(record)
+
+    def release(self, key: str) -> None:
+        self._collection.document(key).delete()
+
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def _is_stale(record: dict) -> bool:
+    if record["state"] != "in_flight":
+        return False
+    age = _now() - record["created_at"]
+    return age.total_seconds() > IN_FLIGHT_TIMEOUT_SECONDS
+
+
+if environ.get("IDEMPOTENCY_BACKEND", "local") == "firestore":
+    store = FirestoreStore()
+else:
+    store = LocalStore()
+
+
+class IdempotentRequest:
+    """
+    Handle passed to POST handlers. `replay()` returns the cached response
+    of an earlier request with the same key; otherwise it reserves the key
+    and the handler must end with `save()` or, on failure, `release()`.
+    """
+
+    def __init__(self, key: Optional[str], fingerprint: Optional[str]):
+        self.key = key
+        self.fingerprint = fingerprint
+
+    def replay(self) -> Optional[JSONResponse]:
+        if not self.key:
+            return None
+
+        now = _now()
+        reservation = {
+            "state": "in_flight",
+            "fingerprint": self.fingerprint,
+            "created_at": now,
+            "expires_at": now + datetime.timedelta(seconds=TTL_SECONDS),
+        }
+        if store.reserve(self.key, reservation):
+            return None
+
+        record = store.get(self.key)
+        if record is None:
+            # Expired between the two calls; treat as a fresh request.
+            store.reserve(self.key, reservation)
+            return None
+        if record["fingerprint"] != self.fingerprint:
+            raise HTTPException(
+                status_code=422,
+                detail="Idempotency-Key was already used with a different "
+                "request body.",
+            )
+        if record["state"] == "in_flight":
+            raise HTTPException(
+                status_code=409,
+                detail="A request with this Idempotency-Key is in progress.",
+            )
+
+        app_logger.info("Replaying response for idempotency key")
+        return JSONResponse(
+            content=record["body"],
+            status_code=record["status_code"],
+            headers={"Idempotent-Replayed": "true"},
+        )
+
+    def save(self, body, status_code: int = 201) -> None:
+        if not self.key:
+            return
+        now = _now()
+        store.complete(self.key, {
+            "state": "completed",
+            "fingerprint": self.fingerprint,
+            "status_code": status_code,
+            "body": jsonable_encoder(body),
+            "created_at": now,
+            "expires_at": now + datetime.timedelta(seconds=TTL_SECONDS),
+        })
+
+    def release(self) -> None:
+        if self.key:
+            store.release(self.key)
+
+
+async def idempotency(
+    request: Request,
+    idempotency_key: Optional[str] = Header(
+        None, alias="Idempotency-Key", max_length=255
+    ),
+    user_id: Optional[str] = Depends(get_optional_user_id),
+) -> IdempotentRequest:
+    """Dependency scoping an Idempotency-Key header to caller and route."""
+    if not idempotency_key:
+        return IdempotentRequest(None, None)
+
+    route = request.scope.get("route")
+    scope = "|".join([
+        user_id or "",
+        request.method,
+        getattr(route, "path", request.url.path),
+        request.url.path,
+        idempotency_key,
+    ])
+    key = hashlib.sha256(scope.encode()).hexdigest()
+    fingerprint = hashlib.sha256(await request.body()).hexdigest()
+    return IdempotentRequest(key, fingerprint)
@@ -0,0 +1,346 @@
+"""
+Integrity checks and repairs for the per-stream placement linked lists.
+
+A stream's placements are fetched with a single query, the chain is rebuilt
+in memory from the head pointer and the prev/next links, and every
+inconsistency is reported: missing or dangling pointers, forks (two
+placements claiming the same predecessor or successor), cycles and orphans
+(placements that can't be reached from the head).
+
+The canonical order of a stream is the `order_key` order of its placements.
+Streams from before order keys only ever had drops appended at the tail, so
+their canonical order is `added_at` order, and repairing them assigns order
+keys in that order. Repairs relink and renumber (`ordinal`) every placement
+in canonical order, reset the stream's head/tail pointers, drop count and
+last order key, and rebuild its page snapshot, using batched writes.
+"""
+import datetime
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from app.db import (
+    db, streams_collection, stream_drops_collection, stream_pages_collection
+)
+from app.cache import get_drops
+from app.logger import app_logger
+from app import ordering, stream_pages
+
+MAX_BATCH_SIZE = 500
+
+
+@dataclass
+class ChainReport:
+    stream_id: str
+    placement_count: int = 0
+    reachable_count: int = 0
+    issues: List[str] = field(default_factory=list)
+    orphans: List[str] = field(default_factory=list)
+    forks: Dict[str, List[str]] = field(default_factory=dict)
+    has_cycle: bool = False
+    canonical_order: List[str] = field(default_factory=list)
+    rekey: bool = False
+    repaired_writes: int = 0
+
+    @property
+    def ok(self) -> bool:
+        return not self.issues
+
+
+def _sort_key(placement: dict):
+    added_at = placement.get("added_at")
+    if isinstance(added_at, datetime.datetime) and added_at.tzinfo is None:
+        added_at = added_at.replace(tzinfo=datetime.timezone.utc)
+    return added_at or datetime.datetime.min.replace(
+        tzinfo=datetime.timezone.utc
+    )
+
+
+def analyze_chain(
+    stream_id: str, stream_data: dict, placements: Dict[str, dict]
+) -> ChainReport:
+    """Rebuilds a stream's chain in memory and reports what is wrong with it."""
+    report = ChainReport(stream_id=stream_id, placement_count=len(placements))
+
+    # Forks: more than one placement pointing back at the same predecessor.
+    successors: Dict[str, List[str]] = {}
+    for placement_id, placement in placements.items():
+        prev_id = placement.get("prev_placement_id")
+        successors.setdefault(prev_id, []).append(placement_id)
+    for prev_id, children in successors.items():
+        if len(children) > 1:
+            report.forks[prev_id or "<head>"] = sorted(children)
+            report.issues.append(
+                f"fork after {prev_id or 'head'}: {', '.join(sorted(children))}"
+            )
+
+    # Walk forward from the head pointer.
+    head = stream_data.get("first_drop_placement_id")
+    tail = stream_data.get("last_drop_placement_id")
+    walked: List[str] = []
+    seen = set()
+    current, previous = head, None
+    if head and head not in placements:
+        report.issues.append(f"head pointer {head} is dangling")
+    while current and current in placements:
+        if current in seen:
+            report.has_cycle = True
+            report.issues.append(f"cycle back to {current}")
+            break
+        seen.add(current)
+        walked.append(current)
+        placement = placements[current]
+        if placement.get("prev_placement_id") != previous:
+            report.issues.append(
+                f"{current} has prev {placement.get('prev_placement_id')}, "
+                f"expected {previous}"
+            )
+        next_id = placement.get("next_placement_id")
+        if next_id and next_id not in placements:
+            report.issues.append(f"{current} has dangling next {next_id}")
+        previous, current = current, next_id
+
+    if walked and walked[-1] != tail:
+        report.issues.append(
+            f"tail pointer is {tail}, chain ends at {walked[-1]}"
+        )
+    if not placements and (head or tail):
+        report.issues.append("stream has head/tail pointers but no placements")
+
+    if stream_data.get("drop_count") != len(placements):
+        report.issues.append(
+            f"drop_count is {stream_data.get('drop_count')}, "
+            f"expected {len(placements)}"
+        )
+
+    report.reachable_count = len(walked)
+    report.orphans = sorted(set(placements) - seen)
+    if report.orphans:
+        report.issues.append(
+            f"{len(report.orphans)} placement(s) unreachable from head"
+        )
+
+    chain_index = {placement_id: i for i, placement_id in enumerate(walked)}
+    order_keys = [
+        placement["order_key"]
+        for placement in placements.values()
+        if placement.get("order_key") is not None
+    ]
+    missing_keys = len(placements) - len(order_keys)
+    duplicate_keys = len(order_keys) - len(set(order_keys))
+    if missing_keys:
+        report.issues.append(f"{missing_keys} placement(s) without order_key")
+    if duplicate_keys:
+        report.issues.append(f"{duplicate_keys} duplicate order_key(s)")
+    report.rekey = bool(missing_keys or duplicate_keys)
+
+    if report.rekey:
+        # Legacy or damaged keys: fall back to append order and rekey.
+        report.canonical_order = sorted(
+            placements,
+            key=lambda placement_id: (
+                _sort_key(placements[placement_id]),
+                chain_index.get(placement_id, len(walked)),
+                placement_id,
+            ),
+        )
+    else:
+        report.canonical_order = sorted(
+            placements,
+            key=lambda placement_id: placements[placement_id]["order_key"],
+        )
+        expected_last_key = (
+            placements[report.canonical_order[-1]]["order_key"]
+            if placements
+            else None
+        )
+        if "last_order_key" not in stream_data or (
+            stream_data["last_order_key"] != expected_last_key
+        ):
+            report.issues.append(
+                f"last_order_key is {stream_data.get('last_order_key')}, "
+                f"expected {expected_last_key}"
+            )
+
+    misnumbered = [
+        placement_id
+        for i, placement_id in enumerate(report.canonical_order)
+        if placements[placement_id].get("ordinal") != i + 1
+    ]
+    if misnumbered:
+        report.issues.append(
+            f"{len(misnumbered)} placement(s) with missing or wrong ordinal"
+        )
+    return report
+
+
+def plan_repair(
+    report: ChainReport, stream_data: dict, placements: Dict[str, dict]
+):
+    """
+    Returns (placement_updates, stream_update) that relink the placements in
+    canonical order. Only fields that actually change are included.
+    """
+    order = report.canonical_order
+    if report.rekey:
+        order_keys = ordering.keys_between(None, None, len(order))
+    else:
+        order_keys = [placements[i]["order_key"] for i in order]
+    placement_updates: Dict[str, dict] = {}
+    for i, placement_id in enumerate(order):
+        expected = {
+            "prev_placement_id": order[i - 1] if i > 0 else None,
+            "next_placement_id": order[i + 1] if i + 1 < len(order) else None,
+            "ordinal": i + 1,
+            "order_key": order_keys[i],
+        }
+        placement = placements[placement_id]
+        changes = {
+            key: value
+            for key, value in expected.items()
+            if placement.get(key) != value
+        }
+        if changes:
+            placement_updates[placement_id] = changes
+
+    stream_update = {}
+    expected_head = order[0] if order else None
+    expected_tail = order[-1] if order else None
+    if stream_data.get("first_drop_placement_id") != expected_head:
+        stream_update["first_drop_placement_id"] = expected_head
+    if stream_data.get("last_drop_placement_id") != expected_tail:
+        stream_update["last_drop_placement_id"] = expected_tail
+    if stream_data.get("drop_count") != len(order):
+        stream_update["drop_count"] = len(order)
+    expected_last_key = order_keys[-1] if order else None
+    if "last_order_key" not in stream_data or (
+        stream_data["last_order_key"] != expected_last_key
+    ):
+        stream_update["last_order_key"] = expected_last_key
+    return placement_updates, stream_update
+
+
+def _page_is_current(page_data: Optional[dict], order: List[str]) -> bool:
+    if page_data is None:
+        return False
+    head = [entry["placement_id"] for entry in page_data["head"]]
+    tail = [entry["placement_id"] for entry in page_data["tail"]]
+    first_tail_ordinal = len(order) - len(tail) + 1
+    return (
+        page_data.get("drop_count") == len(order)
+        and head == order[:len(head)]
+        and (not tail or tail == order[-len(tail):])
+        and all(
+            entry.get("ordinal") == i + 1
+            for i, entry in enumerate(page_data["head"])
+        )
+        and all(
+            entry.get("ordinal") == first_tail_ordinal + i
+            for i, entry in enumerate(page_data["tail"])
+        )
+    )
+
+
+def rebuild_page(
+    stream_id: str, order: List[str], placements: Dict[str, dict]
+) -> None:
+    """Rewrites a stream's page snapshot from its canonical order."""
+    head_ids = order[:stream_pages.PAGE_SIZE]
+    tail_ids = order[-stream_pages.PAGE_SIZE:]
+    drops = get_drops(
+        placements[placement_id]["drop_id"]
+        for placement_id in head_ids + tail_ids
+    )
+    index = {placement_id: i for i, placement_id in enumerate(order)}
+
+    def entry(placement_id):
+        drop = drops.get(placements[placement_id]["drop_id"])
+        if drop is None:
+            return None
+        i = index[placement_id]
+        return {
+            **drop,
+            "placement_id": placement_id,
+            "prev_placement_id": order[i - 1] if i > 0 else None,
+            "next_placement_id": order[i + 1] if i + 1 < len(order) else None,
+            "ordinal": i + 1,
+        }
+
+    page = stream_pages.build_page(
+        stream_id,
+        len(order),
+        [e for e in map(entry, head_ids) if e is not None],
+        [e for e in map(entry, tail_ids) if e is not None],
+    )
+    stream_pages.write_page(stream_id, page)
+
+
+def _commit_in_batches(writes) -> int:
+    """Applies (ref, update) pairs in batches of at most 500 writes."""
+    batch = db.batch()
+    pending = 0
+    total = 0
+    for ref, update in writes:
+        batch.update(ref, update)
+        pending += 1
+        if pending == MAX_BATCH_SIZE:
+            batch.commit()
+            total += pending
+            batch = db.batch()
+            pending = 0
+    if pending:
+        batch.commit()
+        total += pending
+    return total
+
+
+def load_placements(stream_id: str) -> Dict[str, dict]:
+    """Fetches every placement of a stream with a single query."""
+    docs = stream_drops_collection.where("stream_id", "==", stream_id).stream()
+    return {doc.id: doc.to_dict() for doc in docs}
+
+
+def check_stream(
+    stream_id: str,
+    stream_data: Optional[dict] = None,
+    repair: bool = False,
+) -> ChainReport:
+    """Verifies one stream's chain and optionally repairs it."""
+    if stream_data is None:
+        stream_doc = streams_collection.document(stream_id).get()
+        if not stream_doc.exists:
+            raise ValueError(f"Stream {stream_id} not found")
+        stream_data = stream_doc.to_dict()
+
+    placements = load_placements(stream_id)
+    report = analyze_chain(stream_id, stream_data, placements)
+
+    page_doc = stream_pages_collection.document(stream_id).get()
+    page_data = page_doc.to_dict() if page_doc.exists else None
+    page_is_current = _page_is_current(page_data, report.canonical_order)
+    if not page_is_current:
+        report.issues.append("page snapshot missing or out of date")
+
+    if report.ok or not repair:
+        return report
+
+    placement_updates, stream_update = plan_repair(
+        report, stream_data, placements
+    )
+    writes = [
+        (stream_drops_collection.document(placement_id), update)
+        for placement_id, update in placement_updates.items()
+    ]
+    if stream_update:
+        writes.append((streams_collection.document(stream_id), stream_update))
+
+    report.repaired_writes = _commit_in_batches(writes)
+    if not page_is_current:
+        rebuild_page(stream_id, report.canonical_order, placements)
+        report.repaired_writes += 1
+    app_logger.warning(
+        "Repaired stream %s with %s writes: %s",
+        stream_id,
+        report.repaired_writes,
+        "; ".join(report.issues),
+    )
+    return report
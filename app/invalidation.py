@@ -0,0 +1,351 @@
+"""
+Cache invalidation shared by the worker processes of all instances.
+
+Each worker keeps its own in-memory caches. When a worker changes data it
+publishes an invalidation; handlers subscribed to that channel run in the
+publishing worker immediately, in every sibling worker shortly after and,
+with a transport configured, in the workers of every other instance.
+
+Workers find each other through a directory (INVALIDATION_BUS_DIR, set by
+gunicorn.conf.py): each binds a uniquely named Unix datagram socket there
+and publishing sends one datagram to every other socket. Without the
+directory (single-process mode) publishing only runs the local handlers.
+
+Other instances are reached through the transport chosen with
+INVALIDATION_TRANSPORT:
+
+- `none` (default): instances rely on their caches' TTLs.
+- `firestore`: `FirestoreTransport` writes events to the `changes`
+  collection and every instance listens to it with `on_snapshot`.
+- `memory`: `MemoryTransport`, an in-process stand-in used by tests to run
+  several buses as if they were separate instances.
+
+Every worker of an instance listens to the transport and skips events from
+its own instance (INSTANCE_ID, shared by the workers through
+gunicorn.conf.py), which its siblings already got through the sockets.
+"""
+import datetime
+import json
+import os
+import socket
+import threading
+import uuid
+from collections import Counter
+from os import environ
+from typing import Callable, Dict, List, Optional
+
+from firebase_admin import firestore
+
+from app.db import changes_collection
+from app.logger import app_logger
+
+MAX_MESSAGE_BYTES = 8192
+
+INSTANCE_ID = environ.get("INSTANCE_ID") or uuid.uuid4().hex
+
+TRANSPORT = environ.get("INVALIDATION_TRANSPORT", "none")
+# Events published within this window are written as one document.
+FLUSH_SECONDS = float(environ.get("INVALIDATION_FLUSH_MS", "50")) / 1000
+# Number of newest change documents each instance listens to.
+LISTEN_WINDOW = int(environ.get("INVALIDATION_LISTEN_WINDOW", "500"))
+# Change documents carry an `expires_at` for a Firestore TTL policy.
+CHANGES_TTL_SECONDS = float(environ.get("INVALIDATION_CHANGES_TTL", "3600"))
+# Keeps change documents well below Firestore's 1 MiB limit.
+MAX_EVENTS_PER_DOC = 500
+
+Deliver = Callable[[str, str], None]
+
+
+class FirestoreTransport:
+    """
+    Relays invalidations between instances through a Firestore collection.
+
+    Events published within FLUSH_SECONDS are written together as one
+    document. Each instance watches the LISTEN_WINDOW newest documents and
+    delivers the events of documents added by other instances.
+    """
+
+    def __init__(self, collection, origin: str = INSTANCE_ID):
+        self.collection = collection
+        self.origin = origin
+        self._pending: List[dict] = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._watch = None
+        self._deliver: Optional[Deliver] = None
+        self._initial = True
+        self._counts = Counter()
+
+    def start(self, deliver: Deliver) -> None:
+        if self._thread is not None:
+            return
+        self._deliver = deliver
+        self._initial = True
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="invalidation-flusher", daemon=True
+        )
+        self._thread.start()
+        query = self.collection.order_by(
+            "published_at", direction=firestore.Query.DESCENDING
+        ).limit(LISTEN_WINDOW)
+        self._watch = query.on_snapshot(self._on_snapshot)
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout=5)
+        self._thread = None
+        if self._watch is not None:
+            self._watch.unsubscribe()
+            self._watch = None
+
+    def send(self, channel: str, key: str) -> None:
+        with self._lock:
+            self._pending.append({"channel": channel, "key": key})
+        self._wake.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait()
+            # Let a burst of invalidations collect into one document.
+            self._stop.wait(FLUSH_SECONDS)
+            self._wake.clear()
+            self.flush()
+        self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            events, self._pending = self._pending, []
+        for start in range(0, len(events), MAX_EVENTS_PER_DOC):
+            chunk = events[start:start + MAX_EVENTS_PER_DOC]
+            expires_at = datetime.datetime.now(
+                datetime.timezone.utc
+            ) + datetime.timedelta(seconds=CHANGES_TTL_SECONDS)
+            try:
+                # Random IDs keep the writes spread over the keyspace.
+                self.collection.document(uuid.uuid4().hex).set({
+                    "origin": self.origin,
+                    "events": chunk,
+                    "published_at": firestore.SERVER_TIMESTAMP,
+                    "expires_at": expires_at,
+                })
+                self._count("sent_docs")
+                self._count("sent", len(chunk))
+            except Exception as e:
+                self._count("send_errors")
+                app_logger.warning(
+                    "Failed to publish %s invalidations: %s", len(chunk), e
+                )
+
+    def _on_snapshot(self, docs, changes, read_time) -> None:
+        # The first snapshot holds changes made before this instance started.
+        if self._initial:
+            self._initial = False
+            return
+        for change in changes:
+            if change.type.name != "ADDED":
+                continue
+            data = change.document.to_dict()
+            if data.get("origin") == self.origin:
+                continue
+            for event in data.get("events", []):
+                self._count("received")
+                self._deliver(event["channel"], event["key"])
+
+    def _count(self, outcome: str, n: int = 1) -> None:
+        with self._lock:
+            self._counts[outcome] += n
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "kind": "firestore",
+                "pending": len(self._pending),
+                **self._counts,
+            }
+
+
+class MemoryTransport:
+    """
+    In-process stand-in for FirestoreTransport: delivers events straight
+    to the other transports started on the same hub (a list).
+    """
+
+    def __init__(self, origin: str = INSTANCE_ID, hub: list = None):
+        self.origin = origin
+        self.hub = _memory_hub if hub is None else hub
+        self._deliver: Optional[Deliver] = None
+
+    def start(self, deliver: Deliver) -> None:
+        self._deliver = deliver
+        if self not in self.hub:
+            self.hub.append(self)
+
+    def stop(self) -> None:
+        if self in self.hub:
+            self.hub.remove(self)
+
+    def send(self, channel: str, key: str) -> None:
+        for transport in list(self.hub):
+            if transport.origin != self.origin:
+                transport._deliver(channel, key)
+
+    def stats(self) -> dict:
+        return {"kind": "memory", "peers": len(self.hub) - 1}
+
+
+_memory_hub: list = []
+
+
+class InvalidationBus:
+    """Fans invalidations out to this worker's handlers and its siblings."""
+
+    def __init__(self, directory: str = None, transport=None):
+        self.directory = directory
+        self.transport = transport
+        self._handlers: Dict[str, List[Callable[[str], None]]] = {}
+        self._socket = None
+        self._path = None
+        self._thread = None
+        self._stopping = False
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel: str, handler: Callable[[str], None]) -> None:
+        self._handlers.setdefault(channel, []).append(handler)
+
+    def publish(self, channel: str, key: str) -> None:
+        self._dispatch(channel, key)
+        if self.transport is not None:
+            self.transport.send(channel, key)
+        if self._socket is None:
+            return
+        message = json.dumps([channel, key]).encode()
+        if len(message) > MAX_MESSAGE_BYTES:
+            app_logger.warning(
+                "Invalidation for %s too large to send", channel
+            )
+            return
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if not name.endswith(".sock") or path == self._path:
+                continue
+            try:
+                self._socket.sendto(message, path)
+                self._count("sent")
+            except (ConnectionRefusedError, FileNotFoundError):
+                # The worker is gone; remove its socket so nobody retries it.
+                self._count("dead_peers")
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+            except OSError as e:
+                self._count("send_errors")
+                app_logger.warning("Failed to send invalidation: %s", e)
+
+    def _dispatch(self, channel: str, key: str) -> None:
+        for handler in self._handlers.get(channel, []):
+            try:
+                handler(key)
+            except Exception as e:
+                app_logger.error(
+                    "Invalidation handler for %s failed: %s", channel, e
+                )
+
+    def _count(self, outcome: str) -> None:
+        with self._lock:
+            self._counts[outcome] += 1
+
+    def _deliver_remote(self, channel: str, key: str) -> None:
+        # Every worker of the other instance gets the event itself, so it
+        # isn't passed on to the siblings.
+        self._count("remote_received")
+        self._dispatch(channel, key)
+
+    def _listen(self) -> None:
+        sock = self._socket
+        while True:
+            try:
+                message = sock.recv(MAX_MESSAGE_BYTES)
+            except OSError:
+                return
+            if self._stopping:
+                return
+            try:
+                channel, key = json.loads(message)
+            except ValueError:
+                continue
+            self._count("received")
+            self._dispatch(channel, key)
+
+    def start(self) -> None:
+        if self.transport is not None:
+            self.transport.start(self._deliver_remote)
+        if not self.directory or self._socket is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._path = os.path.join(
+            self.directory, f"{os.getpid()}-{uuid.uuid4().hex[:8]}.sock"
+        )
+        self._stopping = False
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.bind(self._path)
+        self._thread = threading.Thread(
+            target=self._listen, name="invalidation-bus", daemon=True
+        )
+        self._thread.start()
+        app_logger.info("Invalidation bus listening on %s", self._path)
+
+    def stop(self) -> None:
+        if self.transport is not None:
+            self.transport.stop()
+        if self._socket is None:
+            return
+        # Wake the listener thread blocked in recv() so it can exit.
+        self._stopping = True
+        try:
+            self._socket.sendto(b"", self._path)
+        except OSError:
+            pass
+        self._thread.join(timeout=1)
+        self._socket.close()
+        self._socket = None
+        try:
+            os.unlink(self._path)
+        except FileNotFoundError:
+            pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self._counts)
+        return {
+            "mode": "unix" if self._socket is not None else "local",
+            "pid": os.getpid(),
+            "instance": INSTANCE_ID,
+            "transport": (
+                self.transport.stats() if self.transport is not None
+                else {"kind": "none"}
+            ),
+            **counts,
+        }
+
+
+def _transport_from_env():
+    if TRANSPORT == "firestore":
+        return FirestoreTransport(changes_collection)
+    if TRANSPORT == "memory":
+        return MemoryTransport()
+    if TRANSPORT != "none":
+        app_logger.warning("Unknown INVALIDATION_TRANSPORT %r", TRANSPORT)
+    return None
+
+
+bus = InvalidationBus(
+    environ.get("INVALIDATION_BUS_DIR"), _transport_from_env()
+)
@@ -1,5 +1,6 @@
 import logging
 import io
+import os
 
 # --- In-memory logging setup ---
 # Create a thread-safe in-memory stream for logs
@@ -21,4 +22,36 @@ formatter = logging.Formatter(
 )
 handler.setFormatter(formatter)
 app_logger.addHandler(handler)
+
+# With several worker processes each one has its own in-memory buffer, so
+# gunicorn.conf.py points APP_LOG_FILE at a file all workers append to and
+# /logs serves that instead.
+log_file = os.environ.get("APP_LOG_FILE")
+if log_file:
+    file_handler = logging.FileHandler(log_file)
+    file_handler.setFormatter(
+        logging.Formatter(
+            '%(asctime)s - %(name)s - %(levelname)s - '
+            '[pid %(process)d] %(message)s'
+        )
+    )
+    app_logger.addHandler(file_handler)
 # --- End of logging setup ---
+
+
+def read_log_buffer() -> str:
+    if log_file:
+        try:
+            with open(log_file) as f:
+                return f.read()
+        except FileNotFoundError:
+            return ""
+    return log_stream.getvalue()
+
+
+def clear_log_buffer() -> None:
+    if log_file:
+        # Workers append with O_APPEND, so truncating in place is safe.
+        open(log_file, "w").close()
+    log_stream.truncate(0)
+    log_stream.seek(0)
@@ -1,41 +1,113 @@
-from fastapi import FastAPI, Response
-from app.endpoints import health, pools, streams, drops, user
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, Response
+from app.endpoints import debug, health, pools, streams, drops, user, search
 import datetime
-from app.logger import app_logger, log_stream
+from app.logger import app_logger, clear_log_buffer, read_log_buffer
+from app.search import search_index
+from app.cache import drop_cache
+from app.rate_limit import limiter, rate_limit
+from app.overview import overview_cache
+from app.invalidation import bus
+from app.firestore_client import channel_metrics
+from app.deadlines import DeadlineMiddleware, hedge_stats
+from app.append_queue import sequencer
+from app.deletions import cleaner
+from app.renumbering import renumberer
+from app.trending import read_tracker
+from app.profiler import ProfileMiddleware
+from app.consistency import ConsistencyMiddleware
+from app import profiler
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    bus.start()
+    search_index.start()
+    sequencer.start()
+    cleaner.start()
+    renumberer.start()
+    read_tracker.start()
+    yield
+    read_tracker.stop()
+    renumberer.stop()
+    cleaner.stop()
+    sequencer.stop()
+    search_index.stop()
+    bus.stop()
 
 
 app = FastAPI(
     title="Wisdom Pool Server",
     version="1.3",
+    lifespan=lifespan,
 )
+app.add_middleware(DeadlineMiddleware)
+app.add_middleware(ConsistencyMiddleware)
+app.add_middleware(ProfileMiddleware)
 
 # Store startup time
 app.state.start_time = datetime.datetime.utcnow()
 
 # Include routers
 app.include_router(health.router, tags=["Monitoring"])
-app.include_router(pools.router, prefix="/api/v1", tags=["Pools"])
-app.include_router(streams.router, prefix="/api/v1", tags=["Streams"])
-app.include_router(drops.router, prefix="/api/v1", tags=["Drops"])
-app.include_router(user.router, prefix="/api/v1", tags=["User"])
+app.include_router(debug.router, include_in_schema=False)
+api_dependencies = [Depends(rate_limit)]
+app.include_router(
+    pools.router, prefix="/api/v1", tags=["Pools"],
+    dependencies=api_dependencies,
+)
+app.include_router(
+    streams.router, prefix="/api/v1", tags=["Streams"],
+    dependencies=api_dependencies,
+)
+app.include_router(
+    drops.router, prefix="/api/v1", tags=["Drops"],
+    dependencies=api_dependencies,
+)
+app.include_router(
+    user.router, prefix="/api/v1", tags=["User"],
+    dependencies=api_dependencies,
+)
+app.include_router(
+    search.router, prefix="/api/v1", tags=["Search"],
+    dependencies=api_dependencies,
+)
 
 
 @app.get("/logs", include_in_schema=False)
 def get_logs():
-    """Returns the content of the in-memory log."""
-    log_content = log_stream.getvalue()
+    """Returns the content of the in-memory (or shared worker) log."""
+    log_content = read_log_buffer()
     return Response(content=log_content, media_type="text/plain")
 
 
 @app.delete("/logs/clear", include_in_schema=False)
 def clear_logs():
-    """Clears the in-memory log."""
-    log_stream.truncate(0)
-    log_stream.seek(0)
+    """Clears the in-memory (or shared worker) log."""
+    clear_log_buffer()
     app_logger.info("Log cleared.")
     return {"message": "Log cleared."}
 
 
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """Returns in-process counters for caches, search and rate limiting."""
+    return {
+        "rate_limit": limiter.metrics(),
+        "drop_cache": drop_cache.stats(),
+        "pool_overview_cache": overview_cache.stats(),
+        "search": search_index.stats(),
+        "invalidation_bus": bus.stats(),
+        "firestore": channel_metrics(),
+        "hedged_reads": hedge_stats(),
+        "append_queue": sequencer.stats(),
+        "cleanup": cleaner.stats(),
+        "renumbering": renumberer.stats(),
+        "profiler": profiler.stats(),
+        "trending": read_tracker.stats(),
+    }
+
+
 @app.get("/", include_in_schema=False)
 def read_root():
     return {"message": "Server is running"}
@@ -1,7 +1,10 @@
 from datetime import datetime
 from typing import List, Optional
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
+
+# Length of the `snippet` a drop's content carries for previews.
+SNIPPET_LENGTH = 160
 
 
 class PoolContent(BaseModel):
@@ -27,6 +30,7 @@ class PoolListResponse(BaseModel):
     total_count: int
     has_more: bool
     next_offset: Optional[int] = None
+    next_cursor: Optional[str] = None
 
 
 class StreamContent(BaseModel):
@@ -62,6 +66,9 @@ class Stream(BaseModel):
         None,
         example="placement_987",
     )
+    drop_count: Optional[int] = Field(None, example=25)
+    last_order_key: Optional[str] = Field(None, example="a4")
+    version: Optional[int] = Field(None, example=7)
     content: StreamContent
 
 
@@ -70,6 +77,7 @@ class StreamListResponse(BaseModel):
     total_count: int
     has_more: bool
     next_offset: Optional[int] = None
+    next_cursor: Optional[str] = None
 
 
 class DropContent(BaseModel):
@@ -86,6 +94,28 @@ class DropContent(BaseModel):
         example=["https://example.com/superposition.jpg"],
     )
     type: Optional[str] = Field("text", example="text")
+    # The start of `text`, set when the drop is written (see drop_snippet).
+    snippet: Optional[str] = Field(
+        None,
+        example="Superposition is a fundamental principle of quantum...",
+    )
+
+    @model_validator(mode="after")
+    def _fill_snippet(self):
+        # Drops written before snippets existed.
+        if self.snippet is None:
+            self.snippet = drop_snippet(self.text)
+        return self
+
+
+def drop_snippet(text: str) -> str:
+    """The start of `text`, cut at a word, in SNIPPET_LENGTH characters."""
+    text = " ".join(text.split())
+    if len(text) <= SNIPPET_LENGTH:
+        return text
+    cut = text[:SNIPPET_LENGTH - 2]
+    cut = cut.rsplit(" ", 1)[0] if " " in cut else cut[:-1]
+    return cut.rstrip(".,;:!?") + "..."
 
 
 class Drop(BaseModel):
@@ -101,9 +131,16 @@ class StreamDropPlacement(BaseModel):
     drop_id: str = Field(..., example="drop_abc")
     next_placement_id: Optional[str] = None
     prev_placement_id: Optional[str] = None
+    ordinal: Optional[int] = Field(None, example=7)
+    order_key: Optional[str] = Field(None, example="a4")
     added_at: datetime
 
 
+class DropPlacementsResponse(BaseModel):
+    drop_id: str
+    placements: List[StreamDropPlacement]
+
+
 class AddDropResponse(Drop):
     placement_id: str
     stream_id: str
@@ -114,16 +151,96 @@ class AddDropsResponse(BaseModel):
     drops: List[AddDropResponse]
 
 
+class QueuedDropsResponse(BaseModel):
+    stream_id: str
+    # Saved drops waiting to be linked into the stream, in order.
+    drops: List[Drop]
+
+
 class DropInStream(Drop):
     placement_id: str
     next_placement_id: Optional[str] = None
     prev_placement_id: Optional[str] = None
+    ordinal: Optional[int] = None
 
 
 class GetDropsResponse(BaseModel):
     drops: List[DropInStream]
     has_more: bool
     total_count: int
+    # Set when the page was cut short by the request deadline; pass it as
+    # from_placement_id to continue.
+    continuation_token: Optional[str] = None
+
+
+class StreamSummary(Stream):
+    first_drop: Optional[DropInStream] = None
+
+
+class PoolOverviewResponse(BaseModel):
+    pool: Pool
+    streams: List[StreamSummary]
+    total_count: int
+    has_more: bool
+    next_cursor: Optional[str] = None
+
+
+class BatchGetRequest(BaseModel):
+    ids: List[str] = Field(
+        ..., min_length=1, max_length=300, example=["stream_456", "stream_789"]
+    )
+
+
+class PoolBatchResponse(BaseModel):
+    pools: List[Pool]
+    missing: List[str]
+
+
+class StreamBatchResponse(BaseModel):
+    streams: List[Stream]
+    missing: List[str]
+
+
+class TrendingStream(Stream):
+    score: float = Field(
+        ...,
+        example=412.5,
+        description="Reads weighted by recency, across all instances.",
+    )
+
+
+class TrendingStreamsResponse(BaseModel):
+    streams: List[TrendingStream]
+
+
+class DropBatchResponse(BaseModel):
+    drops: List[Drop]
+    missing: List[str]
+
+
+class PlacementBatchResponse(BaseModel):
+    placements: List[StreamDropPlacement]
+    missing: List[str]
+
+
+class DeletionResponse(BaseModel):
+    kind: str = Field(..., example="stream")
+    id: str = Field(..., example="stream_456")
+    deleted_at: datetime
+    # Cleanup step the deleted item's dependents are at.
+    phase: str = Field(..., example="placements")
+
+
+class SearchHit(BaseModel):
+    kind: str = Field(..., example="stream")
+    id: str = Field(..., example="stream_456")
+    title: Optional[str] = Field(None, example="Exploring Quantum Mechanics")
+    parent_id: Optional[str] = Field(None, example="pool_123")
+    score: float
+
+
+class SearchResponse(BaseModel):
+    hits: List[SearchHit]
 
 
 class HealthStatus(BaseModel):
@@ -143,7 +260,31 @@ class RiverRecord(BaseModel):
     stream_id: str
     last_read_placement_id: Optional[str] = None
     updated_at: datetime
+    # Only filled in when the river is requested with hydrate=true.
+    title: Optional[str] = None
+    image: Optional[str] = None
+    drop_count: Optional[int] = None
+    drops_remaining: Optional[int] = None
+    # Ordinal of the last-read drop and how far into the stream it is, as
+    # of the last progress update (or now, with hydrate=true). None for
+    # placements without an ordinal.
+    position: Optional[int] = None
+    completion: Optional[float] = Field(None, example=62.5)
+    is_completed: Optional[bool] = None
 
 
 class RiverResponse(BaseModel):
     records: List[RiverRecord]
+
+
+class ResumeResponse(BaseModel):
+    stream: Stream
+    last_read_placement_id: Optional[str] = None
+    updated_at: Optional[datetime] = None
+    # The last-read drop with up to `before` drops before and `after` after
+    # it; the stream's first drops if nothing was read yet.
+    drops: List[DropInStream]
+    has_more_before: bool
+    has_more_after: bool
+    total_count: int
+    drops_remaining: Optional[int] = None
@@ -0,0 +1,167 @@
+"""
+Fractional order keys for stream placements.
+
+Every placement of a stream carries an `order_key`, a string that sorts
+(lexicographically, as Firestore compares strings) in stream order. A key
+can always be generated between any two adjacent keys, so inserting or
+moving a drop writes only the placement itself and its neighbours, and a
+page of a stream is one range query ordered by `order_key`.
+
+Keys are base-62 strings made of a variable-length integer part followed by
+an optional fraction (the scheme described in
+https://observablehq.com/@dgreensp/implementing-fractional-indexing).
+Appends only increment the integer part, so keys of append-only streams stay
+a few characters long; inserts between two keys extend the fraction.
+"""
+from typing import List, Optional
+
+DIGITS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+_BASE = len(DIGITS)
+INTEGER_ZERO = "a0"
+_SMALLEST_INTEGER = "A" + "0" * 26
+
+
+def _midpoint(a: str, b: Optional[str]) -> str:
+    """
+    Returns a fraction strictly between fractions `a` and `b` (None means
+    no upper bound). Neither may end in "0".
+    """
+    if b is not None:
+        # Skip the common prefix; `a` is padded with zeros.
+        n = 0
+        while n < len(b) and (a[n] if n < len(a) else "0") == b[n]:
+            n += 1
+        if n > 0:
+            return b[:n] + _midpoint(a[n:], b[n:])
+    digit_a = DIGITS.index(a[0]) if a else 0
+    digit_b = DIGITS.index(b[0]) if b is not None else _BASE
+    if digit_b - digit_a > 1:
+        return DIGITS[(digit_a + digit_b + 1) // 2]
+    if b is not None and len(b) > 1:
+        return b[:1]
+    return DIGITS[digit_a] + _midpoint(a[1:], None)
+
+
+def _integer_length(head: str) -> int:
+    if "a" <= head <= "z":
+        return ord(head) - ord("a") + 2
+    if "A" <= head <= "Z":
+        return ord("Z") - ord(head) + 2
+    raise ValueError(f"Invalid order key head: {head!r}")
+
+
+def _split(key: str):
+    """Returns the integer part and fraction of a key, validating it."""
+    if not key or key == _SMALLEST_INTEGER:
+        raise ValueError(f"Invalid order key: {key!r}")
+    length = _integer_length(key[0])
+    if length > len(key) or (len(key) > length and key.endswith("0")):
+        raise ValueError(f"Invalid order key: {key!r}")
+    if any(ch not in DIGITS for ch in key[1:]):
+        raise ValueError(f"Invalid order key: {key!r}")
+    return key[:length], key[length:]
+
+
+def _increment_integer(integer: str) -> Optional[str]:
+    head, digits = integer[0], list(integer[1:])
+    for i in reversed(range(len(digits))):
+        value = DIGITS.index(digits[i]) + 1
+        if value < _BASE:
+            digits[i] = DIGITS[value]
+            return head + "".join(digits)
+        digits[i] = "0"
+    # Every digit carried over: move to the next integer length.
+    if head == "Z":
+        return "a0"
+    if head == "z":
+        return None
+    head = chr(ord(head) + 1)
+    if head > "a":
+        digits.append("0")
+    else:
+        digits.pop()
+    return head + "".join(digits)
+
+
+def _decrement_integer(integer: str) -> Optional[str]:
+    head, digits = integer[0], list(integer[1:])
+    for i in reversed(range(len(digits))):
+        value = DIGITS.index(digits[i]) - 1
+        if value >= 0:
+            digits[i] = DIGITS[value]
+            return head + "".join(digits)
+        digits[i] = DIGITS[-1]
+    if head == "a":
+        return "Z" + DIGITS[-1]
+    if head == "A":
+        return None
+    head = chr(ord(head) - 1)
+    if head < "Z":
+        digits.append(DIGITS[-1])
+    else:
+        digits.pop()
+    return head + "".join(digits)
+
+
+def key_between(a: Optional[str], b: Optional[str]) -> str:
+    """
+    Returns a key that sorts after `a` and before `b`. None stands for the
+    start (as `a`) or the end (as `b`) of the stream.
+    """
+    if a is not None and b is not None and a >= b:
+        raise ValueError(f"Order key {a!r} is not before {b!r}")
+    if a is None:
+        if b is None:
+            return INTEGER_ZERO
+        integer_b, fraction_b = _split(b)
+        if integer_b == _SMALLEST_INTEGER:
+            return integer_b + _midpoint("", fraction_b)
+        if integer_b < b:
+            return integer_b
+        decremented = _decrement_integer(integer_b)
+        if decremented is None:
+            raise ValueError("Cannot generate an order key before " + b)
+        return decremented
+
+    integer_a, fraction_a = _split(a)
+    if b is None:
+        incremented = _increment_integer(integer_a)
+        if incremented is None:
+            return integer_a + _midpoint(fraction_a, None)
+        return incremented
+
+    integer_b, fraction_b = _split(b)
+    if integer_a == integer_b:
+        return integer_a + _midpoint(fraction_a, fraction_b)
+    incremented = _increment_integer(integer_a)
+    if incremented is not None and incremented < b:
+        return incremented
+    return integer_a + _midpoint(fraction_a, None)
+
+
+def keys_between(a: Optional[str], b: Optional[str], n: int) -> List[str]:
+    """Returns `n` ascending keys between `a` and `b`, kept short."""
+    if n <= 0:
+        return []
+    if n == 1:
+        return [key_between(a, b)]
+    if b is None:
+        keys = []
+        for _ in range(n):
+            a = key_between(a, None)
+            keys.append(a)
+        return keys
+    if a is None:
+        keys = []
+        for _ in range(n):
+            b = key_between(None, b)
+            keys.append(b)
+        return keys[::-1]
+    # Bisect so that key lengths grow with log(n) rather than n.
+    middle = n // 2
+    key = key_between(a, b)
+    return (
+        keys_between(a, key, middle)
+        + [key]
+        + keys_between(key, b, n - middle - 1)
+    )
@@ -0,0 +1,210 @@
+"""
+Pool overview read model: a pool, the first page of its streams and, per
+stream, its drop count and first drop, assembled from a handful of reads.
+
+Overviews are cached in process. Creating a stream invalidates its pool's
+overview; adding drops invalidates the overview showing that stream. Both
+are published on the invalidation bus so sibling workers and other
+instances drop their copies too.
+
+Each overview records the versions of the pool and streams it was built
+from (see app/consistency.py). Invalidations carry the version written, so
+an overview that already shows a change is kept, and a request whose
+consistency token asks for a newer version than the cached overview's gets
+a fresh one.
+"""
+import threading
+from os import environ
+from typing import Dict, Optional
+
+from cachetools import TTLCache
+
+from app import consistency
+from app.cache import LocalCache, get_drops
+from app.counters import get_count, pool_streams_key
+from app.db import (
+    db, pools_collection, streams_collection, stream_drops_collection,
+    stream_pages_collection
+)
+from app.invalidation import bus
+from app.pagination import apply_cursor
+
+# Number of streams kept in a cached overview; requests page within it.
+OVERVIEW_STREAMS = int(environ.get("POOL_OVERVIEW_STREAMS", "20"))
+
+_CACHE_SIZE = int(environ.get("POOL_OVERVIEW_CACHE_SIZE", "1000"))
+_CACHE_TTL = float(environ.get("POOL_OVERVIEW_TTL_SECONDS", "30"))
+
+overview_cache = LocalCache(
+    "pool_overviews", maxsize=_CACHE_SIZE, ttl=_CACHE_TTL
+)
+
+# stream_id -> pool_id for every stream shown in a cached overview.
+_stream_pools = TTLCache(
+    maxsize=_CACHE_SIZE * (OVERVIEW_STREAMS + 1), ttl=_CACHE_TTL
+)
+_stream_pools_lock = threading.Lock()
+
+# Newest version of each pool and stream heard of through invalidations, so
+# that an overview built before an event arrived isn't served after it.
+_latest_versions = TTLCache(maxsize=_CACHE_SIZE * 10, ttl=_CACHE_TTL)
+_latest_lock = threading.Lock()
+
+
+def _first_drops(streams: Dict[str, dict]) -> Dict[str, Optional[dict]]:
+    """
+    Returns the first DropInStream entry and drop count of each stream,
+    read from the page snapshots with one batched get.
+    """
+    page_refs = [
+        stream_pages_collection.document(stream_id) for stream_id in streams
+    ]
+    summaries = {}
+    legacy = {}
+    for doc in db.get_all(page_refs):
+        if doc.exists:
+            page = doc.to_dict()
+            summaries[doc.id] = {
+                "drop_count": page.get("drop_count", 0),
+                "first_drop": page["head"][0] if page["head"] else None,
+            }
+        elif streams[doc.id].get("first_drop_placement_id"):
+            legacy[doc.id] = streams[doc.id]["first_drop_placement_id"]
+
+    # Streams without a snapshot fall back to their head placement.
+    if legacy:
+        placement_refs = [
+            stream_drops_collection.document(placement_id)
+            for placement_id in legacy.values()
+        ]
+        placements = {
+            doc.id: doc.to_dict()
+            for doc in db.get_all(placement_refs)
+            if doc.exists
+        }
+        drops = get_drops(
+            placement["drop_id"] for placement in placements.values()
+        )
+        for stream_id, placement_id in legacy.items():
+            placement = placements.get(placement_id)
+            drop = drops.get(placement["drop_id"]) if placement else None
+            summaries[stream_id] = {
+                "drop_count": streams[stream_id].get("drop_count"),
+                "first_drop": {
+                    **drop,
+                    "placement_id": placement_id,
+                    "prev_placement_id": None,
+                    "next_placement_id": placement.get("next_placement_id"),
+                } if drop else None,
+            }
+    return summaries
+
+
+def build_overview(pool_id: str) -> Optional[dict]:
+    """Reads a pool's overview from Firestore; None if the pool is missing."""
+    pool_doc = pools_collection.document(pool_id).get()
+    if not pool_doc.exists:
+        return None
+
+    query = streams_collection.where("pool_id", "==", pool_id)
+    total_count = get_count(pool_streams_key(pool_id), query)
+    stream_docs = list(
+        apply_cursor(query, None).limit(OVERVIEW_STREAMS + 1).stream()
+    )
+    streams = {doc.id: doc.to_dict() for doc in stream_docs}
+    summaries = _first_drops(streams) if streams else {}
+
+    stream_summaries = []
+    for stream_id, stream_data in streams.items():
+        summary = summaries.get(stream_id, {})
+        stream_summaries.append({
+            **stream_data,
+            "drop_count": summary.get(
+                "drop_count", stream_data.get("drop_count")
+            ),
+            "first_drop": summary.get("first_drop"),
+        })
+
+    versions = {pool_id: consistency.timestamp_version(pool_doc.read_time)}
+    for stream_id, stream_data in streams.items():
+        versions[stream_id] = stream_data.get("version") or 0
+
+    return {
+        "pool": pool_doc.to_dict(),
+        "streams": stream_summaries,
+        "total_count": total_count,
+        "versions": versions,
+    }
+
+
+def _is_current(overview: dict) -> bool:
+    with _latest_lock:
+        latest = {
+            doc_id: _latest_versions[doc_id]
+            for doc_id in overview["versions"]
+            if doc_id in _latest_versions
+        }
+    return consistency.satisfies(overview["versions"], latest)
+
+
+def get_overview(pool_id: str) -> Optional[dict]:
+    overview = overview_cache.get(pool_id, _is_current)
+    if overview is None:
+        overview = build_overview(pool_id)
+        if overview is None:
+            return None
+        overview_cache.set(pool_id, overview)
+        with _stream_pools_lock:
+            for stream in overview["streams"]:
+                _stream_pools[stream["stream_id"]] = pool_id
+    return overview
+
+
+def _evict(pool_id: str, doc_id: str, version: Optional[int]) -> None:
+    """Drops a pool's overview unless it shows `version` of `doc_id`."""
+    if version is not None:
+        with _latest_lock:
+            if version > _latest_versions.get(doc_id, -1):
+                _latest_versions[doc_id] = version
+        overview_cache.invalidate(
+            pool_id,
+            keep=lambda overview: (
+                overview["versions"].get(doc_id, -1) >= version
+            ),
+        )
+    else:
+        overview_cache.invalidate(pool_id)
+
+
+def _drop_pool(key: str) -> None:
+    pool_id, version = consistency.parse_event_key(key)
+    _evict(pool_id, pool_id, version)
+
+
+def _drop_stream(key: str) -> None:
+    stream_id, version = consistency.parse_event_key(key)
+    with _stream_pools_lock:
+        pool_id = _stream_pools.get(stream_id)
+    if pool_id:
+        _evict(pool_id, stream_id, version)
+
+
+bus.subscribe("pool_overview", _drop_pool)
+bus.subscribe("pool_overview_stream", _drop_stream)
+
+
+def invalidate_pool(pool_id: str) -> None:
+    """
+    Drops cached overviews of `pool_id` older than the version this request
+    wrote; all of them if it wrote none.
+    """
+    version = consistency.written_version(pool_id)
+    bus.publish("pool_overview", consistency.event_key(pool_id, version))
+
+
+def invalidate_stream(stream_id: str) -> None:
+    """Drops the cached overview that shows `stream_id`, if any."""
+    version = consistency.written_version(stream_id)
+    bus.publish(
+        "pool_overview_stream", consistency.event_key(stream_id, version)
+    )
@@ -0,0 +1,35 @@
+import base64
+import datetime
+import json
+from typing import Optional, Tuple
+
+from fastapi import HTTPException
+
+
+def encode_cursor(created_at: datetime.datetime, doc_id: str) -> str:
+    """Encodes the (created_at, doc_id) position of the last returned item."""
+    payload = json.dumps([created_at.isoformat(), doc_id])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime.datetime, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, doc_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.datetime.fromisoformat(created_at), doc_id
+    except Exception:
+        raise HTTPException(status_code=422, detail="Invalid cursor")
+
+
+def apply_cursor(query, cursor: Optional[str]):
+    """
+    Orders a query by (created_at, document ID) and, when a cursor is given,
+    starts right after the item it points to.
+    """
+    query = query.order_by("created_at").order_by("__name__")
+    if cursor:
+        created_at, doc_id = decode_cursor(cursor)
+        query = query.start_after(
+            {"created_at": created_at, "__name__": doc_id}
+        )
+    return query
@@ -0,0 +1,353 @@
+"""
+On-demand sampling profiler for live instances.
+
+`SamplingProfiler` runs a thread that, every few milliseconds, reads the
+current stack of every other thread of the process with
+`sys._current_frames()`. That costs a few microseconds per thread per sample
+and nothing in between, so it is safe on a serving instance. Threads blocked
+on I/O (Firestore calls, locks) are sampled too, so waits show up next to
+CPU time. Profiles export to speedscope's JSON format (one profile per
+thread, https://www.speedscope.app) or to collapsed stacks for
+flamegraph.pl.
+
+`ProfileMiddleware` profiles single requests that carry an `X-Profile: 1`
+header from a debug user. At most PROFILE_MAX_CONCURRENT profiles (requests
+and `/debug/profile` runs together) are taken at a time; finished request
+profiles are kept for a while under the ID returned in `X-Profile-Id`.
+With several workers the request for a profile can reach another worker than
+the one that took it, so finished profiles are also written to PROFILE_DIR
+(set by gunicorn.conf.py), where every worker of the instance finds them.
+"""
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from os import environ
+from typing import Dict, List, Optional, Tuple
+
+from cachetools import TTLCache
+from starlette.concurrency import run_in_threadpool
+
+from app.auth import is_debug_token
+from app.logger import app_logger
+
+INTERVAL_SECONDS = float(environ.get("PROFILE_INTERVAL_MS", "10")) / 1000
+# Single requests are short, so they are sampled more often.
+REQUEST_INTERVAL_SECONDS = (
+    float(environ.get("PROFILE_REQUEST_INTERVAL_MS", "2")) / 1000
+)
+MAX_CONCURRENT = int(environ.get("PROFILE_MAX_CONCURRENT", "2"))
+MAX_STACK_DEPTH = 128
+
+# Shared by on-demand and per-request profiles.
+slots = threading.BoundedSemaphore(MAX_CONCURRENT)
+
+KEEP = int(environ.get("PROFILE_KEEP", "20"))
+KEEP_SECONDS = float(environ.get("PROFILE_KEEP_SECONDS", "600"))
+# Shared by the workers of an instance; unset in single-process mode.
+PROFILE_DIR = environ.get("PROFILE_DIR")
+
+_PROFILE_ID = re.compile(r"[0-9a-f]{32}")
+
+# Finished request profiles taken by this worker, by profile ID.
+recent_profiles = TTLCache(maxsize=KEEP, ttl=KEEP_SECONDS)
+_recent_lock = threading.Lock()
+
+_counts = Counter()
+_counts_lock = threading.Lock()
+
+
+class SamplingProfiler:
+    """Samples the stacks of all threads until stopped."""
+
+    def __init__(self, name: str, interval: float = INTERVAL_SECONDS):
+        self.name = name
+        self.interval = interval
+        self._frames: List[dict] = []
+        self._frame_index: Dict[Tuple[str, str, int], int] = {}
+        # thread ID -> (stacks, weights in ms)
+        self._samples: Dict[int, Tuple[List[List[int]], List[float]]] = {}
+        self._thread_names: Dict[int, str] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _frame(self, code) -> int:
+        key = (code.co_name, code.co_filename, code.co_firstlineno)
+        index = self._frame_index.get(key)
+        if index is None:
+            index = self._frame_index[key] = len(self._frames)
+            self._frames.append({
+                "name": code.co_qualname
+                if hasattr(code, "co_qualname")
+                else code.co_name,
+                "file": code.co_filename,
+                "line": code.co_firstlineno,
+            })
+        return index
+
+    def _sample(self, weight: float) -> None:
+        own = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            if thread_id not in self._thread_names:
+                self._thread_names.update(
+                    (thread.ident, thread.name)
+                    for thread in threading.enumerate()
+                )
+            stack = []
+            while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                stack.append(self._frame(frame.f_code))
+                frame = frame.f_back
+            stack.reverse()
+            stacks, weights = self._samples.setdefault(thread_id, ([], []))
+            stacks.append(stack)
+            weights.append(weight)
+
+    def _run(self) -> None:
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            self._sample(round((now - last) * 1000, 3))
+            last = now
+
+    def start(self) -> None:
+        self._thread = threading.Thread(
+            target=self._run, name="sampling-profiler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _thread_name(self, thread_id: int) -> str:
+        return self._thread_names.get(thread_id, f"thread-{thread_id}")
+
+    def sample_count(self) -> int:
+        return sum(len(stacks) for stacks, _ in self._samples.values())
+
+    def to_dict(self) -> dict:
+        """The samples as JSON-compatible data, read by `from_dict`."""
+        return {
+            "name": self.name,
+            "interval": self.interval,
+            "frames": self._frames,
+            "threads": [
+                {
+                    "id": thread_id,
+                    "name": self._thread_name(thread_id),
+                    "stacks": stacks,
+                    "weights": weights,
+                }
+                for thread_id, (stacks, weights) in self._samples.items()
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "SamplingProfiler":
+        profiler = cls(data["name"], data["interval"])
+        profiler._frames = data["frames"]
+        for thread in data["threads"]:
+            profiler._samples[thread["id"]] = (
+                thread["stacks"], thread["weights"]
+            )
+            profiler._thread_names[thread["id"]] = thread["name"]
+        return profiler
+
+    def to_speedscope(self) -> dict:
+        """The profile in speedscope's file format."""
+        profiles = []
+        for thread_id, (stacks, weights) in sorted(self._samples.items()):
+            profiles.append({
+                "type": "sampled",
+                "name": self._thread_name(thread_id),
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": round(sum(weights), 3),
+                "samples": stacks,
+                "weights": weights,
+            })
+        # The busiest thread opens first.
+        profiles.sort(key=lambda profile: -profile["endValue"])
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": self.name,
+            "exporter": "wisdom-pool-server",
+            "activeProfileIndex": 0,
+            "shared": {"frames": self._frames},
+            "profiles": profiles,
+        }
+
+    def to_collapsed(self) -> str:
+        """The profile as collapsed stacks ("thread;f1;f2 weight" lines)."""
+        totals = Counter()
+        for thread_id, (stacks, weights) in self._samples.items():
+            thread = self._thread_name(thread_id).replace(";", ":")
+            for stack, weight in zip(stacks, weights):
+                names = [self._frames[i]["name"] for i in stack]
+                totals[";".join([thread] + names)] += weight
+        return "".join(
+            f"{stack} {max(1, round(weight))}\n"
+            for stack, weight in sorted(totals.items())
+        )
+
+
+def count(outcome: str) -> None:
+    with _counts_lock:
+        _counts[outcome] += 1
+
+
+def _profile_path(profile_id: str) -> str:
+    return os.path.join(PROFILE_DIR, f"{profile_id}.json")
+
+
+def _saved_profiles() -> List[Tuple[float, str]]:
+    """(modification time, path) of the saved profiles, newest first."""
+    saved = []
+    for entry in os.scandir(PROFILE_DIR):
+        if entry.name.endswith(".json"):
+            try:
+                saved.append((entry.stat().st_mtime, entry.path))
+            except FileNotFoundError:
+                continue
+    return sorted(saved, reverse=True)
+
+
+def keep(profile_id: str, profiler: SamplingProfiler) -> None:
+    """
+    Keeps a finished request profile. With PROFILE_DIR it is also saved
+    there, and profiles past PROFILE_KEEP or PROFILE_KEEP_SECONDS are removed.
+    """
+    with _recent_lock:
+        recent_profiles[profile_id] = profiler
+    if not PROFILE_DIR:
+        return
+    try:
+        path = _profile_path(profile_id)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(profiler.to_dict(), f)
+        os.replace(tmp_path, path)
+        cutoff = time.time() - KEEP_SECONDS
+        for index, (mtime, old_path) in enumerate(_saved_profiles()):
+            if index >= KEEP or mtime < cutoff:
+                try:
+                    os.unlink(old_path)
+                except FileNotFoundError:
+                    pass
+    except Exception as e:
+        app_logger.error(f"Failed to save profile {profile_id}: {e}")
+
+
+def get_profile(profile_id: str) -> Optional[SamplingProfiler]:
+    with _recent_lock:
+        profiler = recent_profiles.get(profile_id)
+    if profiler is not None or not PROFILE_DIR:
+        return profiler
+    # Taken by another worker. IDs are checked before they name a file.
+    if not _PROFILE_ID.fullmatch(profile_id):
+        return None
+    path = _profile_path(profile_id)
+    try:
+        if os.stat(path).st_mtime < time.time() - KEEP_SECONDS:
+            return None
+        with open(path) as f:
+            return SamplingProfiler.from_dict(json.load(f))
+    except FileNotFoundError:
+        return None
+
+
+def stats() -> dict:
+    with _counts_lock:
+        counts = dict(_counts)
+    if PROFILE_DIR:
+        try:
+            kept = len(_saved_profiles())
+        except OSError:
+            kept = 0
+    else:
+        with _recent_lock:
+            kept = len(recent_profiles)
+    return {**counts, "kept": kept, "max_concurrent": MAX_CONCURRENT}
+
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope.get("headers", []):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def _bearer_token(scope) -> Optional[str]:
+    authorization = _header(scope, b"authorization")
+    if authorization and authorization.lower().startswith("bearer "):
+        return authorization[7:].strip()
+    return None
+
+
+class ProfileMiddleware:
+    """
+    Pure ASGI middleware that profiles requests sent with `X-Profile: 1` by a
+    debug user. The response carries `X-Profile-Id` (fetch the profile from
+    `/debug/profiles/{id}`) or `X-Profile: busy` when no slot was free.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or _header(scope, b"x-profile") != "1":
+            await self.app(scope, receive, send)
+            return
+        token = _bearer_token(scope)
+        if not await run_in_threadpool(is_debug_token, token):
+            count("request_denied")
+            await self.app(scope, receive, send)
+            return
+        if not slots.acquire(blocking=False):
+            count("request_busy")
+            await self.app(
+                scope, receive, _with_header(send, b"x-profile", b"busy")
+            )
+            return
+
+        profile_id = uuid.uuid4().hex
+        profiler = SamplingProfiler(
+            f"{scope['method']} {scope['path']}", REQUEST_INTERVAL_SECONDS
+        )
+        profiler.start()
+        try:
+            await self.app(
+                scope,
+                receive,
+                _with_header(send, b"x-profile-id", profile_id.encode()),
+            )
+        finally:
+            profiler.stop()
+            slots.release()
+            await run_in_threadpool(keep, profile_id, profiler)
+            count("requests_profiled")
+            app_logger.info(
+                "Profiled %s %s as %s (%s samples)",
+                scope["method"],
+                scope["path"],
+                profile_id,
+                profiler.sample_count(),
+            )
+
+
+def _with_header(send, name: bytes, value: bytes):
+    async def send_with_header(message):
+        if message["type"] == "http.response.start":
+            headers = list(message.get("headers", [])) + [(name, value)]
+            message = {**message, "headers": headers}
+        await send(message)
+
+    return send_with_header
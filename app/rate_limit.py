@@ -0,0 +1,197 @@
+import math
+import threading
+import time
+from collections import Counter
+from os import environ
+from typing import Dict, Optional, Tuple
+
+from cachetools import TTLCache
+from fastapi import Depends, HTTPException, Request, status
+from firebase_admin import firestore
+
+from app.auth import get_optional_user_id
+from app.db import db
+from app.logger import app_logger
+
+
+class Rule:
+    """Refill rate (tokens per second) and bucket size for one route."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+
+
+def _refill(tokens, updated, now, rule: Rule, cost: int):
+    """
+    Token-bucket step shared by all backends. Returns
+    (allowed, retry_after_seconds, new_tokens).
+    """
+    tokens = min(rule.burst, tokens + (now - updated) * rule.rate)
+    if tokens >= cost:
+        return True, 0.0, tokens - cost
+    return False, (cost - tokens) / rule.rate, tokens
+
+
+class LocalBackend:
+    """Buckets held in process memory; idle buckets expire."""
+
+    def __init__(self, maxsize: int = 100_000, ttl: float = 600):
+        self._buckets = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rule: Rule, cost: int = 1):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (rule.burst, now))
+            allowed, retry_after, tokens = _refill(
+                tokens, updated, now, rule, cost
+            )
+            self._buckets[key] = (tokens, now)
+        return allowed, retry_after
+
+
+class FirestoreBackend:
+    """
+    Buckets shared by every instance, stored in the 'rate_limits' collection
+    and updated transactionally. Costs one read and one write per request.
+    """
+
+    def __init__(self):
+        self._collection = db.collection("rate_limits")
+
+    def take(self, key: str, rule: Rule, cost: int = 1):
+        ref = self._collection.document(key.replace("/", "|"))
+
+        @firestore.transactional
+        def take_transactional(transaction):
+            now = time.time()
+            snapshot = ref.get(transaction=transaction)
+            state = snapshot.to_dict() if snapshot.exists else {}
+            allowed, retry_after, tokens = _refill(
+                state.get("tokens", rule.burst),
+                state.get("updated", now),
+                now,
+                rule,
+                cost,
+            )
+            transaction.set(ref, {"tokens": tokens, "updated": now})
+            return allowed, retry_after
+
+        return take_transactional(db.transaction())
+
+
+def _share(rule: Rule, workers: int) -> Rule:
+    """One worker's part of a budget that `workers` workers split."""
+    return Rule(
+        rate=rule.rate / workers,
+        burst=max(1, math.ceil(rule.burst / workers)),
+    )
+
+
+class RateLimiter:
+    """Token-bucket limiter keyed by caller identity and route."""
+
+    def __init__(self, backend, default_rule: Rule, rules: Dict[str, Rule]):
+        self.backend = backend
+        self.default_rule = default_rule
+        self.rules = rules
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def rule_for(self, route_key: str) -> Rule:
+        return self.rules.get(route_key, self.default_rule)
+
+    def check(self, identity: str, route_key: str) -> Tuple[bool, float]:
+        rule = self.rule_for(route_key)
+        try:
+            allowed, retry_after = self.backend.take(
+                f"{identity}|{route_key}", rule
+            )
+        except Exception as e:
+            # Never turn a limiter outage into an API outage.
+            app_logger.error(f"Rate limiter backend failed: {e}")
+            allowed, retry_after = True, 0.0
+        with self._lock:
+            self._counts[(route_key, "allowed" if allowed else "limited")] += 1
+        return allowed, retry_after
+
+    def metrics(self) -> dict:
+        with self._lock:
+            routes: Dict[str, Dict[str, int]] = {}
+            for (route_key, outcome), count in self._counts.items():
+                routes.setdefault(
+                    route_key, {"allowed": 0, "limited": 0}
+                )[outcome] = count
+        return {
+            "backend": type(self.backend).__name__,
+            "routes": routes,
+        }
+
+
+def _build_limiter() -> RateLimiter:
+    backend_name = environ.get("RATE_LIMIT_BACKEND", "local")
+    if backend_name == "firestore":
+        backend = FirestoreBackend()
+        workers = 1
+    else:
+        backend = LocalBackend()
+        # Local buckets exist once per worker and requests spread evenly
+        # over the workers (set by gunicorn.conf.py), so each worker
+        # enforces its share of the instance's budget.
+        workers = int(environ.get("RATE_LIMIT_WORKERS", "1"))
+    default_rule = Rule(
+        rate=float(environ.get("RATE_LIMIT_RATE", "10")),
+        burst=int(environ.get("RATE_LIMIT_BURST", "40")),
+    )
+    # Routes that fan out into many Firestore calls get tighter budgets.
+    rules = {
+        "POST /api/v1/user/progress": Rule(rate=2, burst=10),
+        "GET /api/v1/streams/{stream_id}/drops": Rule(rate=5, burst=20),
+    }
+    if workers > 1:
+        default_rule = _share(default_rule, workers)
+        rules = {
+            route_key: _share(rule, workers)
+            for route_key, rule in rules.items()
+        }
+    return RateLimiter(backend, default_rule, rules)
+
+
+limiter = _build_limiter()
+
+RATE_LIMIT_ENABLED = environ.get("RATE_LIMIT_ENABLED", "true") == "true"
+
+
+def _client_address(request: Request) -> str:
+    # Cloud Run puts the original client first in X-Forwarded-For.
+    forwarded = request.headers.get("x-forwarded-for")
+    if forwarded:
+        return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+def rate_limit(
+    request: Request,
+    user_id: Optional[str] = Depends(get_optional_user_id),
+):
+    """Router dependency that rejects callers over their route budget."""
+    if not RATE_LIMIT_ENABLED:
+        return
+    route = request.scope.get("route")
+    route_key = f"{request.method} {getattr(route, 'path', request.url.path)}"
+    if user_id:
+        identity = f"user:{user_id}"
+    else:
+        identity = f"ip:{_client_address(request)}"
+
+    allowed, retry_after = limiter.check(identity, route_key)
+    if not allowed:
+        app_logger.warning(
+            "Rate limit exceeded for %s on %s", identity, route_key
+        )
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Rate limit exceeded",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
@@ -0,0 +1,211 @@
+"""
+Renumbering of ordinals after drops are inserted, moved or removed.
+
+A placement's `ordinal` is its 1-based position in the stream, so an edit
+before the end shifts the ordinals of every placement after it: in a long
+stream, more writes than fit in a request's deadline. Edits only queue the
+range of order keys to renumber, and a thread in each worker renumbers it
+RENUMBER_PAGE_SIZE placements at a time. Ranges queued for a stream that is
+already waiting are merged.
+
+Each page is written in a transaction that checks the stream's `version`,
+which every edit of its chain bumps. When the version has moved on, the page
+is read again. Ordinals are counted from the placements before the page, not
+taken from stored ordinals, so an edit made meanwhile (renumbered by the
+worker that made it) never leaves stale ordinals behind.
+
+Ranges still queued when a worker exits are lost; their ordinals stay off
+until the next edit of the stream or a repair with
+scripts/check_stream_chains.py.
+"""
+import threading
+from collections import Counter
+from os import environ
+from typing import Dict, List, Optional, Tuple
+
+from firebase_admin import firestore
+
+from app import overview, stream_pages
+from app.db import db, stream_drops_collection, streams_collection
+from app.logger import app_logger
+
+PAGE_SIZE = int(environ.get("RENUMBER_PAGE_SIZE", "500"))
+
+# Order keys bounding the placements to renumber, both exclusive; None
+# stands for the stream's start or end.
+Range = Tuple[Optional[str], Optional[str]]
+
+
+def merge(a: Range, b: Range) -> Range:
+    """The smallest range covering both."""
+    after_key = None if a[0] is None or b[0] is None else min(a[0], b[0])
+    before_key = None if a[1] is None or b[1] is None else max(a[1], b[1])
+    return after_key, before_key
+
+
+def _write_page(stream_ref, version, updates: List[tuple]) -> bool:
+    """
+    Writes `(placement ref, ordinal)` updates unless the stream's version is
+    no longer `version`; returns whether they were written.
+    """
+    @firestore.transactional
+    def write(transaction):
+        doc = stream_ref.get(transaction=transaction)
+        if not doc.exists or doc.to_dict().get("version") != version:
+            return False
+        for ref, ordinal in updates:
+            transaction.update(ref, {"ordinal": ordinal})
+        return True
+
+    return write(db.transaction())
+
+
+class Renumberer:
+    """Renumbers queued ranges of placements, one stream at a time."""
+
+    def __init__(self):
+        self._pending: Dict[str, Range] = {}
+        self._active: Optional[str] = None
+        self._changed = threading.Condition()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._counts = Counter()
+
+    def enqueue(
+        self, stream_id: str, after_key: Optional[str],
+        before_key: Optional[str] = None,
+    ) -> None:
+        with self._changed:
+            queued = self._pending.get(stream_id)
+            self._pending[stream_id] = (
+                merge(queued, (after_key, before_key)) if queued
+                else (after_key, before_key)
+            )
+            self._counts["queued"] += 1
+            self._changed.notify_all()
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._changed:
+            self._counts[name] += n
+
+    def renumber(
+        self, stream_id: str, after_key: Optional[str],
+        before_key: Optional[str],
+    ) -> int:
+        """
+        Brings the ordinals of a range of placements up to date; returns the
+        number of placements rewritten.
+        """
+        stream_ref = streams_collection.document(stream_id)
+        placements = stream_drops_collection.where(
+            "stream_id", "==", stream_id
+        )
+        counted_version = ordinal = None
+        written = 0
+        while not self._stop.is_set():
+            stream_doc = stream_ref.get()
+            if not stream_doc.exists:
+                return written
+            version = stream_doc.to_dict().get("version")
+            query = placements
+            if after_key is not None:
+                query = query.where("order_key", ">", after_key)
+            if before_key is not None:
+                query = query.where("order_key", "<", before_key)
+            if version != counted_version:
+                ordinal = 1
+                if after_key is not None:
+                    result = placements.where(
+                        "order_key", "<=", after_key
+                    ).count().get()
+                    ordinal += int(result[0][0].value)
+                counted_version = version
+            page = list(query.order_by("order_key").limit(PAGE_SIZE).stream())
+            updates = [
+                (doc.reference, ordinal + i)
+                for i, doc in enumerate(page)
+                if doc.get("ordinal") != ordinal + i
+            ]
+            if updates and not _write_page(stream_ref, version, updates):
+                self._count("restarted_pages")
+                continue
+            written += len(updates)
+            if len(page) < PAGE_SIZE:
+                return written
+            after_key = page[-1].get("order_key")
+            ordinal += len(page)
+        return written
+
+    def _take(self) -> Optional[Tuple[str, Range]]:
+        with self._changed:
+            self._changed.wait_for(
+                lambda: self._pending or self._stop.is_set()
+            )
+            if self._stop.is_set():
+                return None
+            stream_id = next(iter(self._pending))
+            self._active = stream_id
+            return stream_id, self._pending.pop(stream_id)
+
+    def _run(self) -> None:
+        while True:
+            job = self._take()
+            if job is None:
+                return
+            stream_id, (after_key, before_key) = job
+            try:
+                written = self.renumber(stream_id, after_key, before_key)
+                self._count("renumbered_placements", written)
+                if written:
+                    stream_pages.refresh_page(stream_id)
+                    overview.invalidate_stream(stream_id)
+            except Exception as e:
+                self._count("failed")
+                app_logger.error(
+                    f"Renumbering stream {stream_id} failed: {e}",
+                    exc_info=True,
+                )
+            finally:
+                with self._changed:
+                    self._active = None
+                    self._changed.notify_all()
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """Waits until nothing is queued or running; False on timeout."""
+        with self._changed:
+            return self._changed.wait_for(
+                lambda: not self._pending and self._active is None, timeout
+            )
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="renumberer", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        with self._changed:
+            self._stop.set()
+            self._changed.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self._pending:
+            app_logger.warning(
+                f"Stopped with {len(self._pending)} stream(s) left to "
+                "renumber"
+            )
+
+    def stats(self) -> dict:
+        with self._changed:
+            return {
+                "pending": len(self._pending),
+                "active": self._active is not None,
+                **self._counts,
+            }
+
+
+renumberer = Renumberer()
@@ -0,0 +1,432 @@
+import datetime
+import gzip
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+from os import environ
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process development only.
+    fcntl = None
+
+from app.db import pools_collection, streams_collection, drops_collection
+from app.invalidation import bus
+from app.logger import app_logger
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from in is it of on or that the this to "
+    "was were what with".split()
+)
+
+# Title matches count more than body matches.
+_FIELD_WEIGHTS = {
+    "title": 2,
+    "description": 1,
+    "category": 1,
+    "text": 1,
+}
+
+KINDS = ("pool", "stream", "drop")
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    if not text:
+        return []
+    return [
+        token
+        for token in _TOKEN_RE.findall(text.lower())
+        if token not in _STOPWORDS
+    ]
+
+
+def _as_utc(value) -> Optional[datetime.datetime]:
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value
+
+
+class SearchIndex:
+    """
+    In-memory inverted index over pools, streams and drops ranked with BM25.
+
+    Documents are added incrementally from the create paths. The index can be
+    saved to / loaded from a snapshot file, and `catch_up` pulls in anything
+    created since the snapshot's watermark so that instances which didn't
+    serve a write still find the content.
+
+    With several workers sharing SNAPSHOT_PATH, only the worker holding the
+    lock next to it (the builder) reads Firestore: it catches up and saves
+    the snapshot whenever the index changed. The other workers load each
+    new snapshot, keeping the documents they indexed or removed themselves
+    until the snapshot reflects them. A worker takes over as builder when
+    the builder exits.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._docs: Dict[str, dict] = {}
+        self._postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self._total_length = 0
+        self.watermark: Optional[datetime.datetime] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # Changes since the last snapshot saved or loaded: key -> document,
+        # or None for removed documents.
+        self._unsaved: Dict[str, Optional[dict]] = {}
+        self._builder_lock = None
+        self._loaded_mtime: Optional[float] = None
+
+    # --- Indexing ---
+
+    def add(
+        self,
+        kind: str,
+        doc_id: str,
+        fields: Dict[str, Optional[str]],
+        title: Optional[str] = None,
+        parent_id: Optional[str] = None,
+    ) -> None:
+        terms = Counter()
+        for field, text in fields.items():
+            weight = _FIELD_WEIGHTS.get(field, 1)
+            for token in tokenize(text):
+                terms[token] += weight
+
+        key = f"{kind}:{doc_id}"
+        doc = {
+            "kind": kind,
+            "id": doc_id,
+            "title": title,
+            "parent_id": parent_id,
+            "terms": dict(terms),
+            "length": sum(terms.values()),
+        }
+        with self._lock:
+            self._remove_key(key)
+            self._store(key, doc)
+            self._unsaved[key] = doc
+
+    def add_pool(self, pool: dict) -> None:
+        content = pool.get("content") or {}
+        self.add(
+            "pool",
+            pool["pool_id"],
+            {
+                "title": content.get("title"),
+                "description": content.get("description"),
+            },
+            title=content.get("title"),
+        )
+
+    def add_stream(self, stream: dict) -> None:
+        content = stream.get("content") or {}
+        self.add(
+            "stream",
+            stream["stream_id"],
+            {
+                "title": content.get("title"),
+                "description": content.get("description"),
+                "category": content.get("category"),
+            },
+            title=content.get("title"),
+            parent_id=stream.get("pool_id"),
+        )
+
+    def add_drop(self, drop: dict) -> None:
+        content = drop.get("content") or {}
+        self.add(
+            "drop",
+            drop["drop_id"],
+            {"title": content.get("title"), "text": content.get("text")},
+            title=content.get("title"),
+        )
+
+    def remove(self, kind: str, doc_id: str) -> None:
+        key = f"{kind}:{doc_id}"
+        with self._lock:
+            self._remove_key(key)
+            self._unsaved[key] = None
+
+    def _store(self, key: str, doc: dict) -> None:
+        self._docs[key] = doc
+        self._total_length += doc["length"]
+        for term, tf in doc["terms"].items():
+            self._postings[term][key] = tf
+
+    def _remove_key(self, key: str) -> None:
+        doc = self._docs.pop(key, None)
+        if doc is None:
+            return
+        self._total_length -= doc["length"]
+        for term in doc["terms"]:
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(key, None)
+            if not postings:
+                del self._postings[term]
+
+    # --- Querying ---
+
+    def search(
+        self,
+        query: str,
+        kinds: Optional[Iterable[str]] = None,
+        limit: int = 20,
+    ) -> List[Tuple[dict, float]]:
+        """Returns up to `limit` (document, score) pairs, best first."""
+        terms = set(tokenize(query))
+        kinds = set(kinds) if kinds else None
+
+        with self._lock:
+            num_docs = len(self._docs)
+            if not terms or not num_docs:
+                return []
+            avg_length = self._total_length / num_docs or 1
+
+            scores: Dict[str, float] = defaultdict(float)
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                df = len(postings)
+                idf = math.log(1 + (num_docs - df + 0.5) / (df + 0.5))
+                for key, tf in postings.items():
+                    length = self._docs[key]["length"]
+                    norm = self.k1 * (
+                        1 - self.b + self.b * length / avg_length
+                    )
+                    scores[key] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+            ranked = sorted(scores.items(), key=lambda item: -item[1])
+            results = []
+            for key, score in ranked:
+                doc = self._docs[key]
+                if kinds and doc["kind"] not in kinds:
+                    continue
+                results.append((doc, score))
+                if len(results) >= limit:
+                    break
+            return results
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "documents": len(self._docs),
+                "terms": len(self._postings),
+                "watermark": (
+                    self.watermark.isoformat() if self.watermark else None
+                ),
+                "role": "builder" if self.is_builder() else "follower",
+            }
+
+    # --- Snapshots ---
+
+    def to_snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "version": 1,
+                "watermark": (
+                    self.watermark.isoformat() if self.watermark else None
+                ),
+                "docs": dict(self._docs),
+            }
+
+    def load_snapshot(self, snapshot: dict) -> None:
+        """
+        Replaces the index with the snapshot, then reapplies the changes
+        made here that the snapshot doesn't reflect yet.
+        """
+        docs = snapshot.get("docs", {})
+        with self._lock:
+            self._docs = {}
+            self._postings = defaultdict(dict)
+            self._total_length = 0
+            for key, doc in docs.items():
+                self._store(key, doc)
+            self.watermark = _as_utc(snapshot.get("watermark"))
+            for key, doc in list(self._unsaved.items()):
+                if (doc is None) != (key in docs):
+                    del self._unsaved[key]
+                elif doc is None:
+                    self._remove_key(key)
+                else:
+                    self._remove_key(key)
+                    self._store(key, doc)
+
+    def save(self, path: str) -> None:
+        with self._lock:
+            snapshot = self.to_snapshot()
+            self._unsaved.clear()
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, path)
+        app_logger.info(
+            "Saved search snapshot with %s documents to %s",
+            len(snapshot["docs"]),
+            path,
+        )
+
+    def load(self, path: str) -> bool:
+        if not os.path.exists(path):
+            return False
+        mtime = os.stat(path).st_mtime
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            self.load_snapshot(json.load(f))
+        self._loaded_mtime = mtime
+        app_logger.info(
+            "Loaded search snapshot with %s documents from %s",
+            len(self._docs),
+            path,
+        )
+        return True
+
+    # --- Rebuilding from Firestore ---
+
+    def catch_up(self) -> int:
+        """
+        Indexes every pool, stream and drop created after the watermark.
+        With no watermark this is a full rebuild. The window overlaps the
+        previous one slightly to absorb clock skew between writers; indexing
+        a document twice is harmless.
+        """
+        since = self.watermark
+        if since is not None:
+            since -= datetime.timedelta(seconds=CATCH_UP_OVERLAP_SECONDS)
+        newest = self.watermark
+        indexed = 0
+        for collection, add in (
+            (pools_collection, self.add_pool),
+            (streams_collection, self.add_stream),
+            (drops_collection, self.add_drop),
+        ):
+            query = collection
+            if since is not None:
+                query = query.where("created_at", ">", since)
+            for doc in query.order_by("created_at").stream():
+                data = doc.to_dict()
+                add(data)
+                indexed += 1
+                created_at = _as_utc(data.get("created_at"))
+                if created_at and (newest is None or created_at > newest):
+                    newest = created_at
+        with self._lock:
+            self.watermark = newest
+        if indexed:
+            app_logger.info("Search index caught up %s documents", indexed)
+        return indexed
+
+    def start(self) -> None:
+        """Loads the snapshot (or rebuilds) and keeps the index fresh."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="search-index", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if SNAPSHOT_PATH and self.is_builder():
+            try:
+                self.save(SNAPSHOT_PATH)
+            except Exception as e:
+                app_logger.error(f"Failed to save search snapshot: {e}")
+        if self._builder_lock is not None:
+            self._builder_lock.close()
+            self._builder_lock = None
+
+    def is_builder(self) -> bool:
+        return (
+            not SNAPSHOT_PATH or fcntl is None
+            or self._builder_lock is not None
+        )
+
+    def _try_become_builder(self) -> bool:
+        """Takes the builder lock of SNAPSHOT_PATH if no worker holds it."""
+        if self.is_builder():
+            return True
+        lock_file = open(f"{SNAPSHOT_PATH}.lock", "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._builder_lock = lock_file
+        app_logger.info(
+            f"Worker {os.getpid()} builds the search snapshot {SNAPSHOT_PATH}"
+        )
+        return True
+
+    def _build(self) -> None:
+        self.catch_up()
+        if SNAPSHOT_PATH and self._unsaved:
+            self.save(SNAPSHOT_PATH)
+
+    def _follow(self) -> None:
+        """Loads the builder's snapshot if it changed since the last load."""
+        try:
+            mtime = os.stat(SNAPSHOT_PATH).st_mtime
+        except FileNotFoundError:
+            return
+        if mtime != self._loaded_mtime:
+            self.load(SNAPSHOT_PATH)
+
+    def _run(self) -> None:
+        try:
+            if SNAPSHOT_PATH:
+                self.load(SNAPSHOT_PATH)
+        except Exception as e:
+            app_logger.error(f"Failed to load search snapshot: {e}")
+        while True:
+            builder = self._try_become_builder()
+            try:
+                if builder:
+                    self._build()
+                else:
+                    self._follow()
+            except Exception as e:
+                app_logger.error(f"Search index refresh failed: {e}")
+            interval = REFRESH_SECONDS if builder else FOLLOW_SECONDS
+            if self._stop.wait(interval):
+                return
+
+
+SNAPSHOT_PATH = environ.get("SEARCH_SNAPSHOT_PATH")
+REFRESH_SECONDS = float(environ.get("SEARCH_REFRESH_SECONDS", "60"))
+# How often workers that don't build the snapshot look for a new one.
+FOLLOW_SECONDS = float(environ.get("SEARCH_FOLLOW_SECONDS", "5"))
+CATCH_UP_OVERLAP_SECONDS = 60
+
+search_index = SearchIndex()
+
+
+def _unindex(key: str) -> None:
+    kind, _, doc_id = key.partition(":")
+    search_index.remove(kind, doc_id)
+
+
+bus.subscribe("search_remove", _unindex)
+
+
+def unindex(kind: str, doc_id: str) -> None:
+    """Removes a deleted document from every worker's index."""
+    bus.publish("search_remove", f"{kind}:{doc_id}")
@@ -0,0 +1,132 @@
+"""
+Whole-stream exports as NDJSON.
+
+A stream is read in windows of EXPORT_WINDOW placements: range queries over
+the order keys, or walks along the chain for streams that predate them. The
+drops of a window are fetched with one batched read, which runs at the same
+time as the read of the next window, so at most two windows are held in
+memory however long the stream is. Exported drops don't go through the drop
+cache, which would otherwise be flushed by every export.
+
+Each window is read under its own deadline of EXPORT_WINDOW_DEADLINE_SECONDS
+instead of the request's, so an export takes as long as the stream needs.
+"""
+import json
+from os import environ
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from app.cache import get_drops
+from app.db import stream_drops_collection
+from app.deadlines import concurrently, with_deadline
+from app.logger import app_logger
+from app.models import DropInStream
+
+WINDOW = int(environ.get("EXPORT_WINDOW", "500"))
+WINDOW_DEADLINE_SECONDS = float(
+    environ.get("EXPORT_WINDOW_DEADLINE_SECONDS", "15")
+)
+
+# A window of placements and the cursor the next window starts after, or
+# None when the stream ends with this window.
+Window = Tuple[List[dict], Optional[object]]
+
+
+def order_key_reader(stream_id: str) -> Callable[[Optional[str]], Window]:
+    """Reads windows of a stream by order key; the cursor is an order key."""
+    placements = stream_drops_collection.where("stream_id", "==", stream_id)
+
+    def read(after_key: Optional[str]) -> Window:
+        query = placements
+        if after_key is not None:
+            query = query.where("order_key", ">", after_key)
+        window = [
+            doc.to_dict()
+            for doc in query.order_by("order_key").limit(WINDOW).stream()
+        ]
+        more = len(window) == WINDOW
+        return window, window[-1]["order_key"] if more else None
+
+    return read
+
+
+def chain_reader(stream_id: str) -> Callable[[Optional[str]], Window]:
+    """
+    Reads windows of a stream without order keys by following
+    `next_placement_id`; the cursor is the next placement's ID.
+    """
+
+    def read(placement_id: Optional[str]) -> Window:
+        window = []
+        while placement_id and len(window) < WINDOW:
+            doc = stream_drops_collection.document(placement_id).get()
+            placement = doc.to_dict() if doc.exists else None
+            if placement is None or placement.get("stream_id") != stream_id:
+                app_logger.warning(
+                    f"Export of stream {stream_id} stopped at broken link "
+                    f"{placement_id}"
+                )
+                return window, None
+            window.append(placement)
+            placement_id = placement.get("next_placement_id")
+        return window, placement_id
+
+    return read
+
+
+def read_window(read: Callable[[object], Window], cursor) -> Window:
+    return with_deadline(WINDOW_DEADLINE_SECONDS, lambda: read(cursor))
+
+
+def _fetch_drops(placements: List[dict]) -> dict:
+    return with_deadline(
+        WINDOW_DEADLINE_SECONDS,
+        lambda: get_drops(
+            (placement["drop_id"] for placement in placements), keep=False
+        ),
+    )
+
+
+def export_lines(
+    stream_id: str, read: Callable[[object], Window], first: Window
+) -> Iterator[str]:
+    """
+    Yields one DropInStream JSON line per drop, starting with the already
+    read `first` window. A failure mid-export ends the body with an error
+    line naming the placement to resume after.
+    """
+    placements, cursor = first
+    exported = 0
+    last_placement_id = None
+    try:
+        while placements:
+            if cursor is None:
+                drops, upcoming = _fetch_drops(placements), ([], None)
+            else:
+                drops, upcoming = concurrently(
+                    lambda: _fetch_drops(placements),
+                    lambda: read_window(read, cursor),
+                )
+            for placement in placements:
+                drop = drops.get(placement["drop_id"])
+                if drop is not None:
+                    yield DropInStream(
+                        **drop,
+                        placement_id=placement["placement_id"],
+                        next_placement_id=placement.get("next_placement_id"),
+                        prev_placement_id=placement.get("prev_placement_id"),
+                        ordinal=placement.get("ordinal"),
+                    ).model_dump_json() + "\n"
+                    exported += 1
+                last_placement_id = placement["placement_id"]
+            placements, cursor = upcoming
+    except Exception as e:
+        app_logger.error(
+            f"Export of stream {stream_id} failed after {exported} drops: {e}",
+            exc_info=True,
+        )
+        yield json.dumps({
+            "error": "Failed to export drops.",
+            "after_placement_id": last_placement_id,
+        }) + "\n"
+        return
+    app_logger.info("Exported %s drops of stream %s", exported, stream_id)
@@ -0,0 +1,280 @@
+"""
+Denormalized "first page" snapshots of streams.
+
+Each stream has a document in the 'stream_pages' collection holding its
+first and last PAGE_SIZE drops as `DropInStream` entries together with the
+stream's drop count. Head and tail page requests are then served with a
+single document read instead of a linked-list traversal. Snapshots are kept
+current by the add-drops transaction and can be rebuilt from the chain, or,
+after a drop was inserted, moved or removed, from the order keys.
+
+A window of drops around a placement (see `/user/resume`) is cut from the
+snapshot when it holds the whole window, and read otherwise.
+"""
+import json
+from os import environ
+from typing import List, Optional, Tuple
+
+from firebase_admin import firestore
+
+from app.cache import get_drops
+from app.deadlines import concurrently
+from app.db import (
+    db, stream_drops_collection, stream_pages_collection, streams_collection
+)
+from app.logger import app_logger
+
+PAGE_SIZE = int(environ.get("STREAM_PAGE_SNAPSHOT_SIZE", "50"))
+
+# Firestore documents are capped at 1 MiB; stay well below it.
+MAX_SNAPSHOT_BYTES = 900_000
+
+
+def empty_page(stream_id: str) -> dict:
+    return {"stream_id": stream_id, "drop_count": 0, "head": [], "tail": []}
+
+
+def _fit(page: dict) -> dict:
+    """Drops entries from the far end of head/tail until the page fits."""
+    while page["head"] or page["tail"]:
+        size = len(json.dumps(page, default=str))
+        if size <= MAX_SNAPSHOT_BYTES:
+            break
+        if len(page["head"]) >= len(page["tail"]):
+            page["head"].pop()
+        else:
+            page["tail"].pop(0)
+    return page
+
+
+def append_entries(page: dict, entries: List[dict]) -> dict:
+    """
+    Returns the snapshot after `entries` (DropInStream dicts, in order) were
+    appended to the tail of the stream.
+    """
+    if not entries:
+        return page
+    head = [dict(entry) for entry in page["head"]]
+    tail = [dict(entry) for entry in page["tail"]]
+    drop_count = page.get("drop_count", 0)
+
+    # The old last drop now links to the first new one.
+    first_new_id = entries[0]["placement_id"]
+    if tail:
+        tail[-1]["next_placement_id"] = first_new_id
+    if head and len(head) == drop_count:
+        head[-1]["next_placement_id"] = first_new_id
+
+    if len(head) == drop_count:
+        head = (head + entries)[:PAGE_SIZE]
+    tail = (tail + entries)[-PAGE_SIZE:]
+
+    return _fit({
+        "stream_id": page["stream_id"],
+        "drop_count": drop_count + len(entries),
+        "head": head,
+        "tail": tail,
+    })
+
+
+def build_page(
+    stream_id: str, drop_count: int, head: List[dict], tail: List[dict]
+) -> dict:
+    """Builds a snapshot from a stream's first and last entries."""
+    return _fit({
+        "stream_id": stream_id,
+        "drop_count": drop_count,
+        "head": head[:PAGE_SIZE],
+        "tail": tail[-PAGE_SIZE:],
+    })
+
+
+def read_page(page: dict, limit: int) -> Optional[List[dict]]:
+    """
+    Returns the entries of a head (positive limit) or tail (negative limit)
+    page, or None when the snapshot doesn't hold enough entries.
+    """
+    drop_count = page.get("drop_count", 0)
+    if limit > 0:
+        entries = page["head"]
+        if limit > len(entries) and len(entries) < drop_count:
+            return None
+        return entries[:limit]
+    entries = page["tail"]
+    if -limit > len(entries) and len(entries) < drop_count:
+        return None
+    return list(reversed(entries))[:-limit]
+
+
+def write_page(stream_id: str, page: dict) -> None:
+    stream_pages_collection.document(stream_id).set(page)
+    app_logger.info(
+        "Rebuilt page snapshot for stream %s (%s drops)",
+        stream_id,
+        page["drop_count"],
+    )
+
+
+def refresh_page(stream_id: str) -> None:
+    """
+    Rebuilds the snapshot of a stream with order keys from its first and
+    last placements. Runs in a transaction so that drops appended meanwhile
+    aren't lost from the snapshot.
+    """
+    placements = stream_drops_collection.where("stream_id", "==", stream_id)
+
+    @firestore.transactional
+    def rebuild(transaction):
+        stream_doc = streams_collection.document(stream_id).get(
+            transaction=transaction
+        )
+        if not stream_doc.exists:
+            return None
+        head = [
+            doc.to_dict()
+            for doc in placements.order_by("order_key")
+            .limit(PAGE_SIZE)
+            .stream(transaction=transaction)
+        ]
+        tail = [
+            doc.to_dict()
+            for doc in placements.order_by(
+                "order_key", direction=firestore.Query.DESCENDING
+            )
+            .limit(PAGE_SIZE)
+            .stream(transaction=transaction)
+        ][::-1]
+        drops = get_drops(placement["drop_id"] for placement in head + tail)
+        drop_count = stream_doc.to_dict().get("drop_count") or 0
+
+        def entries(page_placements, first_ordinal):
+            return [
+                {
+                    **drops[placement["drop_id"]],
+                    "placement_id": placement["placement_id"],
+                    "next_placement_id": placement.get("next_placement_id"),
+                    "prev_placement_id": placement.get("prev_placement_id"),
+                    "ordinal": first_ordinal + i,
+                }
+                for i, placement in enumerate(page_placements)
+                if placement["drop_id"] in drops
+            ]
+
+        page = build_page(
+            stream_id,
+            drop_count,
+            entries(head, 1),
+            entries(tail, drop_count - len(tail) + 1),
+        )
+        transaction.set(stream_pages_collection.document(stream_id), page)
+        return page
+
+    page = rebuild(db.transaction())
+    if page is not None:
+        app_logger.info(
+            "Refreshed page snapshot for stream %s (%s drops)",
+            stream_id,
+            page["drop_count"],
+        )
+
+
+# Drops around a placement and whether the stream continues on either side.
+Window = Tuple[List[dict], bool, bool]
+
+
+def window_from_page(
+    page: dict, placement_id: str, before: int, after: int
+) -> Optional[Window]:
+    """
+    Cuts the window of `before` entries before and `after` entries after
+    `placement_id` out of a snapshot, or returns None when the snapshot
+    doesn't hold all of it.
+    """
+    drop_count = page.get("drop_count", 0)
+    for entries, offset in (
+        (page["head"], 0),
+        (page["tail"], drop_count - len(page["tail"])),
+    ):
+        ids = [entry["placement_id"] for entry in entries]
+        if placement_id not in ids:
+            continue
+        i = ids.index(placement_id)
+        start, end = max(0, i - before), i + after + 1
+        if (i - before < 0 and offset > 0) or (
+            end > len(entries) and offset + len(entries) < drop_count
+        ):
+            continue
+        end = min(end, len(entries))
+        return (
+            entries[start:end],
+            offset + start > 0,
+            offset + end < drop_count,
+        )
+    return None
+
+
+def _entries(placements: List[dict]) -> List[dict]:
+    drops = get_drops(placement["drop_id"] for placement in placements)
+    return [
+        {
+            **drops[placement["drop_id"]],
+            "placement_id": placement["placement_id"],
+            "next_placement_id": placement.get("next_placement_id"),
+            "prev_placement_id": placement.get("prev_placement_id"),
+            "ordinal": placement.get("ordinal"),
+        }
+        for placement in placements
+        if placement["drop_id"] in drops
+    ]
+
+
+def _walk(placement: dict, pointer: str, count: int) -> Tuple[List[dict], bool]:
+    """Follows `pointer` from a placement for up to `count` placements."""
+    walked = []
+    next_id = placement.get(pointer)
+    while next_id and len(walked) < count:
+        doc = stream_drops_collection.document(next_id).get()
+        if not doc.exists:
+            return walked, False
+        walked.append(doc.to_dict())
+        next_id = walked[-1].get(pointer)
+    return walked, bool(next_id)
+
+
+def read_window(
+    stream_id: str, placement: dict, before: int, after: int
+) -> Window:
+    """
+    Reads the window around a placement: two range queries on the order
+    keys, run concurrently, or two walks along the chain for streams
+    without order keys.
+    """
+    if placement.get("order_key") is None:
+        (earlier, more_before), (later, more_after) = concurrently(
+            lambda: _walk(placement, "prev_placement_id", before),
+            lambda: _walk(placement, "next_placement_id", after),
+        )
+        earlier.reverse()
+    else:
+        placements = stream_drops_collection.where("stream_id", "==", stream_id)
+        key = placement["order_key"]
+        earlier, later = concurrently(
+            lambda: [
+                doc.to_dict()
+                for doc in placements.where("order_key", "<", key)
+                .order_by("order_key", direction=firestore.Query.DESCENDING)
+                .limit(before + 1)
+                .stream()
+            ],
+            lambda: [
+                doc.to_dict()
+                for doc in placements.where("order_key", ">", key)
+                .order_by("order_key")
+                .limit(after + 1)
+                .stream()
+            ],
+        )
+        more_before, more_after = len(earlier) > before, len(later) > after
+        earlier = earlier[:before][::-1]
+        later = later[:after]
+    return _entries(earlier + [placement] + later), more_before, more_after
@@ -0,0 +1,367 @@
+"""
+Read frequency of streams and drops, trending streams and pinned pages.
+
+Reads served by `get_stream`, `get_drops_in_stream` and `/user/progress` are
+counted in memory by `HeavyHitters` sketches: a count-min sketch estimates
+the count of any key in fixed memory, and the TRENDING_TRACKED keys with
+the highest estimates are kept as candidates. Recording a read costs a few
+hash lookups and no I/O.
+
+Every TRENDING_FLUSH_SECONDS each worker writes its candidates' counts to
+`read_counts/{streams,drops}/items/{id}` with batched `Increment`s and starts
+a new window. Next to the total `reads`, each document keeps a score per UTC
+day (`scores.dYYYYMMDD`) that weighs a read by 2^(t / half-life), t being
+the time since the start of the day. That is exponential decay measured
+forward from a fixed point, so increments from every instance add up and
+ordering by the field ranks streams by decayed read rate. Trending streams
+are the top of today's scores merged with yesterday's, decayed by one day.
+
+The TRENDING_PINNED most trending streams have their page snapshot (see
+app/stream_pages.py) pinned in memory, so their first and last pages are
+served without a Firestore read. Each refresh also warms the drop cache
+with the worker's most read drops. Pinned pages are dropped when the
+stream's drops change (the invalidation bus's stream channel) and read
+again on the next request.
+"""
+import datetime
+import heapq
+import threading
+import time
+from collections import Counter
+from os import environ
+from typing import Dict, List, Optional, Tuple
+
+from firebase_admin import firestore
+
+from app import consistency
+from app.cache import get_drops
+from app.db import db, stream_pages_collection, streams_collection
+from app.invalidation import bus
+from app.logger import app_logger
+
+TRACKED = int(environ.get("TRENDING_TRACKED", "1000"))
+SKETCH_WIDTH = int(environ.get("TRENDING_SKETCH_WIDTH", "4096"))
+SKETCH_DEPTH = int(environ.get("TRENDING_SKETCH_DEPTH", "4"))
+FLUSH_SECONDS = float(environ.get("TRENDING_FLUSH_SECONDS", "60"))
+HALF_LIFE_SECONDS = float(environ.get("TRENDING_HALF_LIFE_HOURS", "6")) * 3600
+PINNED = int(environ.get("TRENDING_PINNED", "20"))
+# Trending candidates read per day; deleted streams are skipped.
+CANDIDATES = PINNED * 2
+
+KINDS = ("streams", "drops")
+
+_counts_collection = db.collection("read_counts")
+
+_DAY = datetime.timedelta(days=1)
+
+
+def counts_collection(kind: str):
+    return _counts_collection.document(kind).collection("items")
+
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def _day_start(now: datetime.datetime) -> datetime.datetime:
+    return now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def score_field(day: datetime.datetime) -> str:
+    return f"d{day:%Y%m%d}"
+
+
+def read_weight(now: datetime.datetime) -> float:
+    """What a read at `now` adds to the day's score."""
+    elapsed = (now - _day_start(now)).total_seconds()
+    return 2 ** (elapsed / HALF_LIFE_SECONDS)
+
+
+class CountMinSketch:
+    """Over-estimates the count of any key in `width * depth` counters."""
+
+    def __init__(self, width: int = SKETCH_WIDTH, depth: int = SKETCH_DEPTH):
+        self.width = width
+        self._rows = [[0] * width for _ in range(depth)]
+
+    def _cells(self, key: str):
+        for seed, row in enumerate(self._rows):
+            yield row, hash((seed, key)) % self.width
+
+    def add(self, key: str, n: int = 1) -> int:
+        """Counts `key` and returns its estimated count."""
+        estimate = None
+        for row, cell in self._cells(key):
+            row[cell] += n
+            if estimate is None or row[cell] < estimate:
+                estimate = row[cell]
+        return estimate
+
+    def estimate(self, key: str) -> int:
+        return min(row[cell] for row, cell in self._cells(key))
+
+
+class HeavyHitters:
+    """
+    The `capacity` keys with the highest estimated counts. Estimates come
+    from a count-min sketch; a min-heap finds the candidate to replace.
+    """
+
+    def __init__(self, capacity: int = TRACKED):
+        self.capacity = capacity
+        self.sketch = CountMinSketch()
+        self.total = 0
+        self._top: Dict[str, int] = {}
+        # (count, key) entries; stale ones are fixed when they surface.
+        self._heap: List[Tuple[int, str]] = []
+
+    def _min(self) -> Tuple[int, str]:
+        while True:
+            count, key = self._heap[0]
+            current = self._top.get(key)
+            if current == count:
+                return count, key
+            if current is None:
+                heapq.heappop(self._heap)
+            else:
+                heapq.heapreplace(self._heap, (current, key))
+
+    def offer(self, key: str, n: int = 1) -> None:
+        self.total += n
+        estimate = self.sketch.add(key, n)
+        if key in self._top:
+            self._top[key] = estimate
+            return
+        if len(self._top) >= self.capacity:
+            count, smallest = self._min()
+            if estimate <= count:
+                return
+            heapq.heappop(self._heap)
+            del self._top[smallest]
+        self._top[key] = estimate
+        heapq.heappush(self._heap, (estimate, key))
+
+    def top(self, k: Optional[int] = None) -> List[Tuple[str, int]]:
+        ranked = sorted(self._top.items(), key=lambda item: -item[1])
+        return ranked if k is None else ranked[:k]
+
+    def __len__(self) -> int:
+        return len(self._top)
+
+
+class ReadTracker:
+    """Counts reads, flushes them to Firestore and keeps trending streams."""
+
+    def __init__(self):
+        self._windows = {kind: HeavyHitters() for kind in KINDS}
+        self._window_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        # (stream, score) pairs, most trending first.
+        self._trending: Optional[List[Tuple[dict, float]]] = None
+        self._pinned_ids = frozenset()
+        self._pinned_pages: Dict[str, dict] = {}
+        # stream ID -> time of its last change, for reads that raced it.
+        self._changed_at: Dict[str, float] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # --- Counting ---
+
+    def record(self, kind: str, key: str, n: int = 1) -> None:
+        with self._window_lock:
+            self._windows[kind].offer(key, n)
+
+    def hot(self, kind: str, k: int) -> List[Tuple[str, int]]:
+        """This worker's most read keys of the current window."""
+        with self._window_lock:
+            return self._windows[kind].top(k)
+
+    def flush(self) -> int:
+        """Writes the window's counts to Firestore; returns documents written."""
+        with self._window_lock:
+            windows = self._windows
+            self._windows = {kind: HeavyHitters() for kind in KINDS}
+        now = _now()
+        today = _day_start(now)
+        weight = read_weight(now)
+        expired = score_field(today - 2 * _DAY)
+        written = 0
+        batch = db.batch()
+        for kind, window in windows.items():
+            collection = counts_collection(kind)
+            for key, count in window.top():
+                batch.set(
+                    collection.document(key),
+                    {
+                        "reads": firestore.Increment(count),
+                        "scores": {
+                            score_field(today): firestore.Increment(
+                                count * weight
+                            ),
+                            expired: firestore.DELETE_FIELD,
+                        },
+                        "last_read_at": now,
+                    },
+                    merge=True,
+                )
+                written += 1
+                if len(batch) == 500:
+                    batch.commit()
+                    batch = db.batch()
+            self._count(f"{kind}_reads", window.total)
+        if len(batch):
+            batch.commit()
+        self._count("flushed_docs", written)
+        return written
+
+    # --- Trending ---
+
+    def _read_trending(self) -> List[Tuple[dict, float]]:
+        """Today's and yesterday's top scores, merged and decayed."""
+        today = _day_start(_now())
+        yesterday_decay = 2 ** -(_DAY.total_seconds() / HALF_LIFE_SECONDS)
+        scores = Counter()
+        collection = counts_collection("streams")
+        for day, decay in ((today, 1.0), (today - _DAY, yesterday_decay)):
+            field = f"scores.{score_field(day)}"
+            query = collection.order_by(
+                field, direction=firestore.Query.DESCENDING
+            ).limit(CANDIDATES)
+            for doc in query.stream():
+                scores[doc.id] += (doc.get(field) or 0) * decay
+        ranked = [stream_id for stream_id, _ in scores.most_common()]
+        refs = [streams_collection.document(i) for i in ranked]
+        streams = {
+            doc.id: doc.to_dict() for doc in db.get_all(refs) if doc.exists
+        } if refs else {}
+        return [
+            (streams[stream_id], scores[stream_id])
+            for stream_id in ranked
+            if stream_id in streams
+        ][:CANDIDATES]
+
+    def refresh(self) -> None:
+        """Re-reads the trending streams, pins them and warms hot drops."""
+        started = time.monotonic()
+        trending = self._read_trending()
+        pinned_ids = [stream["stream_id"] for stream, _ in trending[:PINNED]]
+        pages = {}
+        if pinned_ids:
+            refs = [stream_pages_collection.document(i) for i in pinned_ids]
+            pages = {
+                doc.id: doc.to_dict() for doc in db.get_all(refs) if doc.exists
+            }
+        with self._lock:
+            self._trending = trending
+            self._pinned_ids = frozenset(pinned_ids)
+            self._pinned_pages = {
+                stream_id: page
+                for stream_id, page in pages.items()
+                if self._changed_at.get(stream_id, 0) < started
+            }
+            self._changed_at.clear()
+        get_drops(drop_id for drop_id, _ in self.hot("drops", TRACKED // 10))
+        self._count("refreshes")
+
+    def trending(self, limit: int) -> List[Tuple[dict, float]]:
+        with self._lock:
+            trending = self._trending
+        if trending is None:
+            self.refresh()
+            with self._lock:
+                trending = self._trending
+        return trending[:limit]
+
+    # --- Pinned pages ---
+
+    def pinned_page(self, stream_id: str) -> Optional[dict]:
+        """
+        The pinned page snapshot of a trending stream, or None. Requests that
+        must see a write to the stream (see app/consistency.py) read it.
+        """
+        if consistency.required_version(stream_id) is not None:
+            return None
+        with self._lock:
+            page = self._pinned_pages.get(stream_id)
+        if page is not None:
+            self._count("pinned_hits")
+        return page
+
+    def offer_page(self, stream_id: str, page: dict, read_at: float) -> None:
+        """Pins a page read at `read_at` if its stream is trending."""
+        with self._lock:
+            if (
+                stream_id in self._pinned_ids
+                and self._changed_at.get(stream_id, 0) < read_at
+            ):
+                self._pinned_pages[stream_id] = page
+
+    def forget(self, stream_id: str) -> None:
+        """Stops pinning a deleted stream until the next refresh."""
+        with self._lock:
+            self._pinned_ids = self._pinned_ids - {stream_id}
+            self._pinned_pages.pop(stream_id, None)
+
+    def stream_changed(self, key: str) -> None:
+        stream_id, _ = consistency.parse_event_key(key)
+        with self._lock:
+            if stream_id in self._pinned_ids:
+                self._pinned_pages.pop(stream_id, None)
+                self._changed_at[stream_id] = time.monotonic()
+
+    # --- Lifecycle ---
+
+    def _run(self) -> None:
+        while not self._stop.wait(FLUSH_SECONDS):
+            try:
+                self.flush()
+                self.refresh()
+            except Exception as e:
+                self._count("errors")
+                app_logger.error(f"Read count flush failed: {e}")
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="read-tracker", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        try:
+            self.flush()
+        except Exception as e:
+            app_logger.error(f"Final read count flush failed: {e}")
+
+    def _count(self, outcome: str, amount: int = 1) -> None:
+        with self._lock:
+            self._counts[outcome] += amount
+
+    def stats(self) -> dict:
+        with self._window_lock:
+            tracked = {kind: len(w) for kind, w in self._windows.items()}
+        with self._lock:
+            return {
+                **self._counts,
+                "tracked": tracked,
+                "pinned": len(self._pinned_pages),
+            }
+
+
+read_tracker = ReadTracker()
+
+# Published whenever a stream's drops change (see app/overview.py).
+bus.subscribe("pool_overview_stream", read_tracker.stream_changed)
+bus.subscribe("trending_unpin", read_tracker.forget)
+
+
+def unpin(stream_id: str) -> None:
+    """Drops a deleted stream's pinned page in every worker."""
+    bus.publish("trending_unpin", stream_id)
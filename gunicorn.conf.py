@@ -0,0 +1,64 @@
+"""
+Gunicorn settings for running the API with several uvicorn worker processes.
+
+    gunicorn -c gunicorn.conf.py app.main:app
+
+One worker per available CPU by default (override with WEB_CONCURRENCY).
+Workers share a log file, an invalidation bus directory and a profile
+directory so /logs, the in-memory caches and /debug/profiles/{id} stay
+coherent across processes, and an instance ID so that invalidations relayed
+between instances skip the workers of the instance that published them. One
+worker builds the search snapshot that the others load, and each worker
+enforces its share of the local rate limits.
+"""
+import os
+import tempfile
+import uuid
+
+
+def _cpu_count() -> int:
+    # Respects CPU affinity/cgroup limits where the platform exposes them.
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", _cpu_count()))
+worker_class = "uvicorn_worker.UvicornWorker"
+
+# Cloud Run keeps idle connections to the container open for a long time.
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", "75"))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+accesslog = "-"
+
+_runtime_dir = os.environ.get(
+    "APP_RUNTIME_DIR", os.path.join(tempfile.gettempdir(), "wisdom-pool")
+)
+raw_env = [
+    f"APP_LOG_FILE={os.path.join(_runtime_dir, 'app.log')}",
+    f"INVALIDATION_BUS_DIR={os.path.join(_runtime_dir, 'bus')}",
+    f"PROFILE_DIR={os.path.join(_runtime_dir, 'profiles')}",
+    f"INSTANCE_ID={os.environ.get('INSTANCE_ID') or uuid.uuid4().hex}",
+    # Local rate-limit buckets are per worker; each enforces its share.
+    f"RATE_LIMIT_WORKERS={workers}",
+]
+# Idempotency records must be visible to every worker, so default to the
+# shared Firestore store unless explicitly configured otherwise.
+if "IDEMPOTENCY_BACKEND" not in os.environ:
+    raw_env.append("IDEMPOTENCY_BACKEND=firestore")
+# One worker builds the search snapshot; the others load it from here.
+if "SEARCH_SNAPSHOT_PATH" not in os.environ:
+    raw_env.append(
+        f"SEARCH_SNAPSHOT_PATH={os.path.join(_runtime_dir, 'search.json.gz')}"
+    )
+
+
+def on_starting(server):
+    os.makedirs(os.path.join(_runtime_dir, "bus"), exist_ok=True)
+    os.makedirs(os.path.join(_runtime_dir, "profiles"), exist_ok=True)
+    # Sockets left behind by a previous run belong to dead workers.
+    for name in os.listdir(os.path.join(_runtime_dir, "bus")):
+        os.unlink(os.path.join(_runtime_dir, "bus", name))
@@ -0,0 +1,52 @@
+"""
+Initializes the precomputed listing counters in the 'counters' collection.
+Until a counter is initialized, the listings count with an aggregation
+query instead of reading it (see app/counters.py).
+
+Every counter key of the current pools and streams is set, in its own
+transaction, to the aggregation count of the query it stands for. Creates
+and deletions may keep running meanwhile, and the script can be run again
+at any time, e.g. after an interruption or when counters are suspected to
+have drifted. Once every counter is set it writes the `backfill` marker,
+after which the listings read all counters, also ones first written since.
+
+To run: python scripts/backfill_counters.py
+"""
+
+import os
+import sys
+
+import firebase_admin
+from firebase_admin import credentials, firestore
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# Initialize Firebase (only if not already initialized)
+if not firebase_admin._apps:
+    cred = credentials.Certificate('firebase-credentials.json')
+    firebase_admin.initialize_app(cred)
+
+from app.counters import (  # noqa: E402
+    initialize, mark_backfilled, pool_counter_queries, stream_counter_queries
+)
+
+db = firestore.client()
+
+
+def counter_queries():
+    """Every counter key of the current pools and streams, with its query."""
+    queries = {}
+    for pool in db.collection('pools').stream():
+        queries.update(pool_counter_queries(pool.to_dict()))
+    for stream in db.collection('streams').stream():
+        queries.update(stream_counter_queries(stream.to_dict()))
+    return queries
+
+
+if __name__ == "__main__":
+    queries = counter_queries()
+    for done, (key, query) in enumerate(sorted(queries.items()), 1):
+        count = initialize(key, query)
+        print(f"[{done}/{len(queries)}] {key}: {count}")
+    mark_backfilled()
+    print(f"Initialized {len(queries)} counters.")
@@ -0,0 +1,137 @@
+"""
+Measures the CPU cost of building and encoding a page of drops.
+
+A `GetDropsResponse` of `--drops` drops (50 by default, the largest page) is
+built from the dicts Firestore returns and encoded to JSON in several ways:
+
+- fastapi:   the handler returns the model; FastAPI's serialize_response and
+             JSONResponse encode it (how pages were served before)
+- pydantic:  app.responses.json_response, one pass of pydantic's serializer
+- preview:   the same with view=preview (app.fields)
+- construct: model_construct instead of validation, for data we wrote
+             ourselves, then json_response
+
+Prints the CPU time per page and the response size. Needs no Firestore
+access.
+
+To run:
+    python scripts/bench_pages.py
+    python scripts/bench_pages.py --text-bytes 2000 --iterations 5000
+"""
+
+import argparse
+import asyncio
+import datetime
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_model_field  # noqa: E402
+
+from app import fields  # noqa: E402
+from app.models import (  # noqa: E402
+    DropContent, DropInStream, GetDropsResponse, drop_snippet
+)
+from app.responses import json_response  # noqa: E402
+
+
+def page_entries(drops, text_bytes):
+    """Page snapshot entries as read from Firestore."""
+    now = datetime.datetime.now(datetime.timezone.utc)
+    text = ("lorem ipsum " * (text_bytes // 12 + 1))[:text_bytes]
+    return [
+        {
+            "drop_id": f"drop_{i}",
+            "creator_id": "user_abc",
+            "created_at": now,
+            "content": {
+                "title": f"Drop {i}",
+                "text": text,
+                "images": [f"https://example.com/{i}.jpg"],
+                "type": "text",
+                "snippet": drop_snippet(text),
+            },
+            "placement_id": f"placement_{i}",
+            "next_placement_id": f"placement_{i + 1}",
+            "prev_placement_id": f"placement_{i - 1}" if i else None,
+            "ordinal": i + 1,
+        }
+        for i in range(drops)
+    ]
+
+
+def build(entries):
+    return GetDropsResponse(
+        drops=entries, has_more=True, total_count=len(entries) * 2
+    )
+
+
+def construct(entries):
+    return GetDropsResponse.model_construct(
+        drops=[
+            DropInStream.model_construct(**{
+                **entry,
+                "content": DropContent.model_construct(**entry["content"]),
+            })
+            for entry in entries
+        ],
+        has_more=True,
+        total_count=len(entries) * 2,
+        continuation_token=None,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--drops", type=int, default=50)
+    parser.add_argument("--text-bytes", type=int, default=800)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    entries = page_entries(args.drops, args.text_bytes)
+    field = create_model_field(
+        name="response", type_=GetDropsResponse, mode="serialization"
+    )
+    loop = asyncio.new_event_loop()
+    preview = fields.fieldset(DropInStream)(fields=None, view="preview")
+
+    def fastapi_page():
+        content = loop.run_until_complete(
+            serialize_response(field=field, response_content=build(entries))
+        )
+        return JSONResponse(content).body
+
+    ways = {
+        "fastapi": fastapi_page,
+        "pydantic": lambda: json_response(build(entries)).body,
+        "preview": lambda: fields.select(
+            build(entries), preview, "drops"
+        ).body,
+        "construct": lambda: json_response(construct(entries)).body,
+    }
+
+    print(
+        f"{args.drops} drops per page, {args.text_bytes} bytes of text, "
+        f"{args.iterations} pages"
+    )
+    baseline = None
+    for name, page in ways.items():
+        size = len(page())
+        started = time.process_time()
+        for _ in range(args.iterations):
+            page()
+        per_page = (time.process_time() - started) / args.iterations * 1e6
+        baseline = baseline or per_page
+        print(
+            f"{name:>10}: {per_page:8.1f} us/page  {size:7d} bytes  "
+            f"x{baseline / per_page:.2f}"
+        )
+    loop.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Measures how request throughput scales with the number of gunicorn workers.
+
+For each worker count the server is started with gunicorn.conf.py, loaded
+for a fixed time by several client processes with keep-alive connections,
+and stopped again. Prints requests/second, latency percentiles and the
+speedup relative to the first worker count.
+
+The server needs the same Firestore credentials as a normal run unless the
+benchmarked path doesn't touch the database (the default, /health).
+
+To run:
+    python scripts/bench_workers.py
+    python scripts/bench_workers.py --workers 1 2 4 8 --path /api/v1/pools/pool_123/overview
+"""
+
+import argparse
+import multiprocessing
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+import httpx
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workers, port):
+    env = dict(
+        os.environ,
+        WEB_CONCURRENCY=str(workers),
+        PORT=str(port),
+        RATE_LIMIT_ENABLED="false",
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py",
+         "--access-logfile", "/dev/null", "app.main:app"],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}/health"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("gunicorn exited during startup")
+        try:
+            if httpx.get(url, timeout=1).status_code == 200:
+                # Give the remaining workers a moment to finish booting.
+                time.sleep(1 + workers * 0.2)
+                return server
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("gunicorn did not become ready")
+
+
+def stop_server(server):
+    server.send_signal(signal.SIGTERM)
+    try:
+        server.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        server.kill()
+
+
+def client_process(url, connections, duration, results):
+    """Runs `connections` keep-alive loops for `duration` seconds."""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def loop():
+        local = []
+        local_errors = 0
+        with httpx.Client(timeout=10) as client:
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                try:
+                    ok = client.get(url).status_code < 500
+                except httpx.HTTPError:
+                    ok = False
+                if ok:
+                    local.append(time.perf_counter() - started)
+                else:
+                    local_errors += 1
+        with lock:
+            latencies.extend(local)
+            errors[0] += local_errors
+
+    threads = [threading.Thread(target=loop) for _ in range(connections)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results.put((latencies, errors[0]))
+
+
+def run_load(url, clients, connections, duration):
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(
+            target=client_process,
+            args=(url, connections, duration, results),
+        )
+        for _ in range(clients)
+    ]
+    for process in processes:
+        process.start()
+    latencies, errors = [], 0
+    for _ in processes:
+        process_latencies, process_errors = results.get()
+        latencies.extend(process_latencies)
+        errors += process_errors
+    for process in processes:
+        process.join()
+    return latencies, errors
+
+
+def main():
+    cpus = os.cpu_count() or 1
+    default_workers = sorted({1, 2, 4, cpus} & set(range(1, cpus + 1)))
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument(
+        '--workers', type=int, nargs='+', default=default_workers
+    )
+    parser.add_argument('--path', default='/health')
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument(
+        '--clients', type=int, default=max(2, cpus),
+        help='Client processes generating load.'
+    )
+    parser.add_argument(
+        '--connections', type=int, default=8,
+        help='Keep-alive connections per client process.'
+    )
+    args = parser.parse_args()
+
+    print(
+        f"{cpus} CPUs, {args.clients} client processes x "
+        f"{args.connections} connections, {args.duration:.0f}s per run, "
+        f"GET {args.path}"
+    )
+    print(f"{'workers':>7} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'errors':>7} {'speedup':>8}")
+
+    baseline = None
+    for workers in args.workers:
+        port = free_port()
+        server = start_server(workers, port)
+        try:
+            latencies, errors = run_load(
+                f"http://127.0.0.1:{port}{args.path}",
+                args.clients,
+                args.connections,
+                args.duration,
+            )
+        finally:
+            stop_server(server)
+
+        throughput = len(latencies) / args.duration
+        if baseline is None:
+            baseline = throughput
+        if len(latencies) >= 2:
+            cuts = statistics.quantiles(latencies, n=100)
+            p50, p99 = cuts[49] * 1000, cuts[98] * 1000
+        else:
+            p50 = p99 = float('nan')
+        print(f"{workers:>7} {throughput:>9.0f} {p50:>8.1f} {p99:>8.1f} "
+              f"{errors:>7} {throughput / (baseline or 1):>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Verifies the placement linked list of every stream (or the given streams)
+and optionally repairs broken chains.
+
+Each stream's placements are read with one query and the chain is rebuilt in
+memory, reporting forks, cycles, orphans and bad head/tail pointers. With
+--repair, placements are relinked in `order_key` order (`added_at` order for
+streams that predate order keys, which are given keys) using batched writes.
+Repairs are not transactional; run them while the affected streams are not
+being appended to.
+
+To run:
+    python scripts/check_stream_chains.py
+    python scripts/check_stream_chains.py --stream stream_456 --repair
+"""
+
+import argparse
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import firebase_admin
+from firebase_admin import credentials
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# Initialize Firebase (only if not already initialized)
+if not firebase_admin._apps:
+    cred = credentials.Certificate('firebase-credentials.json')
+    firebase_admin.initialize_app(cred)
+
+from app.db import streams_collection  # noqa: E402
+from app.integrity import check_stream  # noqa: E402
+
+
+def iter_streams(stream_ids):
+    """Yields (stream_id, stream_data) for the requested or all streams."""
+    if stream_ids:
+        for stream_id in stream_ids:
+            doc = streams_collection.document(stream_id).get()
+            if doc.exists:
+                yield stream_id, doc.to_dict()
+            else:
+                print(f"Stream {stream_id} not found, skipping")
+        return
+    for doc in streams_collection.stream():
+        yield doc.id, doc.to_dict()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--stream', action='append', dest='streams')
+    parser.add_argument('--repair', action='store_true')
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+
+    checked = broken = repaired = 0
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        reports = pool.map(
+            lambda item: check_stream(item[0], item[1], repair=args.repair),
+            iter_streams(args.streams),
+        )
+        for report in reports:
+            checked += 1
+            if report.ok:
+                continue
+            broken += 1
+            print(
+                f"\nStream {report.stream_id}: {report.placement_count} "
+                f"placements, {report.reachable_count} reachable"
+            )
+            for issue in report.issues:
+                print(f"  - {issue}")
+            if report.repaired_writes:
+                repaired += 1
+                print(f"  repaired with {report.repaired_writes} writes")
+
+    print(
+        f"\nChecked {checked} streams: {broken} broken, {repaired} repaired."
+    )
+    return 1 if broken and not args.repair else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
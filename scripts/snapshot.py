@@ -0,0 +1,292 @@
+"""
+Exports Firestore collections to compressed NDJSON shards and imports them
+back, for backups and for cloning one environment into another.
+
+Export splits every collection group into partitions with
+`collection_group().get_partitions()` and streams each partition from a
+worker pool into its own gzipped NDJSON shard. Import replays the shards with
+batched writes, throttled to a fixed write rate, and keeps a checkpoint file
+so an interrupted import resumes where it left off.
+
+To run:
+    python scripts/snapshot.py export --out backups/2025-11-20
+    python scripts/snapshot.py import --src backups/2025-11-20 --rate 500
+"""
+
+import argparse
+import base64
+import datetime
+import gzip
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import firebase_admin
+from firebase_admin import credentials, firestore
+from google.cloud.firestore_v1 import DocumentReference
+
+# Initialize Firebase (only if not already initialized)
+if not firebase_admin._apps:
+    cred = credentials.Certificate('firebase-credentials.json')
+    firebase_admin.initialize_app(cred)
+
+db = firestore.client()
+
+DEFAULT_COLLECTIONS = [
+    'pools',
+    'streams',
+    'drops',
+    'stream_drops',
+    'stream_pages',
+    'counters',
+    'progress',
+    # Drops accepted by POST /streams/{id}/drops:enqueue but not linked yet.
+    'append_queue',
+    # Tombstones of deleted pools and streams, with their cleanup state.
+    'deletions',
+]
+
+MANIFEST_FILE = 'manifest.json'
+CHECKPOINT_FILE = 'import.checkpoint.json'
+MAX_BATCH_SIZE = 500
+
+
+# --- Value encoding ---
+
+def encode_value(value):
+    """Converts Firestore values into JSON-safe, type-tagged values."""
+    if isinstance(value, datetime.datetime):
+        return {'__datetime__': value.isoformat()}
+    if isinstance(value, DocumentReference):
+        return {'__ref__': value.path}
+    if isinstance(value, bytes):
+        return {'__bytes__': base64.b64encode(value).decode()}
+    if isinstance(value, dict):
+        return {key: encode_value(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [encode_value(item) for item in value]
+    return value
+
+
+def decode_value(value):
+    """Reverses `encode_value`."""
+    if isinstance(value, dict):
+        if '__datetime__' in value:
+            return datetime.datetime.fromisoformat(value['__datetime__'])
+        if '__ref__' in value:
+            return db.document(value['__ref__'])
+        if '__bytes__' in value:
+            return base64.b64decode(value['__bytes__'])
+        return {key: decode_value(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [decode_value(item) for item in value]
+    return value
+
+
+# --- Export ---
+
+def export_partition(out_dir, collection, index, query):
+    """Streams one partition of a collection group into a shard file."""
+    shard = os.path.join(collection, f'part-{index:05d}.ndjson.gz')
+    count = 0
+    with gzip.open(os.path.join(out_dir, shard), 'wt', encoding='utf-8') as f:
+        for doc in query.stream():
+            record = {
+                'path': doc.reference.path,
+                'data': encode_value(doc.to_dict()),
+            }
+            f.write(json.dumps(record, separators=(',', ':')))
+            f.write('\n')
+            count += 1
+    return shard, count
+
+
+def export_snapshot(out_dir, collections, partitions, workers):
+    """Exports every collection group into `out_dir` and writes a manifest."""
+    manifest = {
+        'created_at': datetime.datetime.utcnow().isoformat(),
+        'shards': {},
+    }
+    started = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = []
+        for collection in collections:
+            os.makedirs(os.path.join(out_dir, collection), exist_ok=True)
+            group = db.collection_group(collection)
+            for index, partition in enumerate(
+                group.get_partitions(partitions)
+            ):
+                futures.append(pool.submit(
+                    export_partition,
+                    out_dir,
+                    collection,
+                    index,
+                    partition.query(),
+                ))
+
+        for future in as_completed(futures):
+            shard, count = future.result()
+            manifest['shards'][shard] = count
+            print(f"  {shard}: {count} documents")
+
+    with open(os.path.join(out_dir, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    total = sum(manifest['shards'].values())
+    elapsed = time.monotonic() - started
+    print(f"Exported {total} documents in {elapsed:.1f}s to {out_dir}")
+
+
+# --- Import ---
+
+class RateLimiter:
+    """
+    Shared token bucket allowing `rate` writes per second on average. A
+    batch larger than the bucket is let through and paid for afterwards.
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, amount):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.rate, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens > 0:
+                    self.tokens -= amount
+                    return
+                wait = -self.tokens / self.rate
+            time.sleep(wait)
+
+
+class Checkpoint:
+    """Records how many lines of each shard have been committed."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.progress = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.progress = json.load(f)
+
+    def done(self, shard):
+        return self.progress.get(shard, 0)
+
+    def record(self, shard, lines):
+        with self.lock:
+            self.progress[shard] = lines
+            tmp_path = f'{self.path}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self.progress, f)
+            os.replace(tmp_path, self.path)
+
+
+def import_shard(src_dir, shard, total, limiter, checkpoint, batch_size):
+    """Replays one shard with batched writes, resuming from the checkpoint."""
+    skip = checkpoint.done(shard)
+    if skip >= total:
+        return shard, 0
+
+    written = 0
+    line_number = 0
+    batch = db.batch()
+    pending = 0
+    with gzip.open(os.path.join(src_dir, shard), 'rt', encoding='utf-8') as f:
+        for line in f:
+            line_number += 1
+            if line_number <= skip:
+                continue
+            record = json.loads(line)
+            batch.set(db.document(record['path']), decode_value(record['data']))
+            pending += 1
+            if pending == batch_size:
+                limiter.acquire(pending)
+                batch.commit()
+                written += pending
+                checkpoint.record(shard, line_number)
+                batch = db.batch()
+                pending = 0
+    if pending:
+        limiter.acquire(pending)
+        batch.commit()
+        written += pending
+    checkpoint.record(shard, line_number)
+    return shard, written
+
+
+def import_snapshot(src_dir, rate, workers, batch_size):
+    """Imports every shard listed in the manifest of `src_dir`."""
+    with open(os.path.join(src_dir, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+
+    limiter = RateLimiter(rate)
+    checkpoint = Checkpoint(os.path.join(src_dir, CHECKPOINT_FILE))
+    started = time.monotonic()
+    written = 0
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(
+                import_shard,
+                src_dir,
+                shard,
+                total,
+                limiter,
+                checkpoint,
+                batch_size,
+            )
+            for shard, total in sorted(manifest['shards'].items())
+        ]
+        for future in as_completed(futures):
+            shard, count = future.result()
+            written += count
+            print(f"  {shard}: {count} documents written")
+
+    elapsed = time.monotonic() - started
+    print(f"Imported {written} documents in {elapsed:.1f}s from {src_dir}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = commands.add_parser('export', help='Export a snapshot.')
+    export_parser.add_argument('--out', required=True)
+    export_parser.add_argument(
+        '--collections', nargs='+', default=DEFAULT_COLLECTIONS
+    )
+    export_parser.add_argument('--partitions', type=int, default=16)
+    export_parser.add_argument('--workers', type=int, default=8)
+
+    import_parser = commands.add_parser('import', help='Import a snapshot.')
+    import_parser.add_argument('--src', required=True)
+    import_parser.add_argument(
+        '--rate', type=int, default=500, help='Maximum writes per second.'
+    )
+    import_parser.add_argument('--workers', type=int, default=4)
+    import_parser.add_argument(
+        '--batch-size', type=int, default=MAX_BATCH_SIZE
+    )
+
+    args = parser.parse_args()
+    if args.command == 'export':
+        os.makedirs(args.out, exist_ok=True)
+        export_snapshot(args.out, args.collections, args.partitions, args.workers)
+    else:
+        batch_size = max(1, min(args.batch_size, MAX_BATCH_SIZE))
+        import_snapshot(args.src, args.rate, args.workers, batch_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,10 @@ from fastapi.testclient import TestClient
 import requests
 import os
 
+# Tests exercise endpoints far faster than any real client; the rate limiter
+# is switched back on explicitly by the tests that cover it.
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
 # Import the FastAPI app instance
 from app.main import app
 from app.auth import get_current_user_id
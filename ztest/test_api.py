@@ -1,4 +1,11 @@
 import json
+import time
+import uuid
+
+from app import counters, deletions, rate_limit, renumbering
+from app.auth import get_current_user_id
+from app.db import counters_collection, stream_drops_collection, streams_collection
+from app.main import app
 
 # The client and test_data fixtures are automatically injected by pytest from conftest.py.
 
@@ -16,6 +23,32 @@ def print_response(message, res):
         print(f"Response Body: {res.text}")
     print("-" * (len(message) + 8) + "\n")
 
+def create_stream_with_drops(client, num_drops, stream_content=None):
+    """Creates a pool and a stream holding `num_drops` drops; returns their JSON."""
+    pool_res = client.post(f"{API_V1_PREFIX}/pools", json={
+        "creator_id": "test_user_01",
+        "pool_content": {"title": "Helper Pool", "description": "Created by a test helper."}
+    })
+    assert pool_res.status_code == 201, "Failed to create helper pool!"
+    pool = pool_res.json()
+    stream_res = client.post(f"{API_V1_PREFIX}/streams", json={
+        "pool_id": pool['pool_id'],
+        "creator_id": "test_user_01",
+        "stream_content": stream_content or {"title": "Helper Stream", "description": "Created by a test helper."}
+    })
+    assert stream_res.status_code == 201, "Failed to create helper stream!"
+    stream = stream_res.json()
+    drops = []
+    if num_drops:
+        drops_res = client.post(f"{API_V1_PREFIX}/streams/{stream['stream_id']}/drops", json={
+            "creator_id": "test_user_01",
+            "drops": [{"title": f"Helper Drop {i}", "text": f"Helper text #{i}."} for i in range(1, num_drops + 1)]
+        })
+        assert drops_res.status_code == 201, "Failed to add helper drops!"
+        body = drops_res.json()
+        drops = body['drops'] if 'drops' in body else [body]
+    return pool, stream, drops
+
 # --- Test Functions ---
 
 def test_health_check(client):
@@ -163,3 +196,508 @@ def test_get_river_feed(client, test_data):
     assert stream['user_progress']['is_completed'] is False
     print_response("River feed retrieved", res)
     print("\n✅ All API tests passed successfully! ✅")
+
+def test_place_existing_drops_in_another_stream(client):
+    """Existing drops are placed into a second stream without being copied."""
+    _, source_stream, drops = create_stream_with_drops(client, 2)
+    _, target_stream, _ = create_stream_with_drops(client, 0)
+    drop_ids = [drop['drop_id'] for drop in drops]
+
+    res = client.post(f"{API_V1_PREFIX}/streams/{target_stream['stream_id']}/placements", json={"drop_ids": drop_ids})
+    assert res.status_code == 201, "Failed to place existing drops!"
+    assert [drop['drop_id'] for drop in res.json()['drops']] == drop_ids
+
+    res = client.get(f"{API_V1_PREFIX}/streams/{target_stream['stream_id']}/drops?limit=10")
+    assert [drop['drop_id'] for drop in res.json()['drops']] == drop_ids
+
+    res = client.get(f"{API_V1_PREFIX}/drops/{drop_ids[0]}/placements")
+    assert res.status_code == 200
+    stream_ids = {placement['stream_id'] for placement in res.json()['placements']}
+    assert stream_ids == {source_stream['stream_id'], target_stream['stream_id']}
+
+    res = client.post(f"{API_V1_PREFIX}/streams/{target_stream['stream_id']}/placements", json={"drop_ids": ["missing_drop"]})
+    assert res.status_code == 404
+
+def test_search_finds_new_content(client):
+    """Pools, streams and drops are searchable as soon as they are created."""
+    pool, stream, drops = create_stream_with_drops(client, 1, stream_content={
+        "title": "Entanglement Basics",
+        "description": "Spooky action explained.",
+        "category": "Physics"
+    })
+
+    res = client.get(f"{API_V1_PREFIX}/search", params={"q": "entanglement"})
+    assert res.status_code == 200
+    hits = res.json()['hits']
+    assert hits[0]['kind'] == "stream"
+    assert hits[0]['id'] == stream['stream_id']
+    assert hits[0]['parent_id'] == pool['pool_id']
+
+    res = client.get(f"{API_V1_PREFIX}/search", params={"q": "helper text", "kind": "drop"})
+    assert drops[0]['drop_id'] in [hit['id'] for hit in res.json()['hits']]
+    assert all(hit['kind'] == "drop" for hit in res.json()['hits'])
+
+    res = client.get(f"{API_V1_PREFIX}/search", params={"q": "anything", "kind": "user"})
+    assert res.status_code == 422
+
+def test_discover_streams_by_category_with_cursor(client):
+    """Category discovery pages with cursors and reports precomputed counts."""
+    category = "Cursor Category"
+    pool, _, _ = create_stream_with_drops(client, 0, stream_content={
+        "title": "Category Stream 1", "description": "First.", "category": category
+    })
+    for i in range(2, 4):
+        res = client.post(f"{API_V1_PREFIX}/streams", json={
+            "pool_id": pool['pool_id'],
+            "creator_id": "test_user_01",
+            "stream_content": {"title": f"Category Stream {i}", "description": "More.", "category": category}
+        })
+        assert res.status_code == 201
+
+    res = client.get(f"{API_V1_PREFIX}/streams", params={"category": category, "limit": 2})
+    assert res.status_code == 200
+    page1 = res.json()
+    assert page1['total_count'] == 3
+    assert page1['has_more'] is True
+    assert [s['content']['title'] for s in page1['streams']] == ["Category Stream 1", "Category Stream 2"]
+
+    res = client.get(f"{API_V1_PREFIX}/streams", params={"category": category, "limit": 2, "cursor": page1['next_cursor']})
+    page2 = res.json()
+    assert [s['content']['title'] for s in page2['streams']] == ["Category Stream 3"]
+    assert page2['has_more'] is False
+    assert page2['next_cursor'] is None
+
+    res = client.get(f"{API_V1_PREFIX}/pools/{pool['pool_id']}/streams", params={"limit": 1})
+    assert res.json()['total_count'] == 3
+
+def test_rate_limit_returns_429_with_retry_after(client, monkeypatch):
+    """Callers over their route budget are rejected until tokens refill."""
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setitem(
+        rate_limit.limiter.rules, "GET /api/v1/pools/{pool_id}", rate_limit.Rule(rate=0.1, burst=2)
+    )
+    pool, _, _ = create_stream_with_drops(client, 0)
+
+    statuses = [client.get(f"{API_V1_PREFIX}/pools/{pool['pool_id']}").status_code for _ in range(3)]
+    assert statuses == [200, 200, 429]
+
+    res = client.get(f"{API_V1_PREFIX}/pools/{pool['pool_id']}")
+    assert res.status_code == 429
+    assert int(res.headers['Retry-After']) >= 1
+
+    metrics = client.get("/metrics").json()['rate_limit']['routes']
+    assert metrics["GET /api/v1/pools/{pool_id}"]['limited'] >= 2
+
+def test_local_budgets_are_split_between_workers(monkeypatch):
+    monkeypatch.setenv("RATE_LIMIT_WORKERS", "4")
+    limiter = rate_limit._build_limiter()
+    default = limiter.rule_for("GET /api/v1/pools")
+    progress = limiter.rule_for("POST /api/v1/user/progress")
+    assert (default.rate, default.burst) == (2.5, 10)
+    assert (progress.rate, progress.burst) == (0.5, 3)
+
+    monkeypatch.setenv("RATE_LIMIT_BACKEND", "firestore")
+    assert rate_limit._build_limiter().rule_for("GET /api/v1/pools").burst == 40
+
+def test_idempotency_key_replays_add_drops(client):
+    """A retried add-drops request with the same key doesn't append twice."""
+    _, stream, _ = create_stream_with_drops(client, 0)
+    payload = {"creator_id": "test_user_01", "drops": [{"text": "Once."}, {"text": "Only once."}]}
+    headers = {"Idempotency-Key": "retry-add-drops-1"}
+    url = f"{API_V1_PREFIX}/streams/{stream['stream_id']}/drops"
+
+    first = client.post(url, json=payload, headers=headers)
+    retry = client.post(url, json=payload, headers=headers)
+    assert first.status_code == retry.status_code == 201
+    assert retry.json() == first.json()
+    assert retry.headers['Idempotent-Replayed'] == "true"
+
+    res = client.get(f"{url}?limit=10")
+    assert res.json()['total_count'] == 2
+
+    res = client.post(url, json={**payload, "drops": [{"text": "Different."}]}, headers=headers)
+    assert res.status_code == 422
+
+def test_head_and_tail_pages_match_traversal(client):
+    """Snapshot-served head/tail pages agree with a linked-list traversal."""
+    _, stream, drops = create_stream_with_drops(client, 4)
+    url = f"{API_V1_PREFIX}/streams/{stream['stream_id']}/drops"
+
+    head = client.get(f"{url}?limit=3").json()
+    walked = client.get(f"{url}?limit=3&from_placement_id={head['drops'][0]['placement_id']}").json()
+    assert head == walked
+    assert head['total_count'] == 4
+
+    tail = client.get(f"{url}?limit=-2").json()
+    assert [drop['drop_id'] for drop in tail['drops']] == [drops[3]['drop_id'], drops[2]['drop_id']]
+    assert tail['drops'][0]['next_placement_id'] is None
+
+    res = client.get(f"{API_V1_PREFIX}/streams/{stream['stream_id']}")
+    assert res.json()['drop_count'] == 4
+
+def test_pool_overview_embeds_stream_summaries(client):
+    """The overview returns the pool, its streams, drop counts and first drops."""
+    pool, stream, drops = create_stream_with_drops(client, 2)
+
+    res = client.get(f"{API_V1_PREFIX}/pools/{pool['pool_id']}/overview")
+    assert res.status_code == 200
+    body = res.json()
+    assert body['pool']['pool_id'] == pool['pool_id']
+    assert body['total_count'] == 1
+    assert body['streams'][0]['drop_count'] == 2
+    assert body['streams'][0]['first_drop']['drop_id'] == drops[0]['drop_id']
+
+    # Writes invalidate the cached overview.
+    client.post(f"{API_V1_PREFIX}/streams/{stream['stream_id']}/drops", json={
+        "creator_id": "test_user_01", "drops": {"text": "One more."}
+    })
+    res = client.get(f"{API_V1_PREFIX}/pools/{pool['pool_id']}/overview")
+    assert res.json()['streams'][0]['drop_count'] == 3
+
+    res = client.get(f"{API_V1_PREFIX}/pools/missing_pool/overview")
+    assert res.status_code == 404
+
+def test_batch_get_endpoints(client):
+    """Batch gets return documents in request order and report missing IDs."""
+    pool, stream, drops = create_stream_with_drops(client, 2)
+    drop_ids = [drop['drop_id'] for drop in reversed(drops)]
+
+    res = client.post(f"{API_V1_PREFIX}/drops:batchGet", json={"ids": drop_ids + ["missing_drop"]})
+    assert res.status_code == 200
+    assert [drop['drop_id'] for drop in res.json()['drops']] == drop_ids
+    assert res.json()['missing'] == ["missing_drop"]
+
+    res = client.post(f"{API_V1_PREFIX}/streams:batchGet", json={"ids": [stream['stream_id']]})
+    assert res.json()['streams'][0]['stream_id'] == stream['stream_id']
+
+    res = client.post(f"{API_V1_PREFIX}/pools:batchGet", json={"ids": [pool['pool_id'], "missing_pool"]})
+    assert res.json()['missing'] == ["missing_pool"]
+
+    placement_ids = [drop['placement_id'] for drop in drops]
+    res = client.post(f"{API_V1_PREFIX}/placements:batchGet", json={"ids": placement_ids})
+    assert [p['placement_id'] for p in res.json()['placements']] == placement_ids
+
+    res = client.post(f"{API_V1_PREFIX}/drops:batchGet", json={"ids": []})
+    assert res.status_code == 422
+
+def test_river_hydration_reports_drops_remaining(client):
+    """A hydrated river carries stream metadata and unread counts."""
+    pool, stream, drops = create_stream_with_drops(
+        client, 3, {"title": "River Stream", "description": "Hydrated.", "image": "https://example.com/river.jpg"}
+    )
+    res = client.post(f"{API_V1_PREFIX}/user/progress", json={
+        "pool_id": pool['pool_id'],
+        "stream_id": stream['stream_id'],
+        "placement_id": drops[0]['placement_id'],
+    })
+    assert res.status_code == 204
+
+    res = client.get(f"{API_V1_PREFIX}/user/river?hydrate=true")
+    assert res.status_code == 200
+    record = next(r for r in res.json()['records'] if r['stream_id'] == stream['stream_id'])
+    assert record['title'] == "River Stream"
+    assert record['image'] == "https://example.com/river.jpg"
+    assert record['drop_count'] == 3
+    assert record['drops_remaining'] == 2
+
+def test_river_reports_completion_from_ordinals(client):
+    """Progress updates record how far into the stream the user is."""
+    pool, stream, drops = create_stream_with_drops(client, 4)
+    for drop in (drops[1], drops[3]):
+        client.post(f"{API_V1_PREFIX}/user/progress", json={
+            "pool_id": pool['pool_id'],
+            "stream_id": stream['stream_id'],
+            "placement_id": drop['placement_id'],
+        })
+        record = next(
+            r for r in client.get(f"{API_V1_PREFIX}/user/river").json()['records']
+            if r['stream_id'] == stream['stream_id']
+        )
+        unfinished = client.get(f"{API_V1_PREFIX}/user/river?completed=false").json()['records']
+        if drop is drops[1]:
+            assert (record['position'], record['completion'], record['is_completed']) == (2, 50.0, False)
+            assert stream['stream_id'] in [r['stream_id'] for r in unfinished]
+        else:
+            assert (record['position'], record['completion'], record['is_completed']) == (4, 100.0, True)
+            assert stream['stream_id'] not in [r['stream_id'] for r in unfinished]
+
+def test_preview_view_returns_snippets_only(client):
+    """view=preview and fields= trim the drops of a page."""
+    _, stream, _ = create_stream_with_drops(client, 1)
+    long_text = "word " * 100
+    drop = client.post(f"{API_V1_PREFIX}/streams/{stream['stream_id']}/drops", json={
+        "creator_id": "user_1",
+        "drops": {"title": "Long", "text": long_text, "images": ["https://example.com/a.jpg"]},
+    }).json()
+    assert drop['content']['snippet'].endswith("...")
+    assert len(drop['content']['snippet']) <= 160
+
+    url = f"{API_V1_PREFIX}/streams/{stream['stream_id']}/drops"
+    preview = client.get(url, params={"limit": -1, "view": "preview"}).json()['drops'][0]
+    assert preview['placement_id'] == drop['placement_id']
+    assert preview['content'] == {"title": "Long", "type": "text", "snippet": drop['content']['snippet']}
+
+    page = client.get(url, params={"fields": "drop_id,content.title"}).json()
+    assert all(d.keys() == {"drop_id", "content"} for d in page['drops'])
+    assert page['total_count'] == 2
+
+    single = client.get(f"{API_V1_PREFIX}/drops/{drop['drop_id']}", params={"view": "preview"}).json()
+    assert "text" not in single['content'] and "placement_id" not in single
+    assert client.get(url, params={"fields": "content.body"}).status_code == 422
+
+def test_export_streams_all_drops_and_resumes(client, monkeypatch):
+    """The export yields every drop as an NDJSON line, across windows."""
+    monkeypatch.setattr("app.stream_export.WINDOW", 2)
+    _, stream, drops = create_stream_with_drops(client, 5)
+    url = f"{API_V1_PREFIX}/streams/{stream['stream_id']}/drops:export"
+
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith("application/x-ndjson")
+    exported = [json.loads(line) for line in response.text.splitlines()]
+    assert [d['placement_id'] for d in exported] == [d['placement_id'] for d in drops]
+    assert [d['ordinal'] for d in exported] == [1, 2, 3, 4, 5]
+
+    resumed = client.get(url, params={"after_placement_id": drops[2]['placement_id']})
+    assert [json.loads(line)['ordinal'] for line in resumed.text.splitlines()] == [4, 5]
+
+    assert client.get(url, params={"after_placement_id": "missing"}).status_code == 404
+
+def test_hydrated_river_follows_renumbered_ordinals(client):
+    """Drops inserted before the last-read one change its position."""
+    pool, stream, drops = create_stream_with_drops(client, 4)
+    client.post(f"{API_V1_PREFIX}/user/progress", json={
+        "pool_id": pool['pool_id'],
+        "stream_id": stream['stream_id'],
+        "placement_id": drops[1]['placement_id'],
+    })
+    res = client.post(f"{API_V1_PREFIX}/streams/{stream['stream_id']}/placements", json={
+        "drop_ids": [drops[3]['drop_id']], "before_placement_id": drops[0]['placement_id']
+    })
+    assert res.status_code == 201
+    assert renumbering.renumberer.wait_idle(5)
+
+    record = next(
+        r for r in client.get(f"{API_V1_PREFIX}/user/river?hydrate=true").json()['records']
+        if r['stream_id'] == stream['stream_id']
+    )
+    assert (record['position'], record['drop_count'], record['drops_remaining']) == (3, 5, 2)
+    assert record['completion'] == 60.0
+
+def test_deadline_cut_traversal_returns_continuation_token(client, monkeypatch):
+    """A traversal running out of time returns a partial page that can be resumed."""
+    from firebase_admin import firestore
+    from app.db import streams_collection
+    from app.endpoints import streams
+    _, stream, drops = create_stream_with_drops(client, 3)
+    url = f"{API_V1_PREFIX}/streams/{stream['stream_id']}/drops"
+    # Only streams without order keys are read by walking the chain.
+    streams_collection.document(stream['stream_id']).update({"last_order_key": firestore.DELETE_FIELD})
+
+    # Pretend every read after the first leaves too little time to continue.
+    monkeypatch.setattr(streams, "PARTIAL_PAGE_RESERVE", 3600)
+    res = client.get(f"{url}?limit=3&from_placement_id={drops[0]['placement_id']}")
+    assert res.status_code == 200
+    body = res.json()
+    assert [drop['drop_id'] for drop in body['drops']] == [drops[0]['drop_id']]
+    assert body['has_more'] is True
+    assert body['continuation_token'] == drops[1]['placement_id']
+
+    monkeypatch.undo()
+    res = client.get(f"{url}?limit=3&from_placement_id={body['continuation_token']}")
+    assert [drop['drop_id'] for drop in res.json()['drops']] == [drops[1]['drop_id'], drops[2]['drop_id']]
+    assert res.json()['continuation_token'] is None
+
+def test_counters_are_read_once_initialized(client, monkeypatch):
+    """Counters written after data that predates them aren't trusted."""
+    monkeypatch.setattr(counters, "_backfilled", False)
+    creator_id = f"user_{uuid.uuid4().hex}"
+    key = counters.pools_key(creator_id)
+
+    def create_pool():
+        res = client.post(f"{API_V1_PREFIX}/pools", json={
+            "creator_id": creator_id,
+            "pool_content": {"title": "Counted Pool", "description": "Counted."}
+        })
+        assert res.status_code == 201
+
+    def total_count():
+        res = client.get(f"{API_V1_PREFIX}/pools", params={"creator_id": creator_id})
+        return res.json()['total_count']
+
+    create_pool()
+    counters_collection.document(key).delete()  # as if it predated counters
+    create_pool()
+    assert counters_collection.document(key).get().to_dict()['count'] == 1
+    assert total_count() == 2
+
+    for counter_key, query in counters.pool_counter_queries({"creator_id": creator_id}).items():
+        counters.initialize(counter_key, query)
+    assert counters_collection.document(key).get().to_dict() == {"count": 2, "initialized": True}
+    shards = list(counters_collection.where("initialized", "==", True).stream())
+    assert len([doc for doc in shards if doc.id.startswith("pools:shard:")]) == counters.SHARDS
+    create_pool()
+    assert total_count() == 3
+
+    # After the backfill, counters first written since are read as well.
+    counters.mark_backfilled()
+    try:
+        counters_collection.document(key).set({"count": 7})
+        assert total_count() == 7
+    finally:
+        counters_collection.document("backfill").delete()
+
+def test_insert_move_and_remove_drops(client):
+    """Order keys keep pages, ordinals and the linked list consistent across edits."""
+    _, stream, drops = create_stream_with_drops(client, 3)
+    stream_url = f"{API_V1_PREFIX}/streams/{stream['stream_id']}"
+    ids = [drop['drop_id'] for drop in drops]
+    placements = [drop['placement_id'] for drop in drops]
+
+    def page(query="limit=50"):
+        # Ordinals are renumbered in the background after each edit.
+        assert renumbering.renumberer.wait_idle(5)
+        body = client.get(f"{stream_url}/drops?{query}").json()
+        return [drop['drop_id'] for drop in body['drops']], [drop['ordinal'] for drop in body['drops']]
+
+    res = client.post(f"{stream_url}/placements/{placements[2]}:move", json={"after_placement_id": placements[0]})
+    assert res.status_code == 200
+    assert res.json()['prev_placement_id'] == placements[0]
+    assert page() == ([ids[0], ids[2], ids[1]], [1, 2, 3])
+
+    res = client.post(f"{stream_url}/placements", json={"drop_ids": [ids[1]], "before_placement_id": placements[0]})
+    assert res.status_code == 201
+    assert page() == ([ids[1], ids[0], ids[2], ids[1]], [1, 2, 3, 4])
+    assert page(f"limit=-2&from_placement_id={placements[2]}") == ([ids[2], ids[0]], [3, 2])
+
+    res = client.delete(f"{stream_url}/placements/{placements[0]}")
+    assert res.status_code == 204
+    assert page() == ([ids[1], ids[2], ids[1]], [1, 2, 3])
+    assert client.get(stream_url).json()['drop_count'] == 3
+
+    res = client.post(f"{stream_url}/placements/{placements[2]}:move", json={"after_placement_id": placements[2]})
+    assert res.status_code == 422
+    res = client.delete(f"{stream_url}/placements/missing_placement")
+    assert res.status_code == 404
+
+def test_renumbering_starts_over_when_the_stream_changes(client, monkeypatch):
+    """A page renumbered against an outdated version is read again."""
+    _, stream, drops = create_stream_with_drops(client, 4)
+    stream_ref = streams_collection.document(stream['stream_id'])
+    for drop in drops:
+        stream_drops_collection.document(drop['placement_id']).update({"ordinal": 9})
+    write_page = renumbering._write_page
+    edits = []
+
+    def edited_meanwhile(ref, version, updates):
+        if not edits:
+            # Another worker edits the chain between the read and the write.
+            edits.append(version)
+            stream_ref.update({"version": (version or 0) + 1})
+        return write_page(ref, version, updates)
+
+    monkeypatch.setattr(renumbering, "_write_page", edited_meanwhile)
+    placements = [
+        stream_drops_collection.document(drop['placement_id']).get().to_dict()
+        for drop in drops
+    ]
+    renumberer = renumbering.Renumberer()
+    assert renumberer.renumber(stream['stream_id'], placements[0]['order_key'], None) == 3
+    assert renumberer.stats()["restarted_pages"] == 1
+    placements = [
+        stream_drops_collection.document(drop['placement_id']).get().to_dict()
+        for drop in drops
+    ]
+    assert [placement['ordinal'] for placement in placements] == [9, 2, 3, 4]
+
+def test_enqueued_drops_are_linked_in_order(client):
+    """Queued drops are linked at the end of the stream by the sequencer."""
+    _, stream, drops = create_stream_with_drops(client, 1)
+    stream_url = f"{API_V1_PREFIX}/streams/{stream['stream_id']}"
+    queued = []
+    for batch in range(3):
+        res = client.post(f"{stream_url}/drops:enqueue", json={
+            "creator_id": "test_user_01",
+            "drops": [{"title": f"Queued {batch}-{i}", "text": "Queued text."} for i in range(2)]
+        })
+        assert res.status_code == 202
+        queued += [drop['drop_id'] for drop in res.json()['drops']]
+
+    for _ in range(100):
+        if client.get(stream_url).json()['drop_count'] == 7:
+            break
+        time.sleep(0.05)
+    body = client.get(f"{stream_url}/drops?limit=10").json()
+    assert [drop['drop_id'] for drop in body['drops']] == [drops[0]['drop_id']] + queued
+    assert [drop['ordinal'] for drop in body['drops']] == list(range(1, 8))
+
+    res = client.post(f"{API_V1_PREFIX}/streams/missing_stream/drops:enqueue", json={
+        "creator_id": "test_user_01", "drops": {"title": "Lost", "text": "Lost text."}
+    })
+    assert res.status_code == 404
+
+def test_only_the_creator_can_delete(client, monkeypatch):
+    """Deleting someone else's pool or stream is forbidden and deletes nothing."""
+    pool, stream, _ = create_stream_with_drops(client, 1)
+    pool_url = f"{API_V1_PREFIX}/pools/{pool['pool_id']}"
+    stream_url = f"{API_V1_PREFIX}/streams/{stream['stream_id']}"
+    monkeypatch.setitem(app.dependency_overrides, get_current_user_id, lambda: "intruder")
+
+    assert client.delete(stream_url).status_code == 403
+    assert client.delete(pool_url).status_code == 403
+    assert client.get(stream_url).status_code == 200
+    assert client.get(pool_url).status_code == 200
+
+def test_delete_stream_cleans_up_in_background(client, monkeypatch):
+    """A deleted stream is gone at once; its dependents are removed later."""
+    monkeypatch.setattr(deletions, "BATCHES_PER_SECOND", 1000)
+    pool, stream, drops = create_stream_with_drops(client, 2)
+    stream_url = f"{API_V1_PREFIX}/streams/{stream['stream_id']}"
+    other = client.post(f"{API_V1_PREFIX}/streams", json={
+        "pool_id": pool['pool_id'],
+        "creator_id": "test_user_01",
+        "stream_content": {"title": "Other Stream", "description": "Shares a drop."}
+    }).json()
+    client.post(f"{API_V1_PREFIX}/streams/{other['stream_id']}/placements", json={"drop_ids": [drops[0]['drop_id']]})
+    client.post(f"{API_V1_PREFIX}/user/progress", json={
+        "pool_id": pool['pool_id'], "stream_id": stream['stream_id'], "placement_id": drops[1]['placement_id']
+    })
+
+    res = client.delete(stream_url)
+    assert res.status_code == 202
+    assert res.json()['kind'] == "stream"
+    assert client.get(stream_url).status_code == 404
+    assert client.get(f"{API_V1_PREFIX}/pools/{pool['pool_id']}/streams").json()['total_count'] == 1
+
+    deletions.cleaner.wake()
+    for _ in range(100):
+        if client.delete(stream_url).status_code == 404:
+            break
+        time.sleep(0.05)
+    assert client.delete(stream_url).status_code == 404
+    assert client.get(f"{API_V1_PREFIX}/drops/{drops[1]['drop_id']}").status_code == 404
+    assert client.get(f"{API_V1_PREFIX}/drops/{drops[0]['drop_id']}").status_code == 200
+    records = client.get(f"{API_V1_PREFIX}/user/river").json()['records']
+    assert stream['stream_id'] not in [record['stream_id'] for record in records]
+
+def test_deleted_stream_is_hidden_before_cleanup(client, monkeypatch):
+    """A deleted stream's pages and placements disappear before the cleaner runs."""
+    monkeypatch.setattr(deletions.cleaner, "wake", lambda: None)
+    pool, stream, drops = create_stream_with_drops(client, 2)
+    stream_url = f"{API_V1_PREFIX}/streams/{stream['stream_id']}"
+    other = client.post(f"{API_V1_PREFIX}/streams", json={
+        "pool_id": pool['pool_id'],
+        "creator_id": "test_user_01",
+        "stream_content": {"title": "Other Stream", "description": "Shares a drop."}
+    }).json()
+    client.post(f"{API_V1_PREFIX}/streams/{other['stream_id']}/placements", json={"drop_ids": [drops[0]['drop_id']]})
+    assert client.get(f"{stream_url}/drops?limit=10").status_code == 200
+
+    assert client.delete(stream_url).status_code == 202
+    assert client.get(f"{stream_url}/drops?limit=10").status_code == 404
+    res = client.get(f"{API_V1_PREFIX}/drops/{drops[0]['drop_id']}/placements")
+    assert [p['stream_id'] for p in res.json()['placements']] == [other['stream_id']]
+    placement_ids = [drop['placement_id'] for drop in drops]
+    res = client.post(f"{API_V1_PREFIX}/placements:batchGet", json={"ids": placement_ids})
+    assert res.json()['placements'] == []
+    assert res.json()['missing'] == placement_ids
@@ -0,0 +1,33 @@
+import time
+from types import SimpleNamespace
+
+from app import auth
+
+
+def test_verified_tokens_expire_with_the_token(monkeypatch):
+    """A cached user ID is never returned past the token's `exp`."""
+    verified = []
+
+    def verify_token(token):
+        verified.append(token)
+        return {"sub": "user_1", "exp": time.time() + float(token)}
+
+    monkeypatch.setattr(auth, "clerk", SimpleNamespace(verify_token=verify_token))
+    monkeypatch.setattr(auth, "_verified_tokens", auth.TLRUCache(
+        maxsize=10, ttu=auth._token_expiry, timer=time.time
+    ))
+
+    assert auth._verify_token("0.2") == "user_1"
+    assert auth._verify_token("0.2") == "user_1"
+    assert verified == ["0.2"]
+
+    time.sleep(0.3)
+    auth._verify_token("0.2")
+    assert verified == ["0.2", "0.2"]
+
+    # Long-lived tokens are still only cached for VERIFIED_TOKEN_SECONDS.
+    monkeypatch.setattr(auth, "VERIFIED_TOKEN_SECONDS", 0.1)
+    auth._verify_token("3600")
+    time.sleep(0.2)
+    auth._verify_token("3600")
+    assert verified.count("3600") == 2
@@ -0,0 +1,85 @@
+import time
+
+import pytest
+
+from app import deadlines
+from app.deadlines import RequestDeadlineExceeded
+from app.firestore_client import PooledChannel
+
+
+class TimeoutRecordingChannel:
+    def __init__(self, timeouts):
+        self.timeouts = timeouts
+
+    def unary_unary(self, method, *args):
+        def call(request, timeout=None, **kwargs):
+            self.timeouts.append(timeout)
+            return request
+        return call
+
+
+@pytest.fixture
+def request_deadline():
+    """Sets a request deadline `seconds` from now for the test's duration."""
+    tokens = []
+
+    def set_deadline(seconds):
+        tokens.append(deadlines._deadline.set(time.monotonic() + seconds))
+
+    yield set_deadline
+    for token in reversed(tokens):
+        deadlines._deadline.reset(token)
+
+
+def test_rpc_timeouts_are_clamped_to_the_request_deadline(request_deadline):
+    timeouts = []
+    pool = PooledChannel(1, lambda: TimeoutRecordingChannel(timeouts))
+    get = pool.unary_unary("/google.firestore.v1.Firestore/GetDocument")
+
+    get("doc", timeout=10)
+    assert timeouts == [10]
+
+    request_deadline(2)
+    get("doc", timeout=10)
+    assert 1.5 < timeouts[-1] <= 2
+
+    request_deadline(-1)
+    with pytest.raises(RequestDeadlineExceeded):
+        get("doc", timeout=10)
+    assert len(timeouts) == 2
+
+    # Rollbacks still go out so the transaction's locks are released.
+    rollback = pool.unary_unary("/google.firestore.v1.Firestore/Rollback")
+    rollback("txn", timeout=10)
+    assert timeouts[-1] == 10
+
+
+def test_slow_read_is_hedged(monkeypatch):
+    monkeypatch.setattr(deadlines, "HEDGED_READS", True)
+    monkeypatch.setattr(deadlines, "HEDGE_MIN_DELAY_SECONDS", 0.01)
+    monkeypatch.setattr(deadlines, "latencies", deadlines.LatencyTracker())
+    for _ in range(deadlines.HEDGE_MIN_SAMPLES):
+        deadlines.latencies.record("test_read", 0.01)
+    hedged_before = deadlines.hedge_counts["hedged"]
+
+    attempts = []
+
+    def read():
+        attempts.append(1)
+        if len(attempts) == 1:
+            time.sleep(1)
+            return "slow"
+        return "fast"
+
+    started = time.monotonic()
+    assert deadlines.hedged("test_read", read) == "fast"
+    assert time.monotonic() - started < 0.5
+    assert deadlines.hedge_counts["hedged"] == hedged_before + 1
+
+
+def test_reads_are_not_hedged_without_latency_history(monkeypatch):
+    monkeypatch.setattr(deadlines, "HEDGED_READS", True)
+    monkeypatch.setattr(deadlines, "latencies", deadlines.LatencyTracker())
+    attempts = []
+    assert deadlines.hedged("test_read", lambda: attempts.append(1)) is None
+    assert attempts == [1]
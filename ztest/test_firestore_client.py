@@ -0,0 +1,112 @@
+from types import SimpleNamespace
+
+import grpc
+import pytest
+from google.api_core import gapic_v1
+
+from app import firestore_client
+from app.firestore_client import PooledChannel
+
+
+class FakeRpcError(grpc.RpcError):
+    def code(self):
+        return grpc.StatusCode.UNAVAILABLE
+
+
+class FakeStreamCall:
+    def __init__(self, items):
+        self._items = iter(items)
+        self._callbacks = []
+
+    def __next__(self):
+        return next(self._items)
+
+    def add_callback(self, callback):
+        self._callbacks.append(callback)
+
+    def code(self):
+        return grpc.StatusCode.OK
+
+
+class FakeChannel:
+    """Records which RPCs were sent through it."""
+
+    def __init__(self, name, sent):
+        self.name = name
+        self.sent = sent
+
+    def unary_unary(self, method, *args):
+        def call(request, **kwargs):
+            self.sent.append((self.name, request))
+            if request == "fail":
+                raise FakeRpcError()
+            return f"{request}-ok"
+        return call
+
+    def unary_stream(self, method, *args):
+        def call(request, **kwargs):
+            self.sent.append((self.name, request))
+            return FakeStreamCall([1, 2])
+        return call
+
+
+def make_pool(size=3):
+    sent = []
+    names = iter("abcdefgh")
+    pool = PooledChannel(size, lambda: FakeChannel(next(names), sent))
+    return pool, sent
+
+
+def test_idle_pool_spreads_calls_round_robin():
+    pool, sent = make_pool()
+    get = pool.unary_unary("/google.firestore.v1.Firestore/GetDocument")
+    for i in range(6):
+        assert get(i) == f"{i}-ok"
+    assert [name for name, _ in sent] == ["a", "b", "c", "a", "b", "c"]
+
+
+def test_busy_channels_are_skipped():
+    pool, sent = make_pool()
+    query = pool.unary_stream("/google.firestore.v1.Firestore/RunQuery")
+    open_streams = [query("q1"), query("q2")]
+    get = pool.unary_unary("/google.firestore.v1.Firestore/GetDocument")
+    get("doc")
+    assert sent[-1] == ("c", "doc")
+    assert pool.metrics.snapshot()["channels"][0]["in_flight"] == 1
+
+    for stream in open_streams:
+        assert list(stream) == [1, 2]
+    assert [c["in_flight"] for c in pool.metrics.snapshot()["channels"]] == [0, 0, 0]
+
+
+def test_metrics_record_status_codes():
+    pool, _ = make_pool(size=1)
+    get = pool.unary_unary("/google.firestore.v1.Firestore/GetDocument")
+    get("doc")
+    with pytest.raises(FakeRpcError):
+        get("fail")
+    stats = pool.metrics.snapshot()["methods"]["GetDocument"]
+    assert stats["calls"] == 2
+    assert stats["codes"] == {"OK": 1, "UNAVAILABLE": 1}
+
+
+def test_streamed_reads_keep_a_long_timeout():
+    """Query and batch-get timeouts cover the whole stream, unlike gets."""
+    names = (
+        firestore_client.READ_METHODS
+        + firestore_client.STREAM_READ_METHODS
+        + firestore_client.WRITE_METHODS
+    )
+    # Distinct functions, so each method gets its own wrapped entry.
+    transport = SimpleNamespace(_wrapped_methods={}, **{
+        name: (lambda *args, name=name: name) for name in names
+    })
+    firestore_client._apply_policies(transport, gapic_v1.client_info.ClientInfo())
+
+    def timeout(name):
+        return transport._wrapped_methods[getattr(transport, name)]._timeout
+
+    assert timeout("get_document") == firestore_client.READ_TIMEOUT
+    for name in ("run_query", "batch_get_documents", "partition_query"):
+        assert timeout(name) == firestore_client.STREAM_READ_TIMEOUT == 300
+    assert timeout("commit") == firestore_client.WRITE_TIMEOUT
@@ -0,0 +1,100 @@
+import datetime
+
+from app.integrity import analyze_chain, plan_repair
+from app.ordering import keys_between
+
+
+def make_placements(*links):
+    """Builds placements p0..pN from (prev, next) pairs, added in order."""
+    start = datetime.datetime(2025, 1, 1)
+    order_keys = keys_between(None, None, len(links))
+    return {
+        f"p{i}": {
+            "placement_id": f"p{i}",
+            "stream_id": "s1",
+            "drop_id": f"d{i}",
+            "prev_placement_id": prev_id,
+            "next_placement_id": next_id,
+            "ordinal": i + 1,
+            "order_key": order_keys[i],
+            "added_at": start + datetime.timedelta(seconds=i),
+        }
+        for i, (prev_id, next_id) in enumerate(links)
+    }
+
+
+def test_intact_chain_has_no_issues():
+    placements = make_placements((None, "p1"), ("p0", "p2"), ("p1", None))
+    stream = {"first_drop_placement_id": "p0", "last_drop_placement_id": "p2", "drop_count": 3, "last_order_key": "a2"}
+    report = analyze_chain("s1", stream, placements)
+    assert report.ok
+    assert report.canonical_order == ["p0", "p1", "p2"]
+    assert plan_repair(report, stream, placements) == ({}, {})
+
+
+def test_concurrent_append_fork_is_detected_and_relinked():
+    # p1 and p2 were both appended after p0; only p1 won the next pointer.
+    placements = make_placements((None, "p1"), ("p0", None), ("p0", None))
+    stream = {"first_drop_placement_id": "p0", "last_drop_placement_id": "p2", "drop_count": 3, "last_order_key": "a2"}
+    report = analyze_chain("s1", stream, placements)
+    assert not report.ok
+    assert report.forks == {"p0": ["p1", "p2"]}
+    assert report.orphans == ["p2"]
+
+    placement_updates, stream_update = plan_repair(report, stream, placements)
+    assert placement_updates == {
+        "p1": {"next_placement_id": "p2"},
+        "p2": {"prev_placement_id": "p1"},
+    }
+    assert stream_update == {}
+
+
+def test_cycle_is_detected():
+    placements = make_placements((None, "p1"), ("p0", "p0"))
+    stream = {"first_drop_placement_id": "p0", "last_drop_placement_id": "p1", "drop_count": 2, "last_order_key": "a1"}
+    report = analyze_chain("s1", stream, placements)
+    assert report.has_cycle
+    placement_updates, _ = plan_repair(report, stream, placements)
+    assert placement_updates == {"p1": {"next_placement_id": None}}
+
+
+def test_missing_drop_count_is_backfilled():
+    placements = make_placements((None, "p1"), ("p0", None))
+    stream = {"first_drop_placement_id": "p0", "last_drop_placement_id": "p1", "last_order_key": "a1"}
+    report = analyze_chain("s1", stream, placements)
+    assert not report.ok
+    assert plan_repair(report, stream, placements) == ({}, {"drop_count": 2})
+
+
+def test_missing_ordinals_are_renumbered():
+    placements = make_placements((None, "p1"), ("p0", None))
+    for placement in placements.values():
+        del placement["ordinal"]
+    stream = {"first_drop_placement_id": "p0", "last_drop_placement_id": "p1", "drop_count": 2, "last_order_key": "a1"}
+    report = analyze_chain("s1", stream, placements)
+    assert not report.ok
+    placement_updates, _ = plan_repair(report, stream, placements)
+    assert placement_updates == {"p0": {"ordinal": 1}, "p1": {"ordinal": 2}}
+
+
+def test_order_keys_define_canonical_order():
+    # p2 was moved between p0 and p1 after being appended last.
+    placements = make_placements((None, "p2"), ("p2", None), ("p0", "p1"))
+    placements["p2"]["order_key"] = "a0V"
+    placements["p1"]["ordinal"], placements["p2"]["ordinal"] = 3, 2
+    stream = {"first_drop_placement_id": "p0", "last_drop_placement_id": "p1", "drop_count": 3, "last_order_key": "a1"}
+    report = analyze_chain("s1", stream, placements)
+    assert report.ok
+    assert report.canonical_order == ["p0", "p2", "p1"]
+
+
+def test_legacy_placements_get_order_keys():
+    placements = make_placements((None, "p1"), ("p0", None))
+    for placement in placements.values():
+        del placement["order_key"]
+    stream = {"first_drop_placement_id": "p0", "last_drop_placement_id": "p1", "drop_count": 2}
+    report = analyze_chain("s1", stream, placements)
+    assert report.rekey
+    placement_updates, stream_update = plan_repair(report, stream, placements)
+    assert placement_updates == {"p0": {"order_key": "a0"}, "p1": {"order_key": "a1"}}
+    assert stream_update == {"last_order_key": "a1"}
@@ -0,0 +1,110 @@
+import time
+
+from app import consistency, overview
+from app.invalidation import InvalidationBus, MemoryTransport
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_publish_runs_local_handlers_without_directory():
+    bus = InvalidationBus()
+    seen = []
+    bus.subscribe("pool_overview", seen.append)
+    bus.start()
+    bus.publish("pool_overview", "pool_123")
+    assert seen == ["pool_123"]
+    assert bus.stats()["mode"] == "local"
+
+
+def test_publish_reaches_sibling_workers(tmp_path):
+    publisher = InvalidationBus(str(tmp_path))
+    sibling = InvalidationBus(str(tmp_path))
+    published, received = [], []
+    publisher.subscribe("pool_overview", published.append)
+    sibling.subscribe("pool_overview", received.append)
+    publisher.start()
+    sibling.start()
+    try:
+        publisher.publish("pool_overview", "pool_123")
+        assert published == ["pool_123"]
+        assert wait_for(lambda: received == ["pool_123"])
+    finally:
+        publisher.stop()
+        sibling.stop()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_dead_worker_sockets_are_removed(tmp_path):
+    publisher = InvalidationBus(str(tmp_path))
+    publisher.start()
+    stale = tmp_path / "12345-deadbeef.sock"
+    stale.touch()
+    try:
+        publisher.publish("pool_overview", "pool_123")
+        assert not stale.exists()
+        assert publisher.stats()["dead_peers"] == 1
+    finally:
+        publisher.stop()
+
+
+def test_transport_reaches_other_instances_only():
+    hub = []
+    publisher = InvalidationBus(transport=MemoryTransport("instance-a", hub))
+    same_instance = InvalidationBus(
+        transport=MemoryTransport("instance-a", hub)
+    )
+    other_instance = InvalidationBus(
+        transport=MemoryTransport("instance-b", hub)
+    )
+    seen = {"same": [], "other": []}
+    same_instance.subscribe("drop", seen["same"].append)
+    other_instance.subscribe("drop", seen["other"].append)
+    for bus in (publisher, same_instance, other_instance):
+        bus.start()
+    try:
+        publisher.publish("drop", "drop_123")
+        # Workers of the publishing instance are reached over the sockets.
+        assert seen == {"same": [], "other": ["drop_123"]}
+        assert other_instance.stats()["remote_received"] == 1
+    finally:
+        for bus in (publisher, same_instance, other_instance):
+            bus.stop()
+    assert hub == []
+
+
+def test_versioned_invalidations_keep_newer_overviews():
+    overview.overview_cache.set(
+        "pool_123", {"versions": {"pool_123": 10, "stream_456": 4}}
+    )
+    with overview._stream_pools_lock:
+        overview._stream_pools["stream_456"] = "pool_123"
+
+    overview._drop_stream("stream_456:4")
+    assert overview.overview_cache.get("pool_123") is not None
+    overview._drop_stream("stream_456:5")
+    assert overview.overview_cache.get("pool_123") is None
+
+    # An overview built before the event arrived is not served after it.
+    overview.overview_cache.set(
+        "pool_123", {"versions": {"pool_123": 10, "stream_456": 4}}
+    )
+    assert overview.overview_cache.get("pool_123", overview._is_current) is None
+
+
+def test_consistency_tokens():
+    assert consistency.parse_token("pool_1:17, stream_2:3,bad,x:") == {
+        "pool_1": 17, "stream_2": 3
+    }
+    assert consistency.parse_event_key("stream_2:3") == ("stream_2", 3)
+    assert consistency.parse_event_key("stream_2") == ("stream_2", None)
+    token = consistency._required.set({"stream_2": 3})
+    try:
+        assert consistency.satisfies({"stream_2": 3, "stream_9": 1})
+        assert not consistency.satisfies({"stream_2": 2})
+    finally:
+        consistency._required.reset(token)
@@ -0,0 +1,39 @@
+import random
+
+import pytest
+
+from app.ordering import key_between, keys_between
+
+
+def test_appended_keys_stay_short():
+    keys = keys_between(None, None, 5000)
+    assert keys == sorted(keys)
+    assert len(set(keys)) == len(keys)
+    assert max(len(key) for key in keys) <= 4
+
+
+def test_random_inserts_keep_order():
+    rng = random.Random(7)
+    keys = []
+    for _ in range(2000):
+        i = rng.randint(0, len(keys))
+        before = keys[i - 1] if i > 0 else None
+        after = keys[i] if i < len(keys) else None
+        key = key_between(before, after)
+        assert before is None or before < key
+        assert after is None or key < after
+        keys.insert(i, key)
+    assert keys == sorted(keys)
+
+
+def test_keys_between_neighbours():
+    keys = keys_between("a0", "a1", 100)
+    assert keys == sorted(keys)
+    assert "a0" < keys[0] and keys[-1] < "a1"
+
+
+def test_invalid_bounds_are_rejected():
+    with pytest.raises(ValueError):
+        key_between("a1", "a0")
+    with pytest.raises(ValueError):
+        key_between("a10", None)
@@ -0,0 +1,67 @@
+import threading
+import time
+import uuid
+
+from app import profiler as profiler_module
+from app.profiler import SamplingProfiler
+
+
+def spin(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        sum(range(100))
+
+
+def test_samples_other_threads_into_speedscope_profile():
+    worker = threading.Thread(target=spin, args=(0.2,), name="spinner")
+    profiler = SamplingProfiler("test", interval=0.002)
+    profiler.start()
+    worker.start()
+    worker.join()
+    profiler.stop()
+
+    profile = profiler.to_speedscope()
+    frames = profile["shared"]["frames"]
+    spinner = next(p for p in profile["profiles"] if p["name"] == "spinner")
+    assert spinner["type"] == "sampled"
+    assert len(spinner["samples"]) == len(spinner["weights"]) > 0
+    assert any(
+        frames[stack[-1]]["name"] == "spin" for stack in spinner["samples"]
+    )
+    assert "sampling-profiler" not in [p["name"] for p in profile["profiles"]]
+
+
+def test_collapsed_stacks_start_with_the_thread_name():
+    worker = threading.Thread(target=spin, args=(0.1,), name="spinner")
+    profiler = SamplingProfiler("test", interval=0.002)
+    profiler.start()
+    worker.start()
+    worker.join()
+    profiler.stop()
+
+    lines = profiler.to_collapsed().splitlines()
+    assert any(
+        line.startswith("spinner;") and line.rsplit(" ", 1)[0].endswith(";spin")
+        for line in lines
+    )
+
+
+def test_saved_profiles_are_found_by_other_workers(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiler_module, "PROFILE_DIR", str(tmp_path))
+    worker = threading.Thread(target=spin, args=(0.05,), name="spinner")
+    profiler = SamplingProfiler("GET /pools", interval=0.002)
+    profiler.start()
+    worker.start()
+    worker.join()
+    profiler.stop()
+
+    profile_id = uuid.uuid4().hex
+    profiler_module.keep(profile_id, profiler)
+    # Another worker has nothing in memory.
+    profiler_module.recent_profiles.clear()
+
+    loaded = profiler_module.get_profile(profile_id)
+    assert loaded.to_collapsed() == profiler.to_collapsed()
+    assert loaded.to_speedscope() == profiler.to_speedscope()
+    assert profiler_module.get_profile(uuid.uuid4().hex) is None
+    assert profiler_module.get_profile("../" + profile_id) is None
@@ -0,0 +1,43 @@
+import asyncio
+import datetime
+import json
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+
+from app.models import GetDropsResponse
+from app.responses import json_response
+
+
+def page():
+    return GetDropsResponse(
+        drops=[{
+            "drop_id": f"drop_{i}",
+            "creator_id": "user_1",
+            "created_at": datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc),
+            "content": {"title": "Café", "text": "Some text", "images": ["https://example.com/a.jpg"]},
+            "placement_id": f"placement_{i}",
+            "ordinal": i + 1,
+        } for i in range(3)],
+        has_more=False,
+        total_count=3,
+    )
+
+
+def test_json_response_matches_fastapi_encoding():
+    field = create_model_field(name="response", type_=GetDropsResponse, mode="serialization")
+    content = asyncio.run(serialize_response(field=field, response_content=page()))
+    expected = json.loads(JSONResponse(content).body)
+
+    response = json_response(page())
+    assert response.media_type == "application/json"
+    assert json.loads(response.body) == expected
+
+
+def test_json_response_includes_selected_fields():
+    response = json_response(page(), {"total_count": True, "drops": {"__all__": {"drop_id": True}}})
+    assert json.loads(response.body) == {
+        "total_count": 3,
+        "drops": [{"drop_id": "drop_0"}, {"drop_id": "drop_1"}, {"drop_id": "drop_2"}],
+    }
@@ -0,0 +1,32 @@
+from app import search
+from app.search import SearchIndex
+
+
+def found(index, query):
+    return {doc["id"] for doc, _ in index.search(query)}
+
+
+def test_followers_load_the_builders_snapshot(tmp_path, monkeypatch):
+    monkeypatch.setattr(search, "SNAPSHOT_PATH", str(tmp_path / "search.json.gz"))
+    builder, follower = SearchIndex(), SearchIndex()
+    assert builder._try_become_builder()
+    assert not follower._try_become_builder()
+
+    builder.add_pool({"pool_id": "p1", "content": {"title": "Quantum basics"}})
+    # Created through the follower's worker; the builder hasn't caught up.
+    follower.add_pool({"pool_id": "p2", "content": {"title": "Quantum fields"}})
+    builder.save(search.SNAPSHOT_PATH)
+    follower._follow()
+    assert found(follower, "quantum") == {"p1", "p2"}
+
+    builder.add_pool({"pool_id": "p2", "content": {"title": "Quantum fields"}})
+    builder.remove("pool", "p1")
+    builder.save(search.SNAPSHOT_PATH)
+    follower._follow()
+    assert found(follower, "quantum") == {"p2"}
+    assert follower._unsaved == {}
+
+    builder.stop()
+    assert follower._try_become_builder()
+    assert follower.stats()["role"] == "builder"
+    follower.stop()
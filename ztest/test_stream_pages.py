@@ -0,0 +1,37 @@
+from app.stream_pages import window_from_page
+
+
+def entries(first, last):
+    return [
+        {"placement_id": f"p{i}", "ordinal": i} for i in range(first, last + 1)
+    ]
+
+
+def ordinals(window):
+    drops, has_more_before, has_more_after = window
+    return [d["ordinal"] for d in drops], has_more_before, has_more_after
+
+
+def test_window_is_cut_from_the_snapshot():
+    page = {"drop_count": 100, "head": entries(1, 10), "tail": entries(91, 100)}
+    assert ordinals(window_from_page(page, "p1", 2, 3)) == (
+        [1, 2, 3, 4], False, True
+    )
+    assert ordinals(window_from_page(page, "p5", 2, 3)) == (
+        [3, 4, 5, 6, 7, 8], True, True
+    )
+    assert ordinals(window_from_page(page, "p99", 2, 3)) == (
+        [97, 98, 99, 100], True, False
+    )
+
+
+def test_window_reaching_past_the_snapshot_is_not_cut():
+    page = {"drop_count": 100, "head": entries(1, 10), "tail": entries(91, 100)}
+    assert window_from_page(page, "p9", 2, 3) is None
+    assert window_from_page(page, "p92", 2, 3) is None
+    assert window_from_page(page, "p50", 2, 3) is None
+
+    whole = {"drop_count": 6, "head": entries(1, 6), "tail": entries(1, 6)}
+    assert ordinals(window_from_page(whole, "p5", 2, 3)) == (
+        [3, 4, 5, 6], True, False
+    )
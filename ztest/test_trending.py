@@ -0,0 +1,31 @@
+import datetime
+
+from app.trending import CountMinSketch, HeavyHitters, read_weight
+
+
+def test_count_min_sketch_never_undercounts():
+    sketch = CountMinSketch(width=64, depth=3)
+    counts = {f"stream_{i}": i % 7 + 1 for i in range(500)}
+    for key, count in counts.items():
+        sketch.add(key, count)
+    assert all(sketch.estimate(key) >= count for key, count in counts.items())
+    assert sketch.estimate("stream_1") < sum(counts.values())
+
+
+def test_heavy_hitters_keep_the_most_read_keys():
+    hitters = HeavyHitters(capacity=5)
+    for i in range(2000):
+        hitters.offer(f"cold_{i}")
+        if i % 4 == 0:
+            hitters.offer("hot_a")
+        if i % 10 == 0:
+            hitters.offer("hot_b", 2)
+    assert len(hitters) == 5
+    assert [key for key, _ in hitters.top(2)] == ["hot_a", "hot_b"]
+    assert hitters.total == 2000 + 500 + 400
+
+
+def test_later_reads_weigh_more():
+    day = datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc)
+    assert read_weight(day) == 1
+    assert read_weight(day + datetime.timedelta(hours=6)) == 2